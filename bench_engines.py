@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Engine Benchmark
+Runs scripts on each execution engine and reports the best wall-clock time.
+Each script is parsed once and compiled for each engine once, outside the
+timer, the way warpy.compile() prepares a program, so only the runs are
+measured. Besides the given scripts, LOOP_SCRIPT is run by default: the test
+scripts are short enough that setup would dominate, while a loop-heavy
+script is where the engines differ.
+"""
+
+import argparse
+import time
+
+from warpy_core import (DEFAULT_OPT_LEVEL, ENGINES, OPT_LEVELS, Frame, bind_commands, optimize_program,
+                        parse_program, prepare_engine)
+from warpy_output import CaptureSink, NullSink, redirect_output
+
+# Name under which the built-in loop-heavy workload is listed
+LOOP_SCRIPT_NAME = '<loops>'
+LOOP_SCRIPT = """total: dg = 0
+i: dg = 0
+j: dg = 0
+x: dg = 0
+for i in 1..200:
+    for j in 1..100:
+        x = i * 3 + j
+        total = total + x % 7
+    if total % 2 == 0:
+        total = total + 1
+n: dg = 0
+while n < 5000:
+    n = n + 1
+    total = total + n % 3
+burn_the_heretic(total)
+"""
+DEFAULT_SCRIPTS = ['tests/test_fibonacci.wp40k', 'tests/test_nested_loops.wp40k', LOOP_SCRIPT_NAME]
+
+
+def time_engine(statements, engine, repeat, null_output=False):
+    """Best time over repeat runs and the captured output (None when it was discarded).
+
+    statements must be resolved and bound; compiling them for the engine is not timed.
+    """
+    run = prepare_engine(statements, engine)
+    best = float('inf')
+    output = None
+    for _ in range(repeat):
+        sink = NullSink() if null_output else CaptureSink()
+        frame = Frame(statements.names, {})
+        start = time.perf_counter()
+        with redirect_output(sink):
+            run(frame)
+        best = min(best, time.perf_counter() - start)
+        if not null_output:
+            output = sink.getvalue()
+    return best, output
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmark the WarPy40K execution engines.")
+    arg_parser.add_argument('scripts', nargs='*', default=DEFAULT_SCRIPTS, help="scripts to run")
+    arg_parser.add_argument('--engines', default=','.join(ENGINES),
+                            help="comma-separated engines to compare (default: all)")
+    arg_parser.add_argument('--repeat', type=int, default=5, help="runs per engine; the best time is kept")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=OPT_LEVELS, default=DEFAULT_OPT_LEVEL,
+                            help="optimization level applied before running (default: 1)")
+    arg_parser.add_argument('--null-output', action='store_true',
+                            help="discard script output instead of capturing it, so only the engine is timed")
+    args = arg_parser.parse_args(argv)
+    engines = args.engines.split(',')
+
+    for script in args.scripts:
+        if script == LOOP_SCRIPT_NAME:
+            source = LOOP_SCRIPT
+        else:
+            with open(script, 'r') as f:
+                source = f.read()
+        statements = optimize_program(parse_program(source), args.opt_level)
+        bind_commands(statements, script)
+        print(f"=== {script}")
+        baseline = None
+        reference_output = None
+        for engine in engines:
+            elapsed, output = time_engine(statements, engine, args.repeat, args.null_output)
+            if baseline is None:
+                baseline, reference_output = elapsed, output
+            speedup = baseline / elapsed if elapsed else float('inf')
+            if output is None:
+                same = "output discarded"
+            else:
+                same = "same output" if output == reference_output else "OUTPUT DIFFERS"
+            print(f"  {engine:<10} {elapsed * 1000:10.3f} ms  {speedup:6.2f}x  {same}")
+
+
+if __name__ == '__main__':
+    main()
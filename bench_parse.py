@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Parse Benchmark
+Parses a large script with the single-pass LALR parser, which builds the AST
+as it parses, and with the parse tree built first and transformed afterwards,
+and reports the best time and the peak memory traced while parsing.
+The script is the given scripts concatenated and repeated --copies times.
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from warpy_core import parse_program
+
+DEFAULT_SCRIPTS = ['tests/test_fibonacci.wp40k', 'tests/test_conditionals.wp40k', 'tests/test_parallel.wp40k']
+
+
+def measure(source, single_pass, repeat):
+    """Best parse time in seconds and the peak of memory allocated during one parse, in bytes."""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        parse_program(source, single_pass=single_pass)
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        parse_program(source, single_pass=single_pass)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Compare single-pass and tree-then-transform parsing of a large script.")
+    arg_parser.add_argument('scripts', nargs='*', default=DEFAULT_SCRIPTS, help="scripts to concatenate")
+    arg_parser.add_argument('--copies', type=int, default=200, help="times the scripts are repeated (default: 200)")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="parses per mode; the best time is kept")
+    args = arg_parser.parse_args(argv)
+
+    parts = []
+    for path in args.scripts:
+        with open(path, 'r') as f:
+            code = f.read()
+        parts.append(code if code.endswith('\n') else code + '\n')
+    source = ''.join(parts) * args.copies
+    print(f"{source.count(chr(10))} lines, {len(source) // 1024} KB")
+
+    # Build both parsers before timing
+    parse_program(parts[0], single_pass=True)
+    parse_program(parts[0], single_pass=False)
+    results = {}
+    print(f"{'mode':<14} {'ms':>9} {'peak MB':>9}")
+    for name, single_pass in (('tree', False), ('single-pass', True)):
+        seconds, peak = results[name] = measure(source, single_pass, args.repeat)
+        print(f"{name:<14} {seconds * 1e3:9.1f} {peak / 2 ** 20:9.1f}")
+    (tree_s, tree_peak), (single_s, single_peak) = results['tree'], results['single-pass']
+    print(f"\nsingle-pass: {tree_s / single_s:.1f}x faster, {tree_peak / single_peak:.1f}x less peak memory")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Startup Benchmark
+Times the CLI end to end on a trivial script, in a fresh Python process per
+run, the way a shell or a build runs it: `python warpy_interpreter.py` with
+the compiled program in the cache, the same through `python -m`, parsing with
+the generated standalone parser (--no-cache) and parsing with the grammar
+built by lark, as when warpy_standalone_parser.py has not been generated.
+
+The target is the median cached run of the documented entry point,
+`python warpy_interpreter.py`, under TARGET_MS. Much of what is left is the
+Python interpreter's own startup, so run the benchmark with the real
+interpreter binary rather than a shim such as pyenv's.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from warpy_cache import CACHE_DIR_ENV
+
+TARGET_MS = 50.0
+TRIVIAL_SCRIPT = 'x: dg = 1\nburn_the_heretic(x)\n'
+# Runs the interpreter with the generated parser hidden, so get_parser falls back to lark
+DYNAMIC_RUNNER = ("import runpy, sys; sys.modules['warpy_standalone_parser'] = None; "
+                  "runpy.run_path('warpy_interpreter.py', run_name='__main__')")
+
+
+def time_runs(command, runs, env, cwd):
+    """Wall-clock milliseconds of each run of command."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1e3)
+    return times
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmark WarPy40K CLI startup on a trivial script.")
+    arg_parser.add_argument('--runs', type=int, default=20, help="runs per mode (default: 20)")
+    arg_parser.add_argument('--python', default=sys.executable, help="interpreter to run the CLI with")
+    args = arg_parser.parse_args(argv)
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        script = os.path.join(tmp, 'trivial.wp40k')
+        with open(script, 'w') as f:
+            f.write(TRIVIAL_SCRIPT)
+        env = dict(os.environ, **{CACHE_DIR_ENV: os.path.join(tmp, 'cache')})
+        modes = [
+            ('cached', [args.python, 'warpy_interpreter.py', script]),
+            ('cached, -m', [args.python, '-m', 'warpy_interpreter', script]),
+            ('standalone parser', [args.python, 'warpy_interpreter.py', '--no-cache', script]),
+            ('lark grammar', [args.python, '-c', DYNAMIC_RUNNER, '--no-cache', script]),
+        ]
+        # Fill the cache and write the modules' bytecode before anything is timed
+        subprocess.run(modes[0][1], env=env, cwd=root, check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([args.python, '-m', 'compileall', '-q', root], cwd=root, check=True)
+        print(f"{'mode':<18} {'min ms':>8} {'median ms':>10}")
+        results = {}
+        for name, command in modes:
+            times = time_runs(command, args.runs, env, root)
+            results[name] = statistics.median(times)
+            print(f"{name:<18} {min(times):8.1f} {statistics.median(times):10.1f}")
+
+    median = results['cached']
+    verdict = 'met' if median < TARGET_MS else 'missed'
+    print(f"\ntarget: trivial script under {TARGET_MS:g} ms ({verdict}, median {median:.1f} ms)")
+    return 0 if median < TARGET_MS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Parser Builder
+Generates warpy_standalone_parser.py: the LALR parser for the indented
+grammar as a module that needs neither lark nor the grammar analysis at
+import time. It is lark's standalone parser (the lark runtime plus the
+parse tables, serialized) with the WarPy40K indenter and a GRAMMAR_KEY
+appended; get_parser() only uses it while the key matches the grammar in
+warpy_core, and builds the parser with lark otherwise.
+
+Run it again after changing the grammar; lark is needed here, not at run time.
+"""
+
+import argparse
+import io
+import sys
+
+from warpy_core import LALR_OPTIONS, lalr_grammar_key, warpy_indented_grammar
+
+DEFAULT_OUTPUT = 'warpy_standalone_parser.py'
+
+FOOTER = '''
+
+# --- WarPy40K ---
+GRAMMAR_KEY = {key!r}
+
+
+class WarPyIndenter(Indenter):
+{indenter}
+
+
+def build_parser(**options):
+    return Lark_StandAlone(postlex=WarPyIndenter(), **options)
+'''
+
+INDENTER_ATTRIBUTES = ('NL_type', 'OPEN_PAREN_types', 'CLOSE_PAREN_types', 'INDENT_type', 'DEDENT_type', 'tab_len')
+
+
+def generate() -> str:
+    """Source of the standalone parser module for the current grammar."""
+    from lark import Lark
+    from lark.tools.standalone import gen_standalone
+    from warpy_grammar import WarPyIndenter
+
+    # The indenter shapes the tables (its tokens are kept as terminals) but is code, not data:
+    # the module appends its own copy and passes it in when it loads the tables
+    parser = Lark(warpy_indented_grammar, postlex=WarPyIndenter(), **LALR_OPTIONS)
+    parser.options.postlex = None
+    out = io.StringIO()
+    out.write('# Generated by build_parser.py from warpy_core.warpy_indented_grammar; do not edit.\n')
+    gen_standalone(parser, out=out)
+    indenter = '\n'.join(f"    {name} = {getattr(WarPyIndenter, name)!r}" for name in INDENTER_ATTRIBUTES)
+    out.write(FOOTER.format(key=lalr_grammar_key(), indenter=indenter))
+    return out.getvalue()
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Generate the standalone WarPy40K LALR parser module.")
+    arg_parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help=f"module to write (default: {DEFAULT_OUTPUT})")
+    args = arg_parser.parse_args(argv)
+    source = generate()
+    with open(args.output, 'w') as f:
+        f.write(source)
+    print(f"Wrote {args.output} ({len(source) // 1024} KB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,30 +1,260 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Batch Test Runner
+Runs every .wp40k script in a directory on a pool of worker processes and
+compares each transcript with the golden .out file next to the script.
+
+Each worker imports the interpreter and builds the parser once, then runs
+script after script in-process through warpy.compile(), so a file costs its
+own parse and run, not a Python startup, a lark import and a grammar build.
+Scripts run across all cores; a script that runs past --timeout is stopped
+with SIGALRM inside its worker (where the platform has it) and reported.
+Every script runs on every engine at every -O level against the same golden,
+unless --engine or -O (both repeatable) pick some.
+
+The transcript is what the script printed, plus a final "[ERROR] Type:
+message" line if it raised, ending in "(at line:column)" when the engine
+located the failing node. hear_the_emperors_voice reads the lines of the
+script's .in file, when there is one, and otherwise sees end of input; no
+terminal is needed. A script with a .lint file next to it is also linted,
+once, and its issues ("line:column SEVERITY CODE: message", one per line)
+are compared with that file. --update writes the current transcripts as
+the goldens.
+"""
+
+import argparse
+import difflib
 import os
-import subprocess
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, NamedTuple, Optional
+
+from warpy_core import DEFAULT_OPT_LEVEL, ENGINES, OPT_LEVELS
+
+DEFAULT_TEST_DIR = 'tests'
+DEFAULT_TIMEOUT = 30.0
+GOLDEN_SUFFIX = '.out'
+INPUT_SUFFIX = '.in'
+LINT_SUFFIX = '.lint'
+# The engine an Outcome of the linter is reported under
+LINT = 'lint'
+
+
+class ScriptTimeout(Exception):
+    pass
+
+
+class Outcome(NamedTuple):
+    path: str
+    engine: str
+    opt_level: Optional[int]
+    transcript: str
+    compile_seconds: float
+    run_seconds: float
+    timed_out: bool
+
 
-test_dir = 'tests'
-interpreter = 'warpy_interpreter.py'
+def _alarm(signum, frame):
+    raise ScriptTimeout()
 
-# Find all .wp40k files in the tests directory
-wp40k_files = [f for f in os.listdir(test_dir) if f.endswith('.wp40k')]
 
-if not wp40k_files:
-    print('No .wp40k test files found in tests/')
-    exit(1)
+def _init_worker(parser_kind: str) -> None:
+    from warpy_core import get_parser
+    get_parser(parser_kind)
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _alarm)
 
-print(f'Found {len(wp40k_files)} test files.')
 
-for test_file in sorted(wp40k_files):
-    test_path = os.path.join(test_dir, test_file)
-    print(f'\n=== Running {test_file} ===')
+def _error_line(exc: BaseException) -> str:
+    message = str(exc).strip().splitlines()
+    line = getattr(exc, 'warpy_line', None)
+    where = '' if line is None else f" (at {line}:{getattr(exc, 'warpy_column', None)})"
+    return f"[ERROR] {type(exc).__name__}: {message[0] if message else ''}{where}\n"
+
+
+def _stream(path: str, engine: str, opt_level: int, parser_kind: str, sink) -> None:
+    from warpy_input import FileInput, LineInput, redirect_input
+    from warpy_output import redirect_output
+    from warpy_stream import stream_script
+
+    inputs = input_path(path)
+    source = FileInput(inputs) if os.path.exists(inputs) else LineInput(())
+    with redirect_input(source), redirect_output(sink):
+        stream_script(path, engine, parser_kind, opt_level)
+
+
+def run_script(path: str, engine: str, opt_level: int, parser_kind: str, timeout: Optional[float],
+               stream: bool = False) -> Outcome:
+    """Compile and run one script in this process and return its transcript and timings.
+
+    With stream it runs through warpy_stream, which parses as it runs, so all
+    of its time counts as run time.
+    """
+    import warpy
+    from warpy_input import FileInput
+    from warpy_output import CaptureSink
+
+    sink = CaptureSink()
+    error = ''
+    timed_out = False
+    program = None
+    compile_seconds = 0.0
+    if timeout and hasattr(signal, 'SIGALRM'):
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.perf_counter()
     try:
-        result = subprocess.run(['python3', interpreter, test_path], capture_output=True, text=True, timeout=30)
-        print(result.stdout)
-        if result.stderr:
-            print('--- STDERR ---')
-            print(result.stderr)
-        if result.returncode == 0:
-            print(f'[PASS] {test_file}')
+        if stream:
+            _stream(path, engine, opt_level, parser_kind, sink)
+        else:
+            with open(path, 'r') as f:
+                program = warpy.compile(f.read(), engine, opt_level, parser_kind, name=path)
+            compile_seconds = time.perf_counter() - start
+            inputs = input_path(path)
+            program.run(FileInput(inputs) if os.path.exists(inputs) else None, output=sink)
+    except ScriptTimeout:
+        timed_out = True
+    except Exception as exc:
+        error = _error_line(exc)
+    finally:
+        if timeout and hasattr(signal, 'SIGALRM'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    elapsed = time.perf_counter() - start
+    if program is None and not stream:
+        compile_seconds = elapsed
+    run_seconds = elapsed - compile_seconds
+    return Outcome(path, engine, opt_level, sink.getvalue() + error, compile_seconds, run_seconds, timed_out)
+
+
+def lint_script(path: str) -> Outcome:
+    """Lint one script in this process and return its issues as a transcript."""
+    from warpy_linter import WarPy40KLinter
+
+    start = time.perf_counter()
+    issues = WarPy40KLinter().lint_file(path)
+    transcript = ''.join(f"{issue.line}:{issue.column} {issue.severity.value} {issue.code}: {issue.message}\n"
+                         for issue in issues)
+    return Outcome(path, LINT, None, transcript, 0.0, time.perf_counter() - start, False)
+
+
+def golden_path(script_path: str, engine: str = None) -> str:
+    suffix = LINT_SUFFIX if engine == LINT else GOLDEN_SUFFIX
+    return os.path.splitext(script_path)[0] + suffix
+
+
+def input_path(script_path: str) -> str:
+    return os.path.splitext(script_path)[0] + INPUT_SUFFIX
+
+
+def find_scripts(paths: List[str]) -> List[str]:
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            scripts.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.wp40k'))
         else:
-            print(f'[FAIL] {test_file} (exit code {result.returncode})')
-    except Exception as e:
-        print(f'[ERROR] {test_file}: {e}') 
\ No newline at end of file
+            scripts.append(path)
+    return scripts
+
+
+def check(outcome: Outcome, update: bool) -> str:
+    """PASS/FAIL against the golden, NEW when there is none, TIMEOUT; --update rewrites the golden."""
+    if outcome.timed_out:
+        return 'TIMEOUT'
+    golden = golden_path(outcome.path, outcome.engine)
+    if update:
+        with open(golden, 'w') as f:
+            f.write(outcome.transcript)
+        return 'UPDATED'
+    if not os.path.exists(golden):
+        return 'NEW'
+    with open(golden, 'r') as f:
+        expected = f.read()
+    return 'PASS' if outcome.transcript == expected else 'FAIL'
+
+
+def describe(outcome: Outcome) -> str:
+    """The engine and -O level an outcome ran on, or 'lint'."""
+    return LINT if outcome.engine == LINT else f"{outcome.engine} -O{outcome.opt_level}"
+
+
+def print_diff(outcome: Outcome) -> None:
+    golden = golden_path(outcome.path, outcome.engine)
+    with open(golden, 'r') as f:
+        expected = f.read().splitlines(True)
+    diff = difflib.unified_diff(expected, outcome.transcript.splitlines(True),
+                                golden, f"{outcome.path} ({describe(outcome)})")
+    sys.stdout.writelines(diff)
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Run WarPy40K scripts in parallel and compare them with their golden .out files.")
+    arg_parser.add_argument('paths', nargs='*', default=[DEFAULT_TEST_DIR],
+                            help=f"scripts or directories of scripts (default: {DEFAULT_TEST_DIR}/)")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                            help="worker processes (default: one per core)")
+    arg_parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                            help=f"seconds a script may run before it is stopped (default: {DEFAULT_TIMEOUT:g}, 0 for none)")
+    arg_parser.add_argument('--engine', dest='engines', action='append', choices=ENGINES,
+                            help="engine to run on; repeat for several (default: all; tree with --update)")
+    arg_parser.add_argument('-O', dest='opt_levels', type=int, action='append', choices=OPT_LEVELS,
+                            help=f"optimization level; repeat for several (default: all; {DEFAULT_OPT_LEVEL} with --update)")
+    arg_parser.add_argument('--earley', dest='parser_kind', action='store_const', const='earley', default='lalr',
+                            help="use the legacy Earley parser")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="run each script a statement at a time as it is read (warpy_stream)")
+    arg_parser.add_argument('--update', action='store_true',
+                            help="write each script's transcript as its golden .out file instead of comparing")
+    arg_parser.add_argument('-v', '--verbose', action='store_true', help="print every transcript")
+    args = arg_parser.parse_args(argv)
+    if args.update:
+        engines = args.engines or ['tree']
+        opt_levels = args.opt_levels or [DEFAULT_OPT_LEVEL]
+        if len(engines) * len(opt_levels) > 1:
+            arg_parser.error("--update takes a single --engine and -O level")
+    else:
+        engines = args.engines or list(ENGINES)
+        opt_levels = args.opt_levels or list(OPT_LEVELS)
+    runs = [(engine, opt_level) for opt_level in opt_levels for engine in engines]
+
+    scripts = find_scripts(args.paths)
+    if not scripts:
+        print(f"No .wp40k files found in {', '.join(args.paths)}")
+        return 1
+    print(f"Running {len(scripts)} scripts x {len(engines)} engine(s) x {len(opt_levels)} -O level(s) "
+          f"on {args.jobs} worker(s).")
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker, initargs=(args.parser_kind,)) as pool:
+        futures = [pool.submit(run_script, path, engine, opt_level, args.parser_kind, args.timeout, args.stream)
+                   for path in scripts for engine, opt_level in runs]
+        futures += [pool.submit(lint_script, path)
+                    for path in scripts if os.path.exists(golden_path(path, LINT))]
+        for future in as_completed(futures):
+            outcome = future.result()
+            status = check(outcome, args.update)
+            results.append((outcome, status))
+            label = outcome.path if len(runs) == 1 and outcome.engine != LINT else f"{outcome.path} ({describe(outcome)})"
+            print(f"[{status}] {label}")
+            if args.verbose:
+                print(outcome.transcript, end='')
+            if status == 'FAIL':
+                print_diff(outcome)
+    wall = time.perf_counter() - start
+
+    print(f"\n{'compile ms':>10} {'run ms':>10}  status   script")
+    for outcome, status in sorted(results, key=lambda r: r[0].compile_seconds + r[0].run_seconds, reverse=True):
+        engine = '' if len(runs) == 1 and outcome.engine != LINT else f" ({describe(outcome)})"
+        print(f"{outcome.compile_seconds * 1e3:10.1f} {outcome.run_seconds * 1e3:10.1f}  {status:<8} {outcome.path}{engine}")
+    busy = sum(o.compile_seconds + o.run_seconds for o, _ in results)
+    counts = {}
+    for _, status in results:
+        counts[status] = counts.get(status, 0) + 1
+    print(f"\n{', '.join(f'{n} {s}' for s, n in sorted(counts.items()))} in {wall:.2f}s "
+          f"({busy:.2f}s of script time across {args.jobs} worker(s))")
+    return 1 if counts.get('FAIL') or counts.get('TIMEOUT') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Embedding API
+Compile a script once and run it as often as needed from Python:
+
+    import warpy
+    program = warpy.compile(source)
+    result = program.run(inputs=["Guilliman"], initial_context={"x": 3})
+    result.output, result.variables
+
+compile() parses, optimizes, resolves slots and binds command handlers, and
+keeps the result in a bounded in-memory LRU keyed by a hash of the source and
+the compile options, so compiling the same text again is a dictionary lookup.
+A CompiledProgram is never changed after compile(): every run gets its own
+frame, output sink and input source, so one program can run on several
+threads at once.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from warpy_budget import Budget, metered
+from warpy_cache import source_key
+from warpy_input import InputSource, input_source, redirect_input
+from warpy_core import (AST_VERSION, DEFAULT_OPT_LEVEL, ENGINES, OPT_LEVELS, TEMP_PREFIX, Frame,
+                               bind_commands, optimize_program, parse_program, prepare_engine)
+from warpy_output import CaptureSink, OutputSink, StreamSink, redirect_output
+
+__all__ = ['compile', 'run', 'CompiledProgram', 'RunResult', 'clear_cache', 'set_cache_size']
+
+DEFAULT_CACHE_SIZE = 128
+
+
+class RunResult:
+    """What one run left behind: the final variables and, unless output went elsewhere, what it printed."""
+    __slots__ = ('variables', 'lines')
+
+    def __init__(self, variables: Dict[str, Any], lines: Optional[List[str]]):
+        self.variables = variables
+        self.lines = lines
+
+    @property
+    def output(self) -> Optional[str]:
+        """The captured output as print() would have written it, or None if it went to a given sink."""
+        return None if self.lines is None else ''.join(line + '\n' for line in self.lines)
+
+    def __repr__(self):
+        return f"RunResult(variables={self.variables!r}, output={self.output!r})"
+
+
+class CompiledProgram:
+    """A script ready to run on one engine. Get one from compile()."""
+    __slots__ = ('_name', '_engine', '_opt_level', '_source_hash', '_names', '_run')
+
+    def __init__(self, statements, name, engine, opt_level, source_hash):
+        bind_commands(statements, name)
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_engine', engine)
+        object.__setattr__(self, '_opt_level', opt_level)
+        object.__setattr__(self, '_source_hash', source_hash)
+        object.__setattr__(self, '_names', statements.names)
+        object.__setattr__(self, '_run', prepare_engine(statements, engine, name))
+
+    def __setattr__(self, attr, value):
+        raise AttributeError("CompiledProgram is immutable")
+
+    def __delattr__(self, attr):
+        raise AttributeError("CompiledProgram is immutable")
+
+    name = property(lambda self: self._name)
+    engine = property(lambda self: self._engine)
+    opt_level = property(lambda self: self._opt_level)
+    source_hash = property(lambda self: self._source_hash)
+    # Every variable the program can read or assign
+    variable_names = property(lambda self: tuple(n for n in self._names if not n.startswith(TEMP_PREFIX)))
+
+    def run(self, inputs: Union[None, str, Iterable[str], InputSource] = None,
+            output: Union[None, OutputSink, Any] = None,
+            initial_context: Optional[Dict[str, Any]] = None, budget: Optional[Budget] = None) -> RunResult:
+        """Run the program once and return its variables and output.
+
+        inputs feeds hear_the_emperors_voice: a string (one line per input), an
+        iterable of lines or an InputSource from warpy_input, e.g. a QueueInput
+        fed from an event loop. Reading past the end behaves like
+        end of input on a terminal. output is an OutputSink or a text stream;
+        when omitted the output is captured into the result. initial_context
+        gives variables their values before the first statement runs.
+        budget, a warpy_budget.Budget, caps the run's loop steps, time and
+        memory; going over raises a warpy_budget.BudgetExceeded.
+        Script errors propagate as from execute_program, with the variables
+        and output of the failed run lost unless output was given.
+        """
+        source = input_source(inputs)
+        if output is None:
+            sink = CaptureSink()
+        elif isinstance(output, OutputSink):
+            sink = output
+        else:
+            sink = StreamSink(output)
+        context = dict(initial_context) if initial_context else {}
+        frame = Frame(self._names, context)
+        with redirect_output(sink), redirect_input(source), metered(budget):
+            self._run(frame)
+        return RunResult(frame.store(context), sink.lines if output is None else None)
+
+    def __repr__(self):
+        return f"<CompiledProgram {self._name} engine={self._engine} O{self._opt_level} {self._source_hash[:12]}>"
+
+
+_programs: 'OrderedDict[str, CompiledProgram]' = OrderedDict()
+_cache_size = DEFAULT_CACHE_SIZE
+_cache_lock = threading.Lock()
+# The Lark parser and its indenter keep state while parsing, so compiles take turns
+_compile_lock = threading.Lock()
+
+
+def compile(source: str, engine: str = 'tree', opt_level: int = DEFAULT_OPT_LEVEL,
+            parser_kind: str = 'lalr', name: str = '<string>') -> CompiledProgram:
+    """Compile WarPy40K source, or return the cached program for the same source and options.
+
+    name is the script name error messages report. Syntax and arity errors
+    raise before anything is cached.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Expected one of: {', '.join(ENGINES)}.")
+    if opt_level not in OPT_LEVELS:
+        raise ValueError(f"Unknown optimization level {opt_level}. Expected one of: {OPT_LEVELS}.")
+    key = source_key(source, AST_VERSION, parser_kind, engine, f"O{opt_level}", name)
+    with _cache_lock:
+        program = _programs.get(key)
+        if program is not None:
+            _programs.move_to_end(key)
+            return program
+    with _compile_lock:
+        statements = optimize_program(parse_program(source, parser_kind), opt_level)
+        program = CompiledProgram(statements, name, engine, opt_level, key)
+    with _cache_lock:
+        # Another thread may have compiled the same source meanwhile; keep the first
+        program = _programs.setdefault(key, program)
+        _programs.move_to_end(key)
+        while len(_programs) > _cache_size:
+            _programs.popitem(last=False)
+    return program
+
+
+def run(source: str, inputs=None, output=None, initial_context=None, budget=None, **compile_options) -> RunResult:
+    """compile(source, **compile_options).run(...) in one call."""
+    return compile(source, **compile_options).run(inputs, output, initial_context, budget)
+
+
+def set_cache_size(size: int) -> None:
+    """Keep at most size compiled programs; 0 disables the cache."""
+    global _cache_size
+    with _cache_lock:
+        _cache_size = size
+        while len(_programs) > _cache_size:
+            _programs.popitem(last=False)
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _programs.clear()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Execution Budgets
+Limits on one run of a script: how many loop steps it may take, how long it
+may run and how much memory it may add. A run that goes over raises a
+BudgetExceeded subclass that carries the script position where it happened,
+so `while 1 == 1:` or a string doubled in a loop stops with an error instead
+of spinning or taking the machine down.
+
+Steps are counted where loops jump back: every engine charges a finished
+iteration the number of statements in the loop body, so a program stops at
+the same iteration, after the same output, on all of them. The charge is a
+subtraction from a countdown. Only when the countdown runs out does the
+meter add up the steps, read the clock and start a new window of at most
+CHECK_INTERVAL steps, so the deadline is checked every thousand or so steps,
+not on every one. A run without a budget pays one `is not None` per iteration.
+Straight-line code cannot run forever and is not counted.
+
+The memory ceiling lowers the process's RLIMIT_AS to what it uses when the
+run starts plus the allowed amount; the MemoryError Python raises when an
+allocation is refused becomes MemoryLimitExceeded. It needs Linux. The
+limit is per process: other threads are held to it while the run lasts,
+and a run nested in a capped one keeps the outer ceiling.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import threading
+import time
+from collections import namedtuple
+from collections.abc import Iterator
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+# Most steps a meter takes between looks at the step count and the clock
+CHECK_INTERVAL = 1024
+
+
+class BudgetExceeded(RuntimeError):
+    """A run went over one of its limits; warpy_position is where it was stopped."""
+
+
+class StepLimitExceeded(BudgetExceeded):
+    pass
+
+
+class DeadlineExceeded(BudgetExceeded, TimeoutError):
+    pass
+
+
+class MemoryLimitExceeded(BudgetExceeded, MemoryError):
+    pass
+
+
+class Budget(namedtuple('Budget', 'max_steps time_limit memory_limit', defaults=(None, None, None))):
+    """Limits for one run; None leaves that one unlimited.
+
+    max_steps counts loop steps (see loop_cost), time_limit is seconds of
+    wall-clock time and memory_limit the bytes the run may add to the process.
+    """
+    __slots__ = ()
+
+    def tightened(self, **limits) -> 'Budget':
+        """This budget with each given limit lowered to the given value."""
+        values = self._asdict()
+        for name, limit in limits.items():
+            if limit is not None:
+                values[name] = limit if values[name] is None else min(values[name], limit)
+        return Budget(**values)
+
+
+def loop_cost(commands) -> int:
+    """Steps one iteration of a loop with this body costs."""
+    return max(len(commands), 1)
+
+
+class Meter:
+    """The running count for one budget; loops charge it through remaining."""
+    __slots__ = ('remaining', 'window', 'steps', 'budget', 'deadline')
+
+    def __init__(self, budget: Budget, steps: int = 0, deadline: float | None = None):
+        self.budget = budget
+        self.steps = steps
+        if deadline is None and budget.time_limit is not None:
+            deadline = time.monotonic() + budget.time_limit
+        self.deadline = deadline
+        self.window = self.remaining = self._next_window()
+
+    def _next_window(self) -> int:
+        if self.budget.max_steps is None:
+            return CHECK_INTERVAL
+        # Stop the countdown right where the step after the last allowed one would be
+        return min(CHECK_INTERVAL, self.budget.max_steps - self.steps + 1)
+
+    def used(self) -> int:
+        return self.steps + self.window - self.remaining
+
+    def affords(self, steps: int) -> bool:
+        """Whether steps more stay within the step limit (for loops that charge many iterations at once)."""
+        return self.budget.max_steps is None or self.used() + steps <= self.budget.max_steps
+
+    def charge(self, steps: int, position: tuple) -> None:
+        self.remaining -= steps
+        if self.remaining <= 0:
+            self.check(position)
+
+    def check(self, position: tuple) -> None:
+        """Called by a loop whose charge ran the countdown out; raises if a limit is exceeded."""
+        self.steps = self.used()
+        budget = self.budget
+        if budget.max_steps is not None and self.steps > budget.max_steps:
+            error = StepLimitExceeded(f"script ran more than {budget.max_steps} loop steps")
+        elif self.deadline is not None and time.monotonic() > self.deadline:
+            error = DeadlineExceeded(f"script ran past its {budget.time_limit or 0:g} s time limit")
+        else:
+            self.window = self.remaining = self._next_window()
+            return
+        error.warpy_position = position
+        raise error
+
+    def handoff(self) -> tuple[Budget, int, float | None]:
+        """metered() arguments that carry this count on elsewhere (parallel tasks, on this machine)."""
+        return self.budget, self.used(), self.deadline
+
+
+class _MeterState(threading.local):
+    meter: Meter | None = None
+
+
+_state = _MeterState()
+_memory_lock = threading.Lock()
+_memory_capped = False
+_base_limits = resource.getrlimit(resource.RLIMIT_AS) if resource is not None else None
+
+
+def current_meter() -> Meter | None:
+    return _state.meter
+
+
+def _address_space() -> int | None:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _cap_memory(limit: int) -> tuple[int, int] | None:
+    """Lower RLIMIT_AS to allow limit more bytes; returns the limits to restore, None if already capped."""
+    global _memory_capped
+    used = _address_space()
+    if resource is None or used is None:
+        raise ValueError("memory limits are only supported on Linux")
+    with _memory_lock:
+        if _memory_capped:
+            return None
+        previous = resource.getrlimit(resource.RLIMIT_AS)
+        soft = used + limit
+        if previous[1] != resource.RLIM_INFINITY:
+            soft = min(soft, previous[1])
+        resource.setrlimit(resource.RLIMIT_AS, (soft, previous[1]))
+        _memory_capped = True
+        return previous
+
+
+def _uncap_memory(previous: tuple[int, int]) -> None:
+    global _memory_capped
+    with _memory_lock:
+        resource.setrlimit(resource.RLIMIT_AS, previous)
+        _memory_capped = False
+
+
+def reset_memory_limit() -> None:
+    """Restore the address-space limit the process started with (for a worker forked mid-run)."""
+    global _memory_capped
+    if _base_limits is not None:
+        with _memory_lock:
+            resource.setrlimit(resource.RLIMIT_AS, _base_limits)
+            _memory_capped = False
+
+
+def _validate(budget: Budget) -> None:
+    for name, value in budget._asdict().items():
+        if value is not None and value < 0:
+            raise ValueError(f"Budget {name} must not be negative, got {value}")
+
+
+@contextlib.contextmanager
+def metered(budget: Budget | None, steps: int = 0, deadline: float | None = None) -> Iterator[Meter | None]:
+    """Hold the code run in the with block, on this thread, to budget (None: no change).
+
+    steps already spent and a time.monotonic() deadline, when given, continue
+    a count begun elsewhere instead of starting a new one.
+    """
+    if budget is None:
+        yield None
+        return
+    _validate(budget)
+    meter = Meter(budget, steps, deadline)
+    restore = _cap_memory(budget.memory_limit) if budget.memory_limit is not None else None
+    previous, _state.meter = _state.meter, meter
+    try:
+        yield meter
+    except MemoryError as exc:
+        if budget.memory_limit is None or isinstance(exc, MemoryLimitExceeded):
+            raise
+        # Give the memory back before building the replacement error
+        if restore is not None:
+            _uncap_memory(restore)
+            restore = None
+        error = MemoryLimitExceeded(f"script used more than {budget.memory_limit / 2 ** 20:g} MB of memory")
+        for attr in ('warpy_position', 'warpy_line', 'warpy_column', '__notes__'):
+            if hasattr(exc, attr):
+                setattr(error, attr, getattr(exc, attr))
+        raise error from None
+    finally:
+        _state.meter = previous
+        if restore is not None:
+            _uncap_memory(restore)
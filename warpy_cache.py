@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Compiled-Program Cache
+Stores transformed programs on disk (like Python's __pycache__) so unchanged
+scripts skip parsing and transformation on the next run.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+
+CACHE_DIR_NAME = '__warpycache__'
+CACHE_SUFFIX = '.wp40kc'
+CACHE_MAGIC = b'WP40KC\x01\n'
+DEFAULT_MAX_CACHE_BYTES = 32 * 1024 * 1024
+
+# Environment overrides: a shared cache directory and its size limit in bytes
+CACHE_DIR_ENV = 'WARPY_CACHE_DIR'
+CACHE_SIZE_ENV = 'WARPY_CACHE_MAX_BYTES'
+
+
+def source_key(source: str, *version_parts: str) -> str:
+    """Hash the source together with everything that shapes the compiled form."""
+    digest = hashlib.sha256()
+    for part in version_parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(source.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ProgramCache:
+    def __init__(self, cache_dir: str | None = None, max_bytes: int | None = None):
+        self.cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV)
+        if max_bytes is None:
+            try:
+                max_bytes = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_MAX_CACHE_BYTES))
+            except ValueError:
+                # A malformed limit should not keep scripts from running
+                max_bytes = DEFAULT_MAX_CACHE_BYTES
+        self.max_bytes = max_bytes
+
+    def _directory_for(self, script_path: str) -> str:
+        if self.cache_dir:
+            return self.cache_dir
+        return os.path.join(os.path.dirname(os.path.abspath(script_path)), CACHE_DIR_NAME)
+
+    def _stem_for(self, script_path: str) -> str:
+        stem = os.path.splitext(os.path.basename(script_path))[0]
+        if self.cache_dir:
+            # A shared directory can hold scripts with the same name from different folders
+            path_hash = hashlib.sha256(os.path.abspath(script_path).encode('utf-8')).hexdigest()[:8]
+            stem = f"{stem}-{path_hash}"
+        return stem
+
+    def path_for(self, script_path: str, key: str, variant: str = '') -> str:
+        """Entry for key; variant names the options the key covers besides the source (no dots),
+        so entries built with other options are kept alongside it."""
+        stem = self._stem_for(script_path)
+        if variant:
+            stem = f"{stem}.{variant}"
+        return os.path.join(self._directory_for(script_path), f"{stem}.{key[:16]}{CACHE_SUFFIX}")
+
+    def load(self, script_path: str, key: str, variant: str = '') -> object | None:
+        """Return the cached program for this key, or None on a miss or a damaged entry."""
+        path = self.path_for(script_path, key, variant)
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                    return None
+                stored_key, program = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError):
+            return None
+        if stored_key != key:
+            return None
+        try:
+            # Refresh the mtime so eviction drops the least recently used entries first
+            os.utime(path)
+        except OSError:
+            pass
+        return program
+
+    def store(self, script_path: str, key: str, program: object, variant: str = '') -> bool:
+        """Write the program atomically; returns False when the cache is not writable."""
+        directory = self._directory_for(script_path)
+        path = self.path_for(script_path, key, variant)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            import tempfile
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(CACHE_MAGIC)
+                    pickle.dump((key, program), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except (OSError, pickle.PicklingError, TypeError, AttributeError, RecursionError):
+            return False
+        self._invalidate_stale(script_path, path, variant)
+        self.evict(directory)
+        return True
+
+    def _invalidate_stale(self, script_path: str, current_path: str, variant: str = ''):
+        # Entries for older versions of the same script, built with the same options, can never
+        # be hit again; those built with other options (another variant) still can
+        prefix = self._stem_for(script_path) + '.'
+        directory = os.path.dirname(current_path)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not (name.startswith(prefix) and name.endswith(CACHE_SUFFIX)):
+                continue
+            entry_variant, _, entry_key = name[len(prefix):-len(CACHE_SUFFIX)].rpartition('.')
+            is_entry = entry_variant == variant and '.' not in entry_key
+            if is_entry and path != current_path:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def evict(self, directory: str):
+        """Remove least recently used entries until the directory fits in max_bytes."""
+        entries = []
+        total = 0
+        for name in os.listdir(directory):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Closure Compiler
+Turns the AST into nested, pre-bound Python closures once, at load time.
+
+Operand kinds (variable slot, literal or sub-expression) and command handlers
+are resolved while compiling, so running a statement is a plain closure call
+with no isinstance ladders or COMMANDS lookups. The operand rules mirror each
+node's execute/evaluate method, so output matches the tree-walker.
+"""
+
+from warpy_core import (
+    CommandNode, DeclarationNode, LoopNode, ConditionalNode, ComparisonNode,
+    WhileNode, AssignmentNode, StrFunctionNode, VarRef, UNBOUND, ARITHMETIC_NODES, OPERAND_NODES,
+    PARALLEL_NODES, BINARY_FUNCTIONS, annotate_error, compare_function, coerce_dg, node_position,
+)
+from warpy_budget import current_meter, loop_cost
+from warpy_output import write_line
+from warpy_vector import VectorLoopNode
+
+# Operand kinds decided at compile time
+NAME = 'name'
+CONST = 'const'
+EXPR = 'expr'
+
+
+def _operand(val, evaluated_nodes):
+    """Classify an operand; nodes outside evaluated_nodes are kept as literal values."""
+    if isinstance(val, evaluated_nodes):
+        return EXPR, compile_expression(val)
+    if isinstance(val, VarRef):
+        return NAME, (val.slot, val.name)
+    return CONST, val
+
+
+def _leaf(kind, val):
+    if kind == EXPR:
+        return val
+    if kind == NAME:
+        slot, name = val
+
+        def load_name(frame):
+            value = frame[slot]
+            return name if value is UNBOUND else value
+        return load_name
+
+    def load_const(frame):
+        return val
+    return load_const
+
+
+def _binary(func, left, right, position):
+    # NAME operands read their slot inline; an unbound slot reads as the variable's name.
+    # A failing operation records its own position, which is finer than its statement's
+    left_kind, lval = left
+    right_kind, rval = right
+    if left_kind == NAME:
+        lslot, lname = lval
+        if right_kind == NAME:
+            rslot, rname = rval
+
+            def binary(frame):
+                try:
+                    a = frame[lslot]
+                    b = frame[rslot]
+                    return func(lname if a is UNBOUND else a, rname if b is UNBOUND else b)
+                except Exception as exc:
+                    _mark_expression(exc, position)
+                    raise
+        elif right_kind == CONST:
+            def binary(frame):
+                try:
+                    a = frame[lslot]
+                    return func(lname if a is UNBOUND else a, rval)
+                except Exception as exc:
+                    _mark_expression(exc, position)
+                    raise
+        else:
+            def binary(frame):
+                try:
+                    a = frame[lslot]
+                    return func(lname if a is UNBOUND else a, rval(frame))
+                except Exception as exc:
+                    _mark_expression(exc, position)
+                    raise
+    elif left_kind == CONST:
+        if right_kind == NAME:
+            rslot, rname = rval
+
+            def binary(frame):
+                try:
+                    b = frame[rslot]
+                    return func(lval, rname if b is UNBOUND else b)
+                except Exception as exc:
+                    _mark_expression(exc, position)
+                    raise
+        elif right_kind == CONST:
+            def binary(frame):
+                try:
+                    return func(lval, rval)
+                except Exception as exc:
+                    _mark_expression(exc, position)
+                    raise
+        else:
+            def binary(frame):
+                try:
+                    return func(lval, rval(frame))
+                except Exception as exc:
+                    _mark_expression(exc, position)
+                    raise
+    else:
+        if right_kind == NAME:
+            rslot, rname = rval
+
+            def binary(frame):
+                try:
+                    b = frame[rslot]
+                    return func(lval(frame), rname if b is UNBOUND else b)
+                except Exception as exc:
+                    _mark_expression(exc, position)
+                    raise
+        elif right_kind == CONST:
+            def binary(frame):
+                try:
+                    return func(lval(frame), rval)
+                except Exception as exc:
+                    _mark_expression(exc, position)
+                    raise
+        else:
+            def binary(frame):
+                try:
+                    return func(lval(frame), rval(frame))
+                except Exception as exc:
+                    _mark_expression(exc, position)
+                    raise
+    return binary
+
+
+def compile_expression(node):
+    if isinstance(node, ComparisonNode):
+        return _binary(compare_function(node.operator),
+                       _operand(node.left, ARITHMETIC_NODES), _operand(node.right, ARITHMETIC_NODES),
+                       node_position(node))
+    if isinstance(node, StrFunctionNode):
+        inner = _leaf(*_operand(node.expr, OPERAND_NODES))
+
+        def to_str(frame):
+            return str(inner(frame))
+        return to_str
+    return _binary(BINARY_FUNCTIONS[type(node)],
+                   _operand(node.left, OPERAND_NODES), _operand(node.right, OPERAND_NODES),
+                   node_position(node))
+
+
+def compile_call(node):
+    handler = node.handler
+    if handler is None:
+        name = node.name
+
+        def unknown_command(frame):
+            write_line(f"Unknown command: {name}")
+            return None
+        return unknown_command
+
+    args = [_leaf(*_operand(arg, ARITHMETIC_NODES + (ComparisonNode,))) for arg in node.args]
+    if not args:
+        def call(frame):
+            return handler()
+    elif len(args) == 1:
+        arg = args[0]
+
+        def call(frame):
+            return handler(arg(frame))
+    else:
+        def call(frame):
+            return handler(*[arg(frame) for arg in args])
+    return call
+
+
+def compile_declaration(stmt):
+    name = stmt.varname
+    slot = stmt.slot
+    value = stmt.callnode
+    if isinstance(value, CommandNode):
+        call = compile_call(value)
+        if stmt.typename == "dg":
+            def declare(frame):
+                frame[slot] = coerce_dg(call(frame), name)
+        else:
+            def declare(frame):
+                frame[slot] = call(frame)
+    elif stmt.typename == "dg" and (isinstance(value, str) or value is None):
+        def declare(frame):
+            frame[slot] = coerce_dg(value, name)
+    elif isinstance(value, ARITHMETIC_NODES + (VarRef,)):
+        expr = _leaf(*_operand(value, ARITHMETIC_NODES))
+
+        def declare(frame):
+            frame[slot] = expr(frame)
+    else:
+        # Any other value is stored as written
+        def declare(frame):
+            frame[slot] = value
+    return declare
+
+
+def compile_assignment(stmt):
+    slot = stmt.slot
+    expr = _leaf(*_operand(stmt.expr, ARITHMETIC_NODES + (ComparisonNode,)))
+
+    def assign(frame):
+        frame[slot] = expr(frame)
+    return assign
+
+
+def compile_condition(condition):
+    # Comparisons and variables are evaluated; any other condition is judged by its own truthiness
+    if isinstance(condition, ComparisonNode):
+        return compile_expression(condition)
+    if isinstance(condition, VarRef):
+        return _leaf(*_operand(condition, ()))
+    truth = bool(condition)
+
+    def constant_condition(frame):
+        return truth
+    return constant_condition
+
+
+def compile_loop(stmt):
+    bounds = []
+    for bound in (stmt.start, stmt.end):
+        while isinstance(bound, list) and len(bound) == 1:
+            bound = bound[0]
+        if isinstance(bound, list):
+            raise ValueError("Unexpected list value in loop range")
+        bounds.append(_leaf(*_operand(bound, ())))
+    start, end = bounds
+    slot = stmt.slot
+    commands = stmt.commands
+    body = compile_body(commands)
+    cost = loop_cost(commands)
+    position = node_position(stmt)
+    if len(body) == 1:
+        only = body[0]
+
+        def loop(frame):
+            first, last = int(start(frame)), int(end(frame))
+            meter = current_meter()
+            try:
+                for i in range(first, last + 1):
+                    frame[slot] = i
+                    only(frame)
+                    if meter is not None:
+                        meter.remaining -= cost
+                        if meter.remaining <= 0:
+                            meter.check(position)
+            except Exception as exc:
+                _mark_position(exc, commands[0])
+                raise
+    else:
+        def loop(frame):
+            stmt = None
+            meter = current_meter()
+            try:
+                for i in range(int(start(frame)), int(end(frame)) + 1):
+                    frame[slot] = i
+                    for stmt in body:
+                        stmt(frame)
+                    if meter is not None:
+                        meter.remaining -= cost
+                        if meter.remaining <= 0:
+                            meter.check(position)
+            except Exception as exc:
+                _mark_failed(exc, stmt, body, commands)
+                raise
+    return loop
+
+
+def compile_vector_loop(stmt):
+    scalar_loop = compile_loop(stmt)
+    run_vector = stmt.run_vector
+
+    def vector_loop(frame):
+        if not run_vector(frame):
+            scalar_loop(frame)
+    return vector_loop
+
+
+def compile_while(stmt):
+    condition = compile_condition(stmt.condition)
+    commands = stmt.commands
+    body = compile_body(commands)
+    cost = loop_cost(commands)
+    position = node_position(stmt)
+
+    def while_loop(frame):
+        stmt = None
+        meter = current_meter()
+        try:
+            while condition(frame):
+                for stmt in body:
+                    stmt(frame)
+                if meter is not None:
+                    meter.remaining -= cost
+                    if meter.remaining <= 0:
+                        meter.check(position)
+        except Exception as exc:
+            _mark_failed(exc, stmt, body, commands)
+            raise
+    return while_loop
+
+
+def compile_conditional(stmt):
+    condition = compile_condition(stmt.condition)
+    then_commands = stmt.then_commands
+    else_commands = stmt.else_commands or []
+    then_body = compile_body(then_commands)
+    else_body = compile_body(else_commands)
+
+    def conditional(frame):
+        stmt = None
+        if condition(frame):
+            try:
+                for stmt in then_body:
+                    stmt(frame)
+            except Exception as exc:
+                _mark_failed(exc, stmt, then_body, then_commands)
+                raise
+        else:
+            try:
+                for stmt in else_body:
+                    stmt(frame)
+            except Exception as exc:
+                _mark_failed(exc, stmt, else_body, else_commands)
+                raise
+    return conditional
+
+
+def compile_statement(stmt):
+    if isinstance(stmt, CommandNode):
+        return compile_call(stmt)
+    if isinstance(stmt, DeclarationNode):
+        return compile_declaration(stmt)
+    if isinstance(stmt, AssignmentNode):
+        return compile_assignment(stmt)
+    if isinstance(stmt, VectorLoopNode):
+        return compile_vector_loop(stmt)
+    if isinstance(stmt, LoopNode):
+        return compile_loop(stmt)
+    if isinstance(stmt, WhileNode):
+        return compile_while(stmt)
+    if isinstance(stmt, ConditionalNode):
+        return compile_conditional(stmt)
+    if isinstance(stmt, PARALLEL_NODES):
+        # Tasks run as AST on the worker pool
+        return stmt.execute
+    raise TypeError(f"Cannot compile statement of type {type(stmt).__name__}")
+
+
+def compile_body(statements):
+    return tuple(compile_statement(stmt) for stmt in statements)
+
+
+def compile_program(statements):
+    body = compile_body(statements)
+
+    def program(frame):
+        stmt = None
+        try:
+            for stmt in body:
+                stmt(frame)
+        except Exception as exc:
+            _mark_failed(exc, stmt, body, statements)
+            raise
+        return frame
+    return program
+
+
+# Closures keep no reference to their node, so each block catches errors from its
+# statements (free until one is raised) and records the innermost statement's position
+def _mark_position(exc, node):
+    if getattr(exc, 'warpy_position', None) is None:
+        exc.warpy_position = node_position(node)
+
+
+def _mark_expression(exc, position):
+    if position[0] is not None and getattr(exc, 'warpy_position', None) is None:
+        exc.warpy_position = position
+
+
+def _mark_failed(exc, failed, body, statements):
+    if failed is not None:
+        _mark_position(exc, statements[body.index(failed)])
+
+
+def run_compiled(program, frame, script_name='<string>'):
+    """Run a compile_program() result against a Frame and return it."""
+    try:
+        program(frame.values)
+    except Exception as exc:
+        position = getattr(exc, 'warpy_position', None)
+        if position is not None:
+            annotate_error(exc, script_name, *position)
+        raise
+    return frame
+
+
+def run_program(statements, frame, script_name='<string>'):
+    """Run resolved statements against a Frame and return it."""
+    return run_compiled(compile_program(statements), frame, script_name)
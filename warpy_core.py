@@ -0,0 +1,1707 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Core
+The language itself: grammars and parsers, AST nodes, slot resolution and
+command binding, the on-disk program cache and the engine dispatch, so
+everything that runs a script imports this module. warpy_interpreter is the
+command line on top of it.
+"""
+
+from warpy_cache import ProgramCache, source_key
+from warpy_output import flush_output, write_line
+from warpy_input import current_source
+from warpy_budget import current_meter, loop_cost, metered
+import functools
+import operator
+import sys
+import types
+
+# Bump whenever the node classes, WarpyTransformer or warpy_optimizer change the
+# shape of the AST, so programs stored by warpy_cache get rebuilt instead of loaded.
+AST_VERSION = '11'
+
+# Unified grammar that matches the test files
+warpy_grammar = r"""
+start: programa
+
+programa    : sentenca*
+
+sentenca    : comando
+            | declaracao
+            | atribuicao
+            | loop
+            | loop_while
+            | condicional
+
+declaracao  : identificador ":" tipo "=" expressao
+atribuicao  : identificador "=" expressao
+
+tipo        : "dg" | "servitor" | "blob" | "psykers" | "void_shields"
+
+comando     : NOME_COMANDO "(" [args] ")"
+
+args        : expressao ("," expressao)*
+
+chamada     : NOME_COMANDO "(" [args] ")"
+
+comandos    : sentenca+
+loop        : FOR identificador IN expr_range ":" comandos
+loop_while  : WHILE expressao ":" comandos
+condicional : IF expressao ":" comandos [elif_chain] [ELSE ":" comandos]
+elif_chain  : (ELIF expressao ":" comandos)+
+
+expr_range  : expressao ".." expressao
+
+// Refactored: Use left recursion and EBNF for arithmetic expressions
+expressao   : expr_logica
+
+expr_logica : expr_comp ((AND | OR) expr_comp)*
+expr_comp   : termo_comp ((OP_COMPARACAO) termo_comp)*
+termo_comp  : termo ((PLUS | MINUS) termo)*
+termo       : fator ((STAR | SLASH | PERCENT) fator)*
+fator       : numero
+            | identificador
+            | chamada
+            | ESCAPED_STRING
+            | funcao_str
+            | "(" expressao ")"
+
+funcao_str  : "str" "(" expressao ")"
+
+comparacao  : termo_comp OP_COMPARACAO termo_comp
+OP_COMPARACAO: "==" | "!=" | "<" | ">" | "<=" | ">="
+
+NOME_COMANDO: "the_emperor_protects"|"only_in_death_does_duty_end"|"even_in_death_i_still_serve"|"no_pity_no_remorse_no_fear"|"burn_the_heretic"|"pain_is_temporary_glory_is_forever"|"faith_is_my_shield"|"we_are_angels_of_death"|"we_are_one"|"WAAAGH"|"taste_chaos"|"for_the_emperor"|"purge_the_xenos"|"the_emperors_will_be_done"|"fear_is_the_mind_killer"|"ave_imperator"|"the_path_is_set"|"farseers_vision"|"more_dakka"|"ork_cunning"|"blood_for_the_blood_god"|"let_the_galaxy_burn"|"servitor"|"hear_the_emperors_voice"|"vox_cast"
+IF: "if"
+ELIF: "elif"
+ELSE: "else"
+FOR: "for"
+IN: "in"
+WHILE: "while"
+AND: "and"
+OR: "or"
+identificador: /[a-zA-Z_][a-zA-Z0-9_]*/
+numero      : /\d+(\.\d+)?/
+
+ESCAPED_STRING : /"[^"]*"/
+
+PLUS: "+"
+MINUS: "-"
+STAR: "*"
+SLASH: "/"
+PERCENT: "%"
+
+%import common.WS
+%ignore WS
+%ignore /#[^\n]*/
+"""
+
+# Indentation-aware grammar for the LALR parser. Blocks are delimited by the
+# _INDENT/_DEDENT tokens injected by WarPyIndenter, so nested bodies are no
+# longer ambiguous and parsing is linear in the size of the script.
+warpy_indented_grammar = r"""
+start: programa
+
+programa    : (_NL | sentenca)*
+
+sentenca    : simples+ _NL
+            | loop
+            | loop_while
+            | condicional
+            | paralelo
+            | paralelo_for
+
+?simples    : comando
+            | declaracao
+            | atribuicao
+
+declaracao  : identificador ":" tipo "=" expressao
+atribuicao  : identificador "=" expressao
+
+tipo        : "dg" | "servitor" | "blob" | "psykers" | "void_shields"
+
+comando     : NOME_COMANDO _LPAR [args] _RPAR
+
+args        : expressao ("," expressao)*
+
+chamada     : NOME_COMANDO _LPAR [args] _RPAR
+
+comandos    : _NL _INDENT sentenca+ _DEDENT
+            | simples+ _NL
+loop        : FOR identificador IN expr_range ":" comandos
+loop_while  : WHILE expressao ":" comandos
+condicional : IF expressao ":" comandos [elif_chain] [ELSE ":" comandos]
+elif_chain  : (ELIF expressao ":" comandos)+
+
+// Every statement of a parallel block, or every iteration of a parallel for, is one task
+paralelo    : PARALLEL opcoes ":" _NL _INDENT sentenca+ _DEDENT [on_success] [on_failure]
+paralelo_for: PARALLEL FOR identificador IN expr_range opcoes ":" comandos [on_success] [on_failure]
+opcoes      : opcao*
+opcao       : identificador "=" numero
+on_success  : ON_SUCCESS ":" comandos
+on_failure  : ON_FAILURE ":" comandos
+
+expr_range  : expressao ".." expressao
+
+expressao   : expr_logica
+
+expr_logica : expr_comp ((AND | OR) expr_comp)*
+expr_comp   : termo_comp ((OP_COMPARACAO) termo_comp)*
+termo_comp  : termo ((PLUS | MINUS) termo)*
+termo       : fator ((STAR | SLASH | PERCENT) fator)*
+fator       : numero
+            | identificador
+            | chamada
+            | ESCAPED_STRING
+            | funcao_str
+            | _LPAR expressao _RPAR
+
+// STR is a named terminal so the single-pass parser keeps it, and the node its position
+funcao_str  : STR _LPAR expressao _RPAR
+
+OP_COMPARACAO: "==" | "!=" | "<" | ">" | "<=" | ">="
+
+// Word boundary keeps names such as servitor_var from being split into a command
+NOME_COMANDO.2: /(?:the_emperor_protects|only_in_death_does_duty_end|even_in_death_i_still_serve|no_pity_no_remorse_no_fear|burn_the_heretic|pain_is_temporary_glory_is_forever|faith_is_my_shield|we_are_angels_of_death|we_are_one|WAAAGH|taste_chaos|for_the_emperor|purge_the_xenos|the_emperors_will_be_done|fear_is_the_mind_killer|ave_imperator|the_path_is_set|farseers_vision|more_dakka|ork_cunning|blood_for_the_blood_god|let_the_galaxy_burn|servitor|hear_the_emperors_voice|vox_cast)(?![a-zA-Z0-9_])/
+IF: "if"
+ELIF: "elif"
+ELSE: "else"
+FOR: "for"
+IN: "in"
+WHILE: "while"
+AND: "and"
+OR: "or"
+PARALLEL: "parallel"
+ON_SUCCESS: "on_success"
+ON_FAILURE: "on_failure"
+STR: "str"
+identificador: /[a-zA-Z_][a-zA-Z0-9_]*/
+numero      : /\d+(\.\d+)?/
+
+ESCAPED_STRING : /"[^"]*"/
+
+PLUS: "+"
+MINUS: "-"
+STAR: "*"
+SLASH: "/"
+PERCENT: "%"
+_LPAR: "("
+_RPAR: ")"
+
+COMMENT: /#[^\n]*/
+_NL: (/\r?\n[\t ]*/ | COMMENT)+
+
+%import common.WS_INLINE
+%declare _INDENT _DEDENT
+%ignore WS_INLINE
+%ignore COMMENT
+"""
+
+# Output commands: each formats its arguments into the line the command prints
+OUTPUT_FORMATS = {
+    'the_emperor_protects': lambda: "[LOG] The Emperor protects!",
+    'burn_the_heretic': lambda tgt=None: f"[FIB] {tgt}" if tgt is not None else "[FIB]",
+    'for_the_emperor': lambda: "[IMPERIUM] For the Emperor!",
+    'purge_the_xenos': lambda tgt: f"[ACTION] Xenos purged: {tgt}!",
+    'the_emperors_will_be_done': lambda: "[IMPERIUM] The Emperor's will is fulfilled.",
+    'fear_is_the_mind_killer': lambda: "[LOG] Fear suppressed.",
+    'ave_imperator': lambda: "Ave Imperator! Glory to the Emperor!",
+    'we_are_one': lambda: "[UNITY] We are one.",
+    'WAAAGH': lambda: "[WAAAGH!] The orks rally!",
+    'taste_chaos': lambda: "[CORRUPTION] Warp corrupts your soul.",
+    'the_path_is_set': lambda: "[ELDAR] The path is set. We proceed.",
+    'farseers_vision': lambda: "[ELDAR] The Farseer foresees...",
+    'more_dakka': lambda: "[ORKS] More dakka! Fire everything!",
+    'ork_cunning': lambda: "[ORKS] Cunning plan!",
+    'blood_for_the_blood_god': lambda: "[CHAOS] Blood for the Blood God!",
+    'let_the_galaxy_burn': lambda: "[CHAOS] The galaxy burns!",
+    'only_in_death_does_duty_end': lambda: "[LOG] Only in death does duty end.",
+    'even_in_death_i_still_serve': lambda: "[LOG] Even in death, I still serve!",
+    'no_pity_no_remorse_no_fear': lambda: "[LOG] No pity, no remorse, no fear!",
+    'pain_is_temporary_glory_is_forever': lambda: "[LOG] Pain is temporary, glory is forever.",
+    'faith_is_my_shield': lambda: "[LOG] Faith is my shield!",
+    'we_are_angels_of_death': lambda: "[LOG] We are the Angels of Death!",
+    'vox_cast': lambda msg=None: f"[VOX] {str(msg) if msg is not None else ''}",
+}
+
+def _printer(format_line):
+    @functools.wraps(format_line)
+    def command(*args):
+        write_line(format_line(*args))
+    return command
+
+# Command implementations
+COMMANDS = {name: _printer(format_line) for name, format_line in OUTPUT_FORMATS.items()}
+COMMANDS.update({
+    'servitor': lambda: "servitor_instance",
+    'hear_the_emperors_voice': lambda prompt=None: hear_the_emperors_voice_impl(prompt),
+})
+
+CO_VARARGS = 0x04  # inspect.CO_VARARGS
+
+@functools.lru_cache(maxsize=None)
+def command_arity(handler):
+    """(fewest, most) positional arguments handler accepts; most is None when it takes *args."""
+    # Plain functions are read directly, so binding a script does not import inspect
+    function = handler
+    while isinstance(function, types.FunctionType) and hasattr(function, '__wrapped__'):
+        function = function.__wrapped__  # functools.wraps, as signature() follows it
+    if isinstance(function, types.FunctionType) and not hasattr(function, '__signature__'):
+        code = function.__code__
+        fewest = code.co_argcount - len(function.__defaults__ or ())
+        return fewest, None if code.co_flags & CO_VARARGS else code.co_argcount
+    import inspect
+    fewest, most = 0, 0
+    for param in inspect.signature(handler).parameters.values():
+        if param.kind == param.VAR_POSITIONAL:
+            most = None
+        elif param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
+            if param.default is param.empty:
+                fewest += 1
+            if most is not None:
+                most += 1
+    return fewest, most
+
+def command_accepts(handler, argc):
+    fewest, most = command_arity(handler)
+    return fewest <= argc and (most is None or argc <= most)
+
+def describe_arity(fewest, most):
+    if most is None:
+        return f"at least {fewest} argument{'s' if fewest != 1 else ''}"
+    if fewest == most:
+        return f"{fewest} argument{'s' if fewest != 1 else ''}"
+    return f"{fewest} to {most} arguments"
+
+def hear_the_emperors_voice_impl(prompt=None):
+    source = current_source()
+    if source.interactive:
+        # Buffered output must reach the terminal before the prompt does
+        flush_output()
+    try:
+        return source.read_line(prompt)
+    except (EOFError, KeyboardInterrupt):
+        write_line("[LOG] Input interrupted. Returning empty string.")
+        return ""
+
+def flatten_args(args):
+    flat = []
+    for arg in args:
+        if isinstance(arg, list):
+            flat.extend(flatten_args(arg))
+        else:
+            flat.append(arg)
+    return flat
+
+def unwrap(val):
+    while isinstance(val, list) and len(val) == 1:
+        val = val[0]
+    return val
+
+# Marks a frame slot whose variable has not been assigned yet
+class _Unbound:
+    def __repr__(self):
+        return '<unbound>'
+
+    def __reduce__(self):
+        return 'UNBOUND'
+
+UNBOUND = _Unbound()
+
+# AST node definitions
+# Nodes use __slots__: programs generated by tools can hold hundreds of
+# thousands of them, and a per-instance __dict__ would dominate their size
+class VarRef:
+    """A variable read; slot is its index in the frame, assigned by resolve_slots."""
+    __slots__ = ('name', 'slot')
+
+    def __init__(self, name):
+        self.name = name
+        self.slot = None
+
+    def evaluate(self, frame):
+        value = frame[self.slot]
+        # Reading a variable that was never assigned yields its name, as it always has
+        return self.name if value is UNBOUND else value
+
+    def __repr__(self):
+        return f"VarRef({self.name!r}, slot={self.slot})"
+
+class CommandNode:
+    __slots__ = ('name', 'args', 'line', 'column', 'handler')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = flatten_args(args)
+        self.line = None  # source position, set by WarpyTransformer
+        self.column = None
+        self.handler = None  # COMMANDS entry, set by bind_commands; None for unknown commands
+
+    def execute(self, frame):
+        handler = self.handler
+        if handler is None:
+            write_line(f"Unknown command: {self.name}")
+            return None
+        # Resolve variables and evaluate expressions in arguments
+        resolved_args = []
+        for arg in self.args:
+            if isinstance(arg, VarRef):
+                resolved_args.append(arg.evaluate(frame))
+            elif isinstance(arg, (SumNode, SubtractionNode, MultiplicationNode, DivisionNode, ModuloNode)):
+                resolved_args.append(arg.evaluate(frame))
+            elif isinstance(arg, ComparisonNode):
+                resolved_args.append(arg.evaluate(frame))
+            else:
+                resolved_args.append(arg)
+        return handler(*resolved_args)
+
+    # Handlers are functions of this process; a node sent to another one (e.g. a
+    # parallel task) travels unbound and is bound again there
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in _field_names(CommandNode) if name != 'handler'}
+
+    def __setstate__(self, state):
+        self.handler = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+class DeclarationNode:
+    __slots__ = ('varname', 'typename', 'callnode', 'line', 'column', 'slot')
+
+    def __init__(self, varname, typename, callnode):
+        self.varname = varname
+        self.typename = typename
+        self.callnode = callnode
+        self.line = None  # source position, set by WarpyTransformer
+        self.column = None
+        self.slot = None  # frame index of the target variable, set by resolve_slots
+    
+    def execute(self, frame):
+        value = self.callnode
+        # If the value is a CommandNode, execute it and store the result
+        if isinstance(value, CommandNode):
+            result = value.execute(frame)
+            value = result
+        # If type is dg and value is a string, try to convert to int or float
+        if self.typename == "dg" and isinstance(value, str):
+            try:
+                if "." in value:
+                    value = float(value)
+                else:
+                    value = int(value)
+            except Exception:
+                raise ValueError(f"Cannot convert input '{value}' to a number for variable '{self.varname}' of type dg.")
+        elif self.typename == "dg" and value is None:
+            raise ValueError(f"Input for variable '{self.varname}' of type dg was empty or invalid.")
+        elif isinstance(value, (VarRef, SumNode, SubtractionNode, MultiplicationNode, DivisionNode, ModuloNode)):
+            value = value.evaluate(frame)
+        frame[self.slot] = value
+
+class LoopNode:
+    __slots__ = ('varname', 'start', 'end', 'commands', 'line', 'column', 'slot')
+
+    def __init__(self, varname, start, end, commands):
+        self.varname = varname
+        self.start = start
+        self.end = end
+        self.commands = commands
+        self.line = None  # source position, set by WarpyTransformer
+        self.column = None
+        self.slot = None  # frame index of the target variable, set by resolve_slots
+    
+    def execute(self, frame):
+        def _resolve(val, frame):
+            if isinstance(val, list):
+                if len(val) == 1:
+                    return _resolve(val[0], frame)
+                raise ValueError("Unexpected list value in loop range")
+            if isinstance(val, VarRef):
+                return val.evaluate(frame)
+            return val
+        start = _resolve(self.start, frame)
+        end = _resolve(self.end, frame)
+        meter = current_meter()
+        for i in range(int(start), int(end) + 1):
+            frame[self.slot] = i
+            for cmd in self.commands:
+                cmd.execute(frame)
+            if meter is not None:
+                meter.remaining -= loop_cost(self.commands)
+                if meter.remaining <= 0:
+                    meter.check(node_position(self))
+
+class ConditionalNode:
+    __slots__ = ('condition', 'then_commands', 'else_commands', 'line', 'column')
+
+    def __init__(self, condition, then_commands, else_commands=None):
+        self.condition = condition
+        # Only keep executable nodes
+        self.then_commands = [cmd for cmd in then_commands if hasattr(cmd, 'execute')]
+        self.else_commands = [cmd for cmd in else_commands if hasattr(cmd, 'execute')] if else_commands else None
+        self.line = None  # source position, set by WarpyTransformer
+        self.column = None
+    
+    def execute(self, frame):
+        # Evaluate condition
+        condition_result = self._evaluate_condition(self.condition, frame)
+        if condition_result:
+            for cmd in self.then_commands:
+                cmd.execute(frame)
+        elif self.else_commands:
+            for cmd in self.else_commands:
+                cmd.execute(frame)
+    
+    def _evaluate_condition(self, condition, frame):
+        if isinstance(condition, (ComparisonNode, VarRef)):
+            return condition.evaluate(frame)
+        # For simple values, treat as truthy/falsy
+        return bool(condition)
+
+class ComparisonNode:
+    __slots__ = ('left', 'operator', 'right', 'line', 'column')
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+        self.line = None  # position of the operator, set by WarpyTransformer
+        self.column = None
+    
+    def evaluate(self, frame):
+        left_val = self._resolve_value(self.left, frame)
+        right_val = self._resolve_value(self.right, frame)
+        
+        if self.operator == "==":
+            return left_val == right_val
+        elif self.operator == "!=":
+            return left_val != right_val
+        elif self.operator == "<":
+            return left_val < right_val
+        elif self.operator == ">":
+            return left_val > right_val
+        elif self.operator == "<=":
+            return left_val <= right_val
+        elif self.operator == ">=":
+            return left_val >= right_val
+        return False
+    
+    def _resolve_value(self, value, frame):
+        if isinstance(value, VarRef):
+            return value.evaluate(frame)
+        elif isinstance(value, (SumNode, SubtractionNode, MultiplicationNode, DivisionNode, ModuloNode)):
+            return value.evaluate(frame)
+        return value
+
+class WhileNode:
+    __slots__ = ('condition', 'commands', 'line', 'column')
+
+    def __init__(self, condition, commands):
+        self.condition = condition
+        self.commands = commands
+        self.line = None  # source position, set by WarpyTransformer
+        self.column = None
+    def execute(self, frame):
+        # Avalia a condição e executa enquanto for verdadeira
+        meter = current_meter()
+        while self._evaluate_condition(self.condition, frame):
+            for cmd in self.commands:
+                cmd.execute(frame)
+            if meter is not None:
+                meter.remaining -= loop_cost(self.commands)
+                if meter.remaining <= 0:
+                    meter.check(node_position(self))
+    def _evaluate_condition(self, condition, frame):
+        if isinstance(condition, (ComparisonNode, VarRef)):
+            return condition.evaluate(frame)
+        return bool(condition)
+
+class AssignmentNode:
+    __slots__ = ('varname', 'expr', 'line', 'column', 'slot')
+
+    def __init__(self, varname, expr):
+        self.varname = varname
+        self.expr = expr
+        self.line = None  # source position, set by WarpyTransformer
+        self.column = None
+        self.slot = None  # frame index of the target variable, set by resolve_slots
+    def execute(self, frame):
+        value = self._eval_expr(self.expr, frame)
+        frame[self.slot] = value
+    def _eval_expr(self, expr, frame):
+        if isinstance(expr, (SumNode, SubtractionNode, MultiplicationNode, DivisionNode, ModuloNode)):
+            return expr.evaluate(frame)
+        if isinstance(expr, ComparisonNode):
+            return expr.evaluate(frame)
+        if isinstance(expr, VarRef):
+            return expr.evaluate(frame)
+        return expr
+
+class ParallelBlockNode:
+    """parallel: runs each task (a statement of the block) on warpy_parallel's worker pool."""
+    __slots__ = ('tasks', 'options', 'on_success', 'on_failure', 'line', 'column')
+
+    def __init__(self, tasks, options=None, on_success=None, on_failure=None):
+        self.tasks = tasks  # one statement list per task
+        self.options = options or {}
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.line = None  # source position, set by WarpyTransformer
+        self.column = None
+
+    def execute(self, frame):
+        from warpy_parallel import run_parallel_block
+        run_parallel_block(self, frame)
+
+class ParallelForNode:
+    """parallel for: runs each iteration of the loop as a task on warpy_parallel's worker pool."""
+    __slots__ = ('varname', 'start', 'end', 'commands', 'options', 'on_success', 'on_failure', 'line', 'column', 'slot')
+
+    def __init__(self, varname, start, end, commands, options=None, on_success=None, on_failure=None):
+        self.varname = varname
+        self.start = start
+        self.end = end
+        self.commands = commands
+        self.options = options or {}
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.line = None  # source position, set by WarpyTransformer
+        self.column = None
+        self.slot = None  # frame index of the loop variable, set by resolve_slots
+
+    def execute(self, frame):
+        from warpy_parallel import run_parallel_for
+        run_parallel_for(self, frame)
+
+PARALLEL_NODES = (ParallelBlockNode, ParallelForNode)
+
+def parallel_bodies(node):
+    """Every statement list of a parallel node: the tasks, then the handlers that exist."""
+    bodies = list(node.tasks) if isinstance(node, ParallelBlockNode) else [node.commands]
+    return bodies + [body for body in (node.on_success, node.on_failure) if body]
+
+def _resolve_operand(val, frame):
+    # Operands of arithmetic, str() and logical nodes: variables and those nodes are evaluated
+    if isinstance(val, (VarRef, BinOpNode, StrFunctionNode)):
+        return val.evaluate(frame)
+    return val
+
+class BinOpNode:
+    """A binary operator; BINARY_FUNCTIONS maps each subclass to the operation it applies."""
+    __slots__ = ('left', 'right', 'line', 'column')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.line = None  # position of the operator, set by WarpyTransformer
+        self.column = None
+
+    def evaluate(self, frame):
+        left_val = _resolve_operand(self.left, frame)
+        right_val = _resolve_operand(self.right, frame)
+        return BINARY_FUNCTIONS[type(self)](left_val, right_val)
+
+# The operator subclasses only name the operation; they add no per-instance state
+class SumNode(BinOpNode):
+    __slots__ = ()
+
+class SubtractionNode(BinOpNode):
+    __slots__ = ()
+
+class MultiplicationNode(BinOpNode):
+    __slots__ = ()
+
+class DivisionNode(BinOpNode):
+    __slots__ = ()
+
+class ModuloNode(BinOpNode):
+    __slots__ = ()
+
+class LogicalAndNode(BinOpNode):
+    __slots__ = ()
+
+class LogicalOrNode(BinOpNode):
+    __slots__ = ()
+
+class StrFunctionNode:
+    __slots__ = ('expr', 'line', 'column')
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.line = None  # source position, set by WarpyTransformer
+        self.column = None
+
+    def evaluate(self, frame):
+        return str(_resolve_operand(self.expr, frame))
+
+def _divide(left, right):
+    if right == 0:
+        raise ValueError("Division by zero")
+    return left / right
+
+def _modulo(left, right):
+    if right == 0:
+        raise ValueError("Modulo by zero")
+    return left % right
+
+def _logical_and(left, right):
+    return left and right
+
+def _logical_or(left, right):
+    return left or right
+
+def _never(left, right):
+    return False
+
+# Operator tables: BinOpNode.evaluate and the compiled engines (warpy_vm, warpy_closures) apply these
+BINARY_FUNCTIONS = {
+    SumNode: operator.add,
+    SubtractionNode: operator.sub,
+    MultiplicationNode: operator.mul,
+    DivisionNode: _divide,
+    ModuloNode: _modulo,
+    LogicalAndNode: _logical_and,
+    LogicalOrNode: _logical_or,
+}
+
+COMPARE_FUNCTIONS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+}
+
+ARITHMETIC_NODES = (SumNode, SubtractionNode, MultiplicationNode, DivisionNode, ModuloNode)
+OPERAND_NODES = ARITHMETIC_NODES + (StrFunctionNode, LogicalAndNode, LogicalOrNode)
+
+def compare_function(operator_symbol):
+    # ComparisonNode.evaluate treats unknown operators as always False
+    return COMPARE_FUNCTIONS.get(operator_symbol, _never)
+
+def coerce_dg(value, varname):
+    # Same conversion DeclarationNode.execute applies to values declared as dg
+    if isinstance(value, str):
+        try:
+            return float(value) if "." in value else int(value)
+        except Exception:
+            raise ValueError(f"Cannot convert input '{value}' to a number for variable '{varname}' of type dg.")
+    if value is None:
+        raise ValueError(f"Input for variable '{varname}' of type dg was empty or invalid.")
+    return value
+
+def _place(node, meta):
+    # Nodes remember where they start in the source, for errors, tracing and profiling
+    if not getattr(meta, 'empty', True):
+        node.line = meta.line
+        node.column = meta.column
+    return node
+
+def _with_position(f, data, children, meta):
+    return _place(f(children), meta)
+
+def _positioned(rule):
+    # Same hook as lark's v_args(wrapper=...): the rule's node gets the position of its first token
+    rule.visit_wrapper = _with_position
+    return rule
+
+def is_tree(value):
+    # Parse trees come from lark or from the generated standalone parser, whose classes differ
+    return hasattr(value, 'data') and hasattr(value, 'children')
+
+def is_token(value, token_type):
+    return isinstance(value, str) and getattr(value, 'type', None) == token_type
+
+class TreeTransformer:
+    """Rewrites a parse tree bottom-up like lark's Transformer, without importing lark.
+
+    Each rule's children are transformed first, then passed as a list to the
+    method named after the rule; a token is passed to the method named after
+    its type, if there is one. Rules without a method stay trees.
+    """
+
+    def transform(self, tree):
+        children = []
+        for child in tree.children:
+            if is_tree(child):
+                child = self.transform(child)
+            else:
+                callback = getattr(self, getattr(child, 'type', ''), None)
+                if callback is not None:
+                    child = callback(child)
+            children.append(child)
+        callback = getattr(self, tree.data, None)
+        if callback is None:
+            return type(tree)(tree.data, children, tree.meta)
+        wrapper = getattr(callback, 'visit_wrapper', None)
+        if wrapper is not None:
+            return wrapper(callback, tree.data, children, tree.meta)
+        return callback(children)
+
+def _at(node, token):
+    # Binary operators take the position of their operator token
+    line = getattr(token, 'line', None)
+    if line is not None:
+        node.line = line
+        node.column = token.column
+    return node
+
+def node_position(node):
+    """(line, column) of a node; either is None when unknown."""
+    return getattr(node, 'line', None), getattr(node, 'column', None)
+
+def format_position(script_name, line, column=None):
+    """script:line:column, the form editors and tools recognise."""
+    location = f"{script_name}:{line}"
+    return location if column is None else f"{location}:{column}"
+
+def annotate_error(exc, script_name, line, column=None):
+    """Tag an exception raised by a running script with its source position (innermost wins).
+
+    A position already recorded in exc.warpy_position, where the failing node
+    was still known (a closure block, a parallel task), is used instead.
+    """
+    recorded = getattr(exc, 'warpy_position', None)
+    if recorded is not None:
+        line, column = recorded
+    if line is None or getattr(exc, 'warpy_line', None) is not None:
+        return
+    exc.warpy_line = line
+    exc.warpy_column = column
+    if hasattr(exc, 'add_note'):
+        exc.add_note(f"  in WarPy40K script {format_position(script_name, line, column)}")
+
+def innermost_position(exc):
+    """Position of the innermost node with one on the traceback of a tree-walker error, or None."""
+    position = None
+    tb = exc.__traceback__
+    while tb is not None:
+        node = tb.tb_frame.f_locals.get('self')
+        if isinstance(node, AST_NODES) and getattr(node, 'line', None) is not None:
+            position = node_position(node)
+        tb = tb.tb_next
+    return position
+
+def locate_tree_error(exc, script_name):
+    """Annotate an error raised in the tree-walker with the innermost node that has a position."""
+    position = innermost_position(exc)
+    if position is not None or getattr(exc, 'warpy_position', None) is not None:
+        annotate_error(exc, script_name, *(position or (None, None)))
+
+# Transformer to build AST
+class WarpyTransformer(TreeTransformer):
+    def __init__(self):
+        self.env = {}
+        # Interning: one VarRef per identifier and one object per distinct literal
+        self.refs = {}
+        self.constants = {}
+
+    def _constant(self, value):
+        # Floats are keyed by repr so that 0.0 and -0.0 stay distinct
+        key = (float, repr(value)) if isinstance(value, float) else (type(value), value)
+        return self.constants.setdefault(key, value)
+
+    def _maybe_transform(self, val):
+        return self.transform(val) if is_tree(val) else val
+
+    def start(self, children):
+        return children[0]
+
+    def programa(self, sentencas):
+        # Each sentenca is a list of statements; the program is one flat list
+        return [stmt for sentenca in sentencas for stmt in sentenca]
+
+    def sentenca(self, stmt):
+        return stmt
+
+    @_positioned
+    def declaracao(self, children):
+        target, typename, expr = map(unwrap, children)
+        return DeclarationNode(target.name, typename, expr)
+
+    @_positioned
+    def atribuicao(self, children):
+        target, expr = map(unwrap, children)
+        return AssignmentNode(target.name, expr)
+
+    @_positioned
+    def comando(self, children):
+        name = sys.intern(str(unwrap(children[0]))) if children else None
+        args = unwrap(children[1]) if len(children) > 1 else []
+        if not isinstance(args, list):
+            args = [args]
+        return CommandNode(name, args)
+
+    @_positioned
+    def chamada(self, children):
+        name = sys.intern(str(unwrap(children[0]))) if children else None
+        args = unwrap(children[1]) if len(children) > 1 else []
+        if not isinstance(args, list):
+            args = [args]
+        return CommandNode(name, args)
+
+    def expressao(self, children):
+        return unwrap(children[0])
+    
+    def expr_logica(self, children):
+        if len(children) == 1:
+            return unwrap(children[0])
+        
+        # Handle logical expressions: expr_comp ((AND | OR) expr_comp)*
+        result = unwrap(children[0])
+        i = 1
+        while i < len(children):
+            if i + 1 < len(children):
+                operator = children[i]
+                right = unwrap(children[i + 1])
+                if str(operator) == 'and':
+                    result = _at(LogicalAndNode(result, right), operator)
+                elif str(operator) == 'or':
+                    result = _at(LogicalOrNode(result, right), operator)
+                i += 2
+            else:
+                i += 1
+        return result
+    
+    def expr_comp(self, children):
+        if len(children) == 1:
+            return unwrap(children[0])
+        
+        # Handle comparison expressions: termo_comp ((OP_COMPARACAO) termo_comp)*
+        result = unwrap(children[0])
+        i = 1
+        while i < len(children):
+            if i + 1 < len(children):
+                operator = children[i]
+                right = unwrap(children[i + 1])
+                result = _at(ComparisonNode(result, sys.intern(str(operator)), right), operator)
+                i += 2
+            else:
+                i += 1
+        return result
+    
+    def termo_comp(self, children):
+        if len(children) == 1:
+            return unwrap(children[0])
+        
+        # Handle arithmetic expressions: termo ((PLUS | MINUS) termo)*
+        result = unwrap(children[0])
+        i = 1
+        while i < len(children):
+            if i + 1 < len(children):
+                operator = children[i]
+                right = unwrap(children[i + 1])
+                if str(operator) == '+':
+                    result = _at(SumNode(result, right), operator)
+                elif str(operator) == '-':
+                    result = _at(SubtractionNode(result, right), operator)
+                i += 2
+            else:
+                i += 1
+        return result
+
+    @_positioned
+    def soma(self, children):
+        left, right = map(unwrap, children)
+        return SumNode(left, right)
+
+    @_positioned
+    def subtracao(self, children):
+        left, right = map(unwrap, children)
+        return SubtractionNode(left, right)
+
+    def termo(self, children):
+        if len(children) == 1:
+            return unwrap(children[0])
+        
+        # Handle terms with operators: fator ((STAR | SLASH | PERCENT) fator)*
+        result = unwrap(children[0])
+        i = 1
+        while i < len(children):
+            if i + 1 < len(children):
+                operator = children[i]
+                right = unwrap(children[i + 1])
+                if str(operator) == '*':
+                    result = _at(MultiplicationNode(result, right), operator)
+                elif str(operator) == '/':
+                    result = _at(DivisionNode(result, right), operator)
+                elif str(operator) == '%':
+                    result = _at(ModuloNode(result, right), operator)
+                i += 2
+            else:
+                i += 1
+        return result
+
+    @_positioned
+    def multiplicacao(self, children):
+        left, right = map(unwrap, children)
+        return MultiplicationNode(left, right)
+
+    @_positioned
+    def divisao(self, children):
+        left, right = map(unwrap, children)
+        return DivisionNode(left, right)
+
+    @_positioned
+    def modulo(self, children):
+        left, right = map(unwrap, children)
+        return ModuloNode(left, right)
+
+    def fator(self, val):
+        return self._maybe_transform(val)
+
+    def expr_range(self, children):
+        start_tree, end_tree = map(unwrap, children)
+        start = self._maybe_transform(start_tree)
+        end = self._maybe_transform(end_tree)
+        
+        # Extract the actual numeric values from lists if needed
+        def extract_num(val):
+            if isinstance(val, list):
+                if len(val) == 1:
+                    return extract_num(val[0])
+                return None
+            if hasattr(val, 'value'):
+                val_str = val.value
+                return int(val_str) if val_str.isdigit() else float(val_str)
+            return val
+        
+        start = extract_num(start)
+        end = extract_num(end)
+        
+        # Only allow numbers or identifiers (not CommandNode)
+        if isinstance(start, CommandNode) or isinstance(end, CommandNode):
+            raise ValueError("Loop range must be a number or variable, not a command.")
+        return (start, end)
+
+    @_positioned
+    def loop(self, children):
+        # children[0] is FOR token, children[1] is identificador, children[2] is IN token, children[3] is expr_range, children[4] is comandos
+        varname = unwrap(children[1]).name
+        range_tuple = unwrap(children[3])
+        comandos = unwrap(children[4])
+        # comandos is a list of lists, flatten it
+        if isinstance(comandos, list) and len(comandos) == 1 and isinstance(comandos[0], list):
+            comandos = comandos[0]
+        # Ensure comandos is always a list
+        if not isinstance(comandos, list):
+            comandos = [comandos] if comandos else []
+        if not isinstance(range_tuple, tuple) or len(range_tuple) != 2:
+            raise ValueError("Invalid loop range.")
+        start, end = range_tuple
+        return LoopNode(varname, start, end, comandos)
+
+    @_positioned
+    def loop_while(self, children):
+        # children[0] is WHILE token, children[1] is [condition], children[2] is [commands]
+        condition = unwrap(children[1][0]) if isinstance(children[1], list) and children[1] else unwrap(children[1])
+        commands = unwrap(children[2]) if len(children) > 2 else []
+        # Ensure commands is always a list
+        if not isinstance(commands, list):
+            commands = [commands] if commands else []
+        return WhileNode(condition, commands)
+
+    @_positioned
+    def condicional(self, children):
+        # Optional parts may show up as None placeholders depending on the parser options
+        children = [c for c in children if c is not None]
+        i = 0
+        if is_token(children[i], 'IF'):
+            i += 1
+        condition_expr = unwrap(children[i])
+        i += 1
+        if is_token(children[i], ':'):
+            i += 1
+        then_commands = self._as_command_list(children[i])
+        i += 1
+        elif_branches = []
+        if len(children) > i and isinstance(children[i], tuple) and children[i][0] == 'elif_chain':
+            elif_branches = children[i][1]
+            i += 1
+        else_commands = None
+        if len(children) > i and is_token(children[i], 'ELSE'):
+            i += 1
+            if is_token(children[i], ':'):
+                i += 1
+            else_commands = self._as_command_list(children[i])
+        # Each elif becomes a nested conditional in the else branch of the previous one
+        for elif_condition, elif_commands in reversed(elif_branches):
+            else_commands = [ConditionalNode(elif_condition, elif_commands, else_commands)]
+        return ConditionalNode(condition_expr, then_commands, else_commands)
+
+    @_positioned
+    def paralelo(self, children):
+        # PARALLEL, options, one statement list per task, then the optional handler trees
+        options = next(c for c in children if isinstance(c, dict))
+        tasks = [self.comandos(c) for c in children if isinstance(c, list)]
+        return ParallelBlockNode([task for task in tasks if task], options, *self._parallel_handlers(children))
+
+    @_positioned
+    def paralelo_for(self, children):
+        # PARALLEL FOR identificador IN expr_range options comandos, then the optional handler trees
+        varname = unwrap(children[2]).name
+        start, end = unwrap(children[4])
+        options = children[5]
+        commands = self._as_command_list(children[6]) or []
+        return ParallelForNode(varname, start, end, commands, options, *self._parallel_handlers(children))
+
+    def _parallel_handlers(self, children):
+        handlers = dict(c for c in children if isinstance(c, tuple))
+        return handlers.get('on_success'), handlers.get('on_failure')
+
+    # Clauses come back tagged with their rule, as their parent tells them apart from its other children
+    def elif_chain(self, children):
+        # (ELIF, condition, comandos) triples
+        chain = [c for c in children if not is_token(c, 'ELIF')]
+        return 'elif_chain', [(unwrap(chain[j]), self._as_command_list(chain[j + 1])) for j in range(0, len(chain), 2)]
+
+    def on_success(self, children):
+        return 'on_success', self._as_command_list(children[-1])
+
+    def on_failure(self, children):
+        return 'on_failure', self._as_command_list(children[-1])
+
+    def opcoes(self, children):
+        return dict(children)
+
+    def opcao(self, children):
+        name, value = map(unwrap, children)
+        return name.name, value
+
+    def _as_command_list(self, commands):
+        # Ensure a branch body is always a flat list of statements
+        commands = unwrap(commands)
+        if commands is None:
+            return None
+        if not isinstance(commands, list):
+            commands = [commands]
+        if len(commands) == 1 and isinstance(commands[0], list):
+            commands = commands[0]
+        return commands
+
+    def comparacao(self, children):
+        left, operator, right = map(unwrap, children)
+        return _at(ComparisonNode(left, sys.intern(str(operator)), right), operator)
+
+    def comandos(self, children):
+        # sentenca children are lists of statements, simples children single statements
+        return [stmt for stmt in flatten_statements(children)
+                if hasattr(stmt, 'execute') and not isinstance(stmt, ComparisonNode)]
+
+    def args(self, children):
+        return children
+
+    def numero(self, children):
+        children = unwrap(children)
+        val_str = children.value if hasattr(children, 'value') else str(children)
+        return self._constant(int(val_str) if val_str.isdigit() else float(val_str))
+
+    def identificador(self, children):
+        children = unwrap(children)
+        name = sys.intern(str(children.value) if hasattr(children, 'value') else str(children))
+        ref = self.refs.get(name)
+        if ref is None:
+            ref = self.refs[name] = VarRef(name)
+        return ref
+
+    def tipo(self, children):
+        if not children:
+            return None
+        return sys.intern(str(children[0]))
+
+    def ESCAPED_STRING(self, token):
+        # Remove outer quotes from the string
+        return self._constant(str(token)[1:-1])
+    
+    @_positioned
+    def funcao_str(self, children):
+        expr = unwrap(children[-1])
+        return StrFunctionNode(expr)
+
+    def COMMENT(self, children):
+        # Comments are ignored during execution
+        return None
+
+class _Reduced:
+    # A rule's value on its way to the parent rule, with where the rule starts in the source
+    __slots__ = ('value', 'line', 'column')
+
+    def __init__(self, value, line, column):
+        self.value = value
+        self.line = line
+        self.column = column
+
+class SinglePassBuilder:
+    """Builds the AST while the LALR parser parses, without a parse tree (lark's inline transformer).
+
+    lark calls the callback of a rule as soon as it reduces the rule, with the
+    values its children were reduced to, so each WarpyTransformer method runs
+    once, in the parse, and nothing but the statements built so far is kept.
+    Instead of lark's propagate_positions, which works out start and end
+    positions on tree nodes, a value goes up to its parent with just where
+    its rule starts: at its first child, as on a parse tree (the grammar keeps
+    the first token of every rule whose node is positioned).
+    """
+
+    def __init__(self):
+        self.transformer = None  # the WarpyTransformer of the parse under way
+        self.positioned = {name for name, method in vars(WarpyTransformer).items()
+                           if getattr(method, 'visit_wrapper', None) is _with_position}
+        self.token_types = {name for name in vars(WarpyTransformer) if name.isupper()}
+
+    def __getattr__(self, name):
+        # lark looks up a callback for every rule and terminal; rules it inlines
+        # (leading underscore) and terminals, converted by the parent, are left to it
+        if name.startswith('_') or not name.islower():
+            raise AttributeError(name)
+        method = getattr(WarpyTransformer, name)
+        positioned = name in self.positioned
+        value = self.value
+
+        def reduce(children):
+            line = column = None
+            for child in children:
+                line = child.line
+                if line is not None:
+                    column = child.column
+                    break
+            node = method(self.transformer, [value(c) for c in children])
+            if positioned and line is not None:
+                node.line = line
+                node.column = column
+            return _Reduced(node, line, column)
+        return reduce
+
+    def value(self, child):
+        """What a child of a reduced rule stands for: the AST its rule built, or a (converted) token."""
+        if type(child) is _Reduced:
+            return child.value
+        if child.type in self.token_types:
+            return getattr(self.transformer, child.type)(child)
+        return child
+
+class SlotResolver:
+    """Numbers the variables of a program so engines can keep their values in a flat frame."""
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self.slots = {name: slot for slot, name in enumerate(self.names)}
+
+    def slot_for(self, name):
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.names)
+            self.names.append(name)
+        return slot
+
+    def visit(self, node):
+        if isinstance(node, (list, tuple)):
+            for item in node:
+                self.visit(item)
+        elif isinstance(node, VarRef):
+            node.slot = self.slot_for(node.name)
+        elif isinstance(node, AST_NODES):
+            if isinstance(node, TARGET_NODES):
+                node.slot = self.slot_for(node.varname)
+            for _, value in node_fields(node):
+                self.visit(value)
+
+class CommandBinder:
+    """Attaches every command call to its COMMANDS handler and checks its argument count.
+
+    Given a ParallelChecker, it also has every parallel block checked on the way.
+    """
+
+    def __init__(self, commands, parallel_checker=None):
+        self.commands = commands
+        self.parallel_checker = parallel_checker
+        self.errors = []
+
+    def visit(self, node):
+        if isinstance(node, (list, tuple)):
+            for item in node:
+                self.visit(item)
+        elif isinstance(node, AST_NODES):
+            if isinstance(node, CommandNode):
+                self.bind(node)
+            elif isinstance(node, PARALLEL_NODES) and self.parallel_checker is not None:
+                self.errors.extend(self.parallel_checker.check(node))
+            for _, value in node_fields(node):
+                self.visit(value)
+
+    def bind(self, node):
+        handler = node.handler = self.commands.get(node.name)
+        if handler is not None and not command_accepts(handler, len(node.args)):
+            expected = describe_arity(*command_arity(handler))
+            self.errors.append((node.line, node.column, f"{node.name}() takes {expected}, {len(node.args)} given"))
+
+# Options a parallel block takes: timeout in milliseconds per attempt, retry as extra attempts
+PARALLEL_OPTIONS = {'timeout': (int, float), 'retry': (int,)}
+INPUT_COMMANDS = ('hear_the_emperors_voice',)
+
+def statement_reads(stmt):
+    """Slots a statement reads before it writes its own target, nested bodies excluded."""
+    if isinstance(stmt, CommandNode):
+        return expression_reads(stmt.args)
+    if isinstance(stmt, DeclarationNode):
+        return expression_reads(stmt.callnode)
+    if isinstance(stmt, AssignmentNode):
+        return expression_reads(stmt.expr)
+    if isinstance(stmt, (LoopNode, ParallelForNode)):
+        return expression_reads([stmt.start, stmt.end])
+    if isinstance(stmt, (WhileNode, ConditionalNode)):
+        return expression_reads(stmt.condition)
+    return set()
+
+def expression_reads(value, slots=None):
+    if slots is None:
+        slots = set()
+    if isinstance(value, VarRef):
+        slots.add(value.slot)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            expression_reads(item, slots)
+    elif isinstance(value, AST_NODES):
+        for _, child in node_fields(value):
+            expression_reads(child, slots)
+    return slots
+
+def count_references(node, counts):
+    """Add one to counts[slot] for every read and every write of a variable under node."""
+    if isinstance(node, VarRef):
+        counts[node.slot] = counts.get(node.slot, 0) + 1
+    elif isinstance(node, (list, tuple)):
+        for item in node:
+            count_references(item, counts)
+    elif isinstance(node, AST_NODES):
+        if isinstance(node, TARGET_NODES):
+            counts[node.slot] = counts.get(node.slot, 0) + 1
+        for _, child in node_fields(node):
+            count_references(child, counts)
+    return counts
+
+def _writers(node, found):
+    """First statement writing each slot under node."""
+    if isinstance(node, (list, tuple)):
+        for item in node:
+            _writers(item, found)
+    elif isinstance(node, AST_NODES):
+        if isinstance(node, TARGET_NODES):
+            found.setdefault(node.slot, node)
+        for _, child in node_fields(node):
+            _writers(child, found)
+    return found
+
+def _uses_input(node):
+    if isinstance(node, (list, tuple)):
+        return any(_uses_input(item) for item in node)
+    if isinstance(node, AST_NODES):
+        if isinstance(node, CommandNode) and node.name in INPUT_COMMANDS:
+            return True
+        return any(_uses_input(child) for _, child in node_fields(node))
+    return False
+
+class ParallelChecker:
+    """Refuses parallel blocks whose tasks could see each other's effects.
+
+    Every task runs on its own copy of the variables, so a task may only write
+    variables nothing outside it uses, and must write them before reading them;
+    otherwise the result would depend on which task ran first. Tasks cannot
+    read input either, since nothing orders their reads.
+    """
+
+    def __init__(self, statements):
+        self.counts = count_references(statements, {})
+
+    def check(self, node):
+        errors = []
+        for name, value in node.options.items():
+            kinds = PARALLEL_OPTIONS.get(name)
+            if kinds is None:
+                errors.append((node.line, node.column, f"unknown parallel option '{name}' "
+                                                       f"(expected {' or '.join(PARALLEL_OPTIONS)})"))
+            elif not isinstance(value, kinds) or value < 0:
+                errors.append((node.line, node.column, f"parallel option {name}= takes a non-negative "
+                                                       f"{'whole number' if kinds == (int,) else 'number'}"))
+        if isinstance(node, ParallelBlockNode):
+            bodies = [(task, set()) for task in node.tasks]
+        else:
+            bodies = [(node.commands, {node.slot})]
+        for body, private in bodies:
+            errors.extend(self._check_task(body, private))
+        return errors
+
+    def _check_task(self, body, private):
+        errors = []
+        inside = count_references(body, {})
+        writers = _writers(body, {})
+        for slot, stmt in writers.items():
+            if slot not in private and self.counts.get(slot, 0) > inside[slot]:
+                errors.append((stmt.line, stmt.column, f"parallel task writes '{stmt.varname}', "
+                                                       f"which is also used outside the task"))
+        early = {}
+        self._reads_before_write(body, set(writers) - private, set(private), early)
+        for slot, (stmt, name) in early.items():
+            errors.append((stmt.line, stmt.column, f"parallel task reads '{name}' before writing it, "
+                                                   f"so tasks would depend on each other"))
+        if _uses_input(body):
+            line, column = node_position(body[0]) if body else (None, None)
+            errors.append((line, column, "parallel task reads input, which tasks cannot share"))
+        return errors
+
+    def _reads_before_write(self, statements, watched, assigned, early):
+        """Record in early the watched slots read while not yet certainly assigned; returns what is assigned after."""
+        for stmt in statements:
+            for slot in statement_reads(stmt) & watched:
+                if slot not in assigned and slot not in early:
+                    early[slot] = (stmt, self._name_of(stmt, slot))
+            if isinstance(stmt, (DeclarationNode, AssignmentNode)):
+                assigned = assigned | {stmt.slot}
+            elif isinstance(stmt, (LoopNode, ParallelForNode)):
+                self._reads_before_write(stmt.commands, watched, assigned | {stmt.slot}, early)
+            elif isinstance(stmt, WhileNode):
+                self._reads_before_write(stmt.commands, watched, assigned, early)
+            elif isinstance(stmt, ConditionalNode):
+                then_assigned = self._reads_before_write(stmt.then_commands, watched, assigned, early)
+                else_assigned = self._reads_before_write(stmt.else_commands or [], watched, assigned, early)
+                assigned = then_assigned & else_assigned
+            elif isinstance(stmt, ParallelBlockNode):
+                for task in stmt.tasks:
+                    self._reads_before_write(task, watched, assigned, early)
+        return assigned
+
+    @staticmethod
+    def _name_of(stmt, slot):
+        for _, child in node_fields(stmt):
+            for ref in _refs(child):
+                if ref.slot == slot:
+                    return ref.name
+        return str(slot)
+
+class StreamChecker(ParallelChecker):
+    """ParallelChecker for a program run a top-level statement at a time.
+
+    Its counts cover every statement added so far. The variables parallel
+    tasks wrote are remembered, so a later statement using one is refused
+    as it would have been had the whole program been checked at once.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.task_writes = {}
+
+    def add(self, statements):
+        """Count the references of statements about to run; returns errors for uses of variables tasks wrote."""
+        counts = count_references(statements, {})
+        errors = [(stmt.line, stmt.column, f"parallel task writes '{stmt.varname}', which is also used outside the task")
+                  for slot, stmt in self.task_writes.items() if slot in counts]
+        for slot, count in counts.items():
+            self.counts[slot] = self.counts.get(slot, 0) + count
+        return errors
+
+    def _check_task(self, body, private):
+        for slot, stmt in _writers(body, {}).items():
+            if slot not in private:
+                self.task_writes.setdefault(slot, stmt)
+        return super()._check_task(body, private)
+
+def _refs(value):
+    if isinstance(value, VarRef):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _refs(item)
+    elif isinstance(value, AST_NODES) and not isinstance(value, TARGET_NODES):
+        for _, child in node_fields(value):
+            yield from _refs(child)
+
+def bind_commands(statements, script_name='<string>', parallel_checker=None):
+    """Resolve the commands a program calls before it runs.
+
+    Raises ValueError listing every call with the wrong number of arguments and
+    every parallel block ParallelChecker refuses. parallel_checker replaces the
+    one made for statements alone (see StreamChecker).
+    """
+    binder = CommandBinder(COMMANDS, parallel_checker or ParallelChecker(statements))
+    binder.visit(statements)
+    if binder.errors:
+        raise position_errors(binder.errors, script_name)
+    return statements
+
+def position_errors(errors, script_name='<string>'):
+    """A ValueError listing (line, column, message) errors, each at its script position."""
+    return ValueError("\n".join(f"{format_position(script_name, line, column)}: {message}" if line is not None
+                                 else f"{script_name}: {message}" for line, column, message in errors))
+
+AST_NODES = (
+    CommandNode, DeclarationNode, LoopNode, ConditionalNode, ComparisonNode, WhileNode, AssignmentNode,
+    SumNode, SubtractionNode, MultiplicationNode, DivisionNode, ModuloNode, StrFunctionNode,
+    LogicalAndNode, LogicalOrNode, ParallelBlockNode, ParallelForNode,
+)
+
+# Statements that assign the variable named by their varname
+TARGET_NODES = (DeclarationNode, AssignmentNode, LoopNode, ParallelForNode)
+
+@functools.lru_cache(maxsize=None)
+def _field_names(node_class):
+    return tuple(name for cls in reversed(node_class.__mro__) for name in cls.__dict__.get('__slots__', ()))
+
+def node_fields(node):
+    """(attribute, value) pairs of an AST node, for passes that walk every child."""
+    return [(name, getattr(node, name)) for name in _field_names(type(node))]
+
+# Names of temporaries added by warpy_optimizer; they cannot clash with identifiers
+# and are left out of the variables handed back to the caller
+TEMP_PREFIX = '$'
+
+class ResolvedProgram(list):
+    """Top-level statements plus the variable names, in slot order, their frame needs."""
+
+    def __init__(self, statements, names):
+        super().__init__(statements)
+        self.names = tuple(names)
+
+def resolve_slots(statements, resolver=None):
+    """Give every variable reference and assignment target its frame slot.
+
+    A resolver shared between calls numbers the variables of statements that
+    arrive a few at a time as one program.
+    """
+    if resolver is None:
+        resolver = SlotResolver()
+    resolver.visit(statements)
+    return ResolvedProgram(statements, resolver.names)
+
+class Frame:
+    """Variable values stored by slot; values[i] belongs to names[i].
+
+    Engines work on the flat values list. The name-based methods are for
+    embedding and debugging, and for moving values in and out of a dict.
+    """
+
+    def __init__(self, names, context=None):
+        self.names = tuple(names)
+        self.slots = {name: slot for slot, name in enumerate(self.names)}
+        self.values = [UNBOUND] * len(self.names)
+        if context:
+            self.load(context)
+
+    def load(self, context):
+        for slot, name in enumerate(self.names):
+            if name in context:
+                self.values[slot] = context[name]
+
+    def __contains__(self, name):
+        slot = self.slots.get(name)
+        return slot is not None and self.values[slot] is not UNBOUND
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return self.values[self.slots[name]]
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def grow(self, names, context=None):
+        """Add slots for names past the frame's own, for a program whose variables arrive as it runs.
+
+        names extends the frame's names; new variables take their value from context when it has one.
+        """
+        start = len(self.names)
+        if len(names) == start:
+            return
+        self.names = tuple(names)
+        for slot in range(start, len(names)):
+            name = names[slot]
+            self.slots[name] = slot
+            self.values.append(context[name] if context and name in context else UNBOUND)
+
+    def as_dict(self):
+        return {name: value for name, value in zip(self.names, self.values)
+                if value is not UNBOUND and not name.startswith(TEMP_PREFIX)}
+
+    def store(self, context):
+        context.update(self.as_dict())
+        return context
+
+_PARSERS = {}
+
+# Options of the LALR parser; build_parser.py generates warpy_standalone_parser with the same ones
+LALR_OPTIONS = dict(parser='lalr', start='start', maybe_placeholders=False, propagate_positions=True)
+# Bump whenever build_parser.py changes what the generated module provides
+STANDALONE_VERSION = '2'
+
+def lalr_grammar_key():
+    """Identifies the grammar and options a generated standalone parser was built from."""
+    return source_key(warpy_indented_grammar, repr(sorted(LALR_OPTIONS.items())), STANDALONE_VERSION)
+
+def _standalone_module():
+    # The generated module holds the parse tables ready made, so neither lark nor the grammar analysis is needed
+    try:
+        import warpy_standalone_parser
+    except ImportError:
+        return None
+    if getattr(warpy_standalone_parser, 'GRAMMAR_KEY', None) != lalr_grammar_key():
+        return None  # built from another version of the grammar
+    return warpy_standalone_parser
+
+def _lalr_parser(single_pass):
+    module = _standalone_module()
+    # The single-pass builder tracks positions itself
+    options = dict(transformer=SinglePassBuilder(), propagate_positions=False) if single_pass else {}
+    if module is not None:
+        return module.build_parser(**options)
+    from lark import Lark
+    from warpy_grammar import WarPyIndenter
+    return Lark(warpy_indented_grammar, postlex=WarPyIndenter(), **{**LALR_OPTIONS, **options})
+
+# 'lalr' is the default; 'earley' the legacy fallback
+PARSER_KINDS = ('lalr', 'earley')
+
+def get_parser(parser_kind='lalr', single_pass=True):
+    """Return a cached Lark parser; 'lalr' is the default, 'earley' the legacy fallback.
+
+    The LALR parser comes from warpy_standalone_parser when it has been generated
+    for the current grammar, and is built from the grammar with lark otherwise.
+    With single_pass it builds the AST as it parses (see SinglePassBuilder);
+    the Earley parser always returns a parse tree.
+    """
+    single_pass = single_pass and parser_kind == 'lalr'
+    parser = _PARSERS.get((parser_kind, single_pass))
+    if parser is None:
+        if parser_kind == 'lalr':
+            parser = _lalr_parser(single_pass)
+        elif parser_kind == 'earley':
+            from lark import Lark
+            parser = Lark(warpy_grammar, parser='earley', start='start', propagate_positions=True)
+        else:
+            raise ValueError(f"Unknown parser '{parser_kind}'. Expected one of: {', '.join(PARSER_KINDS)}.")
+        _PARSERS[parser_kind, single_pass] = parser
+    return parser
+
+def flatten_statements(items):
+    # Flatten the AST in case of nested lists
+    for x in items:
+        if isinstance(x, (list, tuple)):
+            yield from flatten_statements(x)
+        else:
+            yield x
+
+def parse_program(code, parser_kind='lalr', single_pass=True, resolver=None):
+    """Parse WarPy40K source and return the flat list of top-level statements.
+
+    The LALR parser builds the statements as it parses; single_pass=False has
+    it build the whole parse tree first and transform it afterwards, which is
+    what the Earley parser always does. resolver is passed to resolve_slots.
+    """
+    if parser_kind == 'lalr' and not code.endswith('\n'):
+        # Every simple statement must be closed by a newline token
+        code += '\n'
+    if single_pass and parser_kind == 'lalr':
+        parser = get_parser(parser_kind)
+        builder = parser.options.transformer
+        builder.transformer = WarpyTransformer()
+        try:
+            statements = builder.value(parser.parse(code))
+        finally:
+            builder.transformer = None
+        return resolve_slots(statements, resolver)
+    parse_tree = get_parser(parser_kind, single_pass=False).parse(code)
+
+    transformer = WarpyTransformer()
+    ast = transformer.transform(parse_tree)
+    return resolve_slots([stmt for stmt in flatten_statements(ast) if hasattr(stmt, 'execute')], resolver)
+
+# Optimization levels of warpy_optimizer; -O1 only applies passes that never change behaviour
+OPT_LEVELS = (0, 1, 2)
+DEFAULT_OPT_LEVEL = 1
+
+def optimize_program(statements, opt_level=DEFAULT_OPT_LEVEL, trace=None):
+    if opt_level == 0 and trace is None:
+        return statements
+    from warpy_optimizer import optimize
+    return optimize(statements, opt_level, trace)
+
+def load_program(script_path: str, parser_kind='lalr', use_cache=True, opt_level=DEFAULT_OPT_LEVEL):
+    """Read a script and return its optimized statements, going through the on-disk cache when enabled."""
+    with open(script_path, 'r') as f:
+        code = f.read()
+    if not use_cache:
+        return optimize_program(parse_program(code, parser_kind), opt_level)
+
+    grammar = warpy_indented_grammar if parser_kind == 'lalr' else warpy_grammar
+    key = source_key(code, AST_VERSION, parser_kind, grammar, f"O{opt_level}")
+    # Each parser and -O level keeps its own entry, so switching between them does not evict the others
+    variant = f"{parser_kind}-O{opt_level}"
+    cache = ProgramCache()
+    program = cache.load(script_path, key, variant)
+    if program is None:
+        program = optimize_program(parse_program(code, parser_kind), opt_level)
+        cache.store(script_path, key, program, variant)
+    return program
+
+ENGINES = ('tree', 'vm', 'closure', 'python')
+
+def prepare_engine(statements, engine='tree', script_name='<string>'):
+    """Compile resolved, bound statements for an engine once and return run(frame).
+
+    The returned function keeps all per-run state in the frame it is given, so it
+    can run any number of times, from several threads at once.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Expected one of: {', '.join(ENGINES)}.")
+    if engine == 'tree':
+        def run(frame):
+            values = frame.values
+            try:
+                for stmt in statements:
+                    stmt.execute(values)
+            except Exception as exc:
+                locate_tree_error(exc, script_name)
+                raise
+    elif engine == 'vm':
+        from warpy_vm import compile_program, run_code
+        code = compile_program(statements)
+
+        def run(frame):
+            run_code(code, frame, script_name)
+    elif engine == 'closure':
+        from warpy_closures import compile_program, run_compiled
+        program = compile_program(statements)
+
+        def run(frame):
+            run_compiled(program, frame, script_name)
+    else:
+        from warpy_transpiler import compile_program
+        program = compile_program(statements, script_name)
+
+        def run(frame):
+            program.run(frame.values)
+    return run
+
+def execute_program(statements, context=None, engine='tree', script_name='<string>', budget=None):
+    """Run parsed statements on the chosen engine and return the final variables as a dict.
+
+    budget, a warpy_budget.Budget, limits the run's loop steps, time and memory.
+    """
+    if context is None:
+        context = {}
+    if not isinstance(statements, ResolvedProgram):
+        statements = resolve_slots(statements)
+    bind_commands(statements, script_name)
+    frame = Frame(statements.names, context)
+    try:
+        run = prepare_engine(statements, engine, script_name)
+        with metered(budget):
+            run(frame)
+    finally:
+        # Variables set before an error are still visible to the caller
+        frame.store(context)
+        flush_output()
+    return context
+
+def run_warpy_script(script_path: str, parser_kind='lalr', use_cache=True, engine='tree', opt_level=DEFAULT_OPT_LEVEL,
+                     budget=None):
+    return execute_program(load_program(script_path, parser_kind, use_cache, opt_level),
+                           engine=engine, script_name=script_path, budget=budget)
@@ -1,4 +1,5 @@
 from lark import Lark, Transformer, v_args
+from lark.indenter import Indenter
 
 # Versão simplificada da gramática sem indentação complexa
 warpy_grammar = r"""
@@ -184,6 +185,11 @@ class WarPyTransformer(Transformer):
                             self._execute(comando)
 
 
-# Classe do indentador não é necessária para esta versão simplificada
-class WarPyIndenter:
-    pass
\ No newline at end of file
+# Pós-lexer que converte a indentação em tokens _INDENT/_DEDENT para o parser LALR
+class WarPyIndenter(Indenter):
+    NL_type = '_NL'
+    OPEN_PAREN_types = ['_LPAR']
+    CLOSE_PAREN_types = ['_RPAR']
+    INDENT_type = '_INDENT'
+    DEDENT_type = '_DEDENT'
+    tab_len = 4
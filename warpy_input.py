@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Input Sources
+hear_the_emperors_voice reads its line from the current input source instead
+of calling input() directly, so a script can be fed from a terminal, a list,
+a file or pipe, or an asyncio queue without patching sys.stdin.
+
+A terminal gets the prompt and a flush of pending output before each read.
+Stdin redirected from a file or pipe still gets the prompt written to stdout
+after the output so far, as input() did; the other sources show no prompt.
+They hand out lines they already hold, so a run that reads many values
+without a prompt costs no system call per value. Like output sinks, the
+current source is per thread. asyncio is imported only by QueueInput, so reading
+stdin does not pay for it at startup.
+"""
+
+from __future__ import annotations
+
+import codecs
+import collections
+import contextlib
+import sys
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from io import IOBase
+
+from warpy_output import flush_output
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class InputSource(ABC):
+    """Supplies the lines a running script reads; raises EOFError when there are no more."""
+
+    # A person is typing: show the prompt and everything printed so far first
+    interactive = False
+
+    @abstractmethod
+    def read_line(self, prompt: str | None = None) -> str:
+        pass
+
+
+class ConsoleInput(InputSource):
+    """Reads from the terminal with input(), showing the prompt."""
+
+    interactive = True
+
+    def read_line(self, prompt: str | None = None) -> str:
+        return input(prompt if prompt else "")
+
+
+class LineInput(InputSource):
+    """Hands out the given lines in order; the prompt is not shown."""
+
+    def __init__(self, lines: Iterable[str]):
+        self._lines = iter(lines)
+
+    def read_line(self, prompt: str | None = None) -> str:
+        line = next(self._lines, None)
+        if line is None:
+            raise EOFError("no more input lines")
+        return str(line)
+
+
+class FileInput(InputSource):
+    """Reads a file, pipe or stream in chunks of up to chunk_size and hands out its lines.
+
+    A chunk is taken with a single read1() when the stream has one, so a pipe
+    whose writer is still running yields whatever has arrived instead of
+    blocking for a full chunk. A path is opened and closed at end of input.
+    With echo_prompt a prompt is written to stdout before the read, as input()
+    writes it when stdin is not a terminal.
+    """
+
+    def __init__(self, file: str | IOBase, encoding: str = 'utf-8', chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 echo_prompt: bool = False):
+        if isinstance(file, str):
+            file = open(file, 'rb')
+            self._owned = True
+        else:
+            # Text streams such as sys.stdin are read through their binary buffer
+            file = getattr(file, 'buffer', file)
+            self._owned = False
+        self._stream = file
+        self._read = getattr(file, 'read1', file.read)
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self.chunk_size = chunk_size
+        self.echo_prompt = echo_prompt
+        self._lines = collections.deque()
+        self._partial = ''
+        self._eof = False
+
+    def _fill(self) -> None:
+        chunk = self._read(self.chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk, final=not chunk)
+        if not chunk:
+            self._eof = True
+            if self._partial:
+                self._lines.append(self._partial)
+                self._partial = ''
+            if self._owned:
+                self._stream.close()
+            return
+        lines = (self._partial + chunk).split('\n')
+        self._partial = lines.pop()
+        self._lines.extend(line[:-1] if line.endswith('\r') else line for line in lines)
+
+    def read_line(self, prompt: str | None = None) -> str:
+        if prompt and self.echo_prompt:
+            # After the lines printed so far; stdout itself is flushed with the next block
+            flush_output()
+            sys.stdout.write(prompt)
+        while not self._lines:
+            if self._eof:
+                raise EOFError("end of input")
+            self._fill()
+        return self._lines.popleft()
+
+
+class QueueInput(InputSource):
+    """Takes lines from an asyncio.Queue that an event loop fills while the script runs.
+
+    The script must run off the loop's thread (e.g. loop.run_in_executor);
+    each read waits for the loop to hand over the next item, at most timeout
+    seconds when one is given. Putting None on the queue ends the input.
+    """
+
+    def __init__(self, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop | None = None,
+                 timeout: float | None = None):
+        import asyncio
+        self.queue = queue
+        self.loop = loop if loop is not None else asyncio.get_running_loop()
+        self.timeout = timeout
+        self._closed = False
+
+    def _on_loop_thread(self) -> bool:
+        import asyncio
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def read_line(self, prompt: str | None = None) -> str:
+        if self._closed:
+            raise EOFError("input queue closed")
+        if self._on_loop_thread():
+            # Waiting here would stop the loop that has to fill the queue
+            raise RuntimeError("QueueInput cannot be read on its own event loop's thread")
+        import asyncio
+        import concurrent.futures
+        future = asyncio.run_coroutine_threadsafe(self.queue.get(), self.loop)
+        try:
+            line = future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise EOFError("no input arrived in time") from None
+        if line is None:
+            self._closed = True
+            raise EOFError("input queue closed")
+        return str(line)
+
+
+class StdinInput(InputSource):
+    """The default source: input() on a terminal, chunked reads showing the prompt when stdin is a file or pipe."""
+
+    def __init__(self):
+        self._source: InputSource | None = None
+
+    def _resolve(self) -> InputSource:
+        if self._source is None:
+            stdin = sys.stdin
+            if stdin is None:
+                self._source = LineInput(())
+            else:
+                isatty = getattr(stdin, 'isatty', None)
+                self._source = (ConsoleInput() if isatty is not None and isatty()
+                                else FileInput(stdin, echo_prompt=True))
+        return self._source
+
+    @property
+    def interactive(self) -> bool:
+        return self._resolve().interactive
+
+    def read_line(self, prompt: str | None = None) -> str:
+        return self._resolve().read_line(prompt)
+
+
+def input_source(spec: str | Iterable[str] | InputSource | None) -> InputSource:
+    """An InputSource from what an embedding program has: a source, or text/lines to feed."""
+    if isinstance(spec, InputSource):
+        return spec
+    if isinstance(spec, str):
+        return LineInput(spec.splitlines())
+    return LineInput(spec or ())
+
+
+class _SourceState(threading.local):
+    source: InputSource = StdinInput()
+
+
+_state = _SourceState()
+
+
+def current_source() -> InputSource:
+    return _state.source
+
+
+def set_source(source: InputSource) -> InputSource:
+    """Make source this thread's input for hear_the_emperors_voice; returns the previous source."""
+    previous, _state.source = _state.source, source
+    return previous
+
+
+@contextlib.contextmanager
+def redirect_input(source: InputSource) -> Iterator[InputSource]:
+    """Read input from source inside the with block, then restore the previous source."""
+    previous = set_source(source)
+    try:
+        yield source
+    finally:
+        set_source(previous)
+
+
+def read_line(prompt: str | None = None) -> str:
+    return _state.source.read_line(prompt)
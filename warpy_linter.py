@@ -2,14 +2,74 @@
 """
 WarPy40K Language Linter
 Checks syntax, validates commands, variables, and provides helpful error messages.
+
+A file is tokenized once, by a single compiled pattern, into one list of
+token strings in which every line ends with a '\n' token; the checks read
+the tokens of a line by index, and expressions are parsed from them by
+precedence climbing. Columns are found when an issue is reported, by
+scanning that line's tokens again, so they are exact without every token
+carrying its position. Variables keep where they were first declared and
+first used, as a line and token index, for the checks made after the last
+line; an issue about the file as a whole (one that cannot be read) has
+line and column 0.
+
+main() lints any number of files, directories (searched recursively for
+.wp40k files) and glob patterns, on a pool of worker processes, and keeps
+the issues found in an on-disk LintCache so files that have not changed
+since the last run are not linted again.
 """
 
+import glob
+import os
+import pickle
 import sys
 import re
+import tempfile
+import time
 from typing import List, Dict, Set, Tuple, Optional
 from dataclasses import dataclass
 from enum import Enum
 
+from warpy_cache import CACHE_DIR_ENV, CACHE_DIR_NAME, source_key
+
+# Bump when a change to the checks changes the issues found in a file, so cached results are dropped
+LINTER_VERSION = '3'
+LINT_SUFFIX = '.wp40k'
+LINT_CACHE_NAME = 'lint.wp40kl'
+LINT_CACHE_MAGIC = b'WP40KL\x01\n'
+# How close to its read a file's mtime has to be for its stat not to be trusted later
+RACY_SECONDS = 2.0
+
+# One token per match: a line end, number, name, string (unterminated ones
+# too), operator or any other character; blanks and comments are skipped
+TOKEN_PATTERN = re.compile(r'[ \t\r\f]*(?:#.*)?(\n|\d+(?:\.\d+)?|[A-Za-z_][A-Za-z0-9_]*|"[^"\n]*"?'
+                           r'|==|!=|<=|>=|\.\.|[<>=+\-*/%:,()]|\S)')
+
+NAME_START = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_')
+DIGITS = frozenset('0123456789')
+
+# How tightly each binary operator binds, loosest first
+LOGICAL, COMPARISON, ADDITIVE, MULTIPLICATIVE = 1, 2, 3, 4
+PRECEDENCE = {'and': LOGICAL, 'or': LOGICAL,
+              '==': COMPARISON, '!=': COMPARISON, '<': COMPARISON, '>': COMPARISON, '<=': COMPARISON, '>=': COMPARISON,
+              '+': ADDITIVE, '-': ADDITIVE, '*': MULTIPLICATIVE, '/': MULTIPLICATIVE, '%': MULTIPLICATIVE}
+# Where the operands of an operator are, in messages (comparisons name their sides)
+OPERAND_CONTEXT = {LOGICAL: '{}', ADDITIVE: 'arithmetic operation (+/-) in {}',
+                   MULTIPLICATIVE: 'arithmetic operation (*//%) in {}'}
+
+# Kinds of the expression nodes that need reporting
+OPERATION, VARIABLE, CALL, GROUP, UNCLOSED_STRING, INVALID, MISSING = (
+    'operation', 'variable', 'call', 'group', 'unclosed_string', 'invalid', 'missing')
+
+
+def _find(tokens: List[str], value: str, start: int, end: int) -> int:
+    """Index of the first value in tokens[start:end], or -1."""
+    try:
+        return tokens.index(value, start, end)
+    except ValueError:
+        return -1
+
+
 class LintSeverity(Enum):
     ERROR = "ERROR"
     WARNING = "WARNING"
@@ -38,17 +98,27 @@ class WarPy40KLinter:
         }
         
         # Valid keywords
-        self.keywords = {'for', 'in', 'while', 'if', 'else', 'dg'}
+        self.keywords = {'for', 'in', 'while', 'if', 'elif', 'else', 'and', 'or', 'dg', 'parallel',
+                         'on_success', 'on_failure'}
+
+        # Types a variable can be declared with
+        self.types = {'dg', 'servitor', 'blob', 'psykers', 'void_shields'}
+
+        # Functions an expression can call: the commands, and str() to turn a value into text
+        self.valid_functions = self.valid_commands | {'str'}
+
+        # Options of parallel blocks: timeout in milliseconds, retry as a whole number
+        self.parallel_options = {'timeout', 'retry'}
         
         # Valid comparison operators
         self.comparison_operators = {'==', '!=', '<', '>', '<=', '>='}
         
         # Valid arithmetic operators
-        self.arithmetic_operators = {'+', '-', '*', '/'}
+        self.arithmetic_operators = {'+', '-', '*', '/', '%'}
         
-        # Track variables and their usage
-        self.declared_variables: Set[str] = set()
-        self.used_variables: Set[str] = set()
+        # Track variables and their usage, each with where it was first seen (see _mark)
+        self.declared_variables: Dict[str, Tuple[int, str, int, int]] = {}
+        self.used_variables: Dict[str, Tuple[int, str, int, int]] = {}
         self.loop_variables: Set[str] = set()
         
         # Track control flow
@@ -59,26 +129,37 @@ class WarPy40KLinter:
         # Issues found
         self.issues: List[LintIssue] = []
 
+        # The line being linted, its number and the index of its first token, for columns
+        self._line = ''
+        self._line_num = 0
+        self._line_start = 0
+
     def lint_file(self, file_path: str) -> List[LintIssue]:
         """Main linting function that processes a WarPy40K file."""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+                source = f.read()
         except FileNotFoundError:
+            self.issues.clear()
             self.issues.append(LintIssue(
-                line=1, column=1, severity=LintSeverity.ERROR,
+                line=0, column=0, severity=LintSeverity.ERROR,
                 message=f"File '{file_path}' not found",
                 code="FILE_NOT_FOUND"
             ))
             return self.issues
         except Exception as e:
+            self.issues.clear()
             self.issues.append(LintIssue(
-                line=1, column=1, severity=LintSeverity.ERROR,
+                line=0, column=0, severity=LintSeverity.ERROR,
                 message=f"Error reading file: {str(e)}",
                 code="FILE_READ_ERROR"
             ))
             return self.issues
 
+        return self.lint_source(source)
+
+    def lint_source(self, source: str) -> List[LintIssue]:
+        """Lint the text of a WarPy40K script."""
         # Reset state for new file
         self.declared_variables.clear()
         self.used_variables.clear()
@@ -88,9 +169,40 @@ class WarPy40KLinter:
         self.in_conditional = False
         self.issues.clear()
 
-        # Process each line
-        for line_num, line in enumerate(lines, 1):
-            self._lint_line(line_num, line.rstrip())
+        # Tokenize the whole file once; every line, the last too, ends with a '\n' token
+        tokens = TOKEN_PATTERN.findall(source + '\n')
+        find_newline = tokens.index
+        issues = self.issues
+        start = 0
+        for line_num, line in enumerate(source.split('\n'), 1):
+            end = find_newline('\n', start)
+            # Blank and comment-only lines have no tokens
+            if end > start:
+                self._line = line
+                self._line_num = line_num
+                self._line_start = start
+
+                # Check for trailing whitespace
+                if line[-1].isspace():
+                    issues.append(LintIssue(
+                        line=line_num, column=len(line.rstrip()) + 1, severity=LintSeverity.WARNING,
+                        message="Trailing whitespace detected",
+                        code="TRAILING_WHITESPACE",
+                        suggestion="Remove trailing spaces"
+                    ))
+
+                # Check line length
+                if len(line) > 120:
+                    issues.append(LintIssue(
+                        line=line_num, column=121, severity=LintSeverity.WARNING,
+                        message="Line too long (over 120 characters)",
+                        code="LINE_TOO_LONG",
+                        suggestion="Break the line into multiple lines"
+                    ))
+
+                # Parse and validate the line
+                self._parse_line(line_num, tokens, start, end)
+            start = end + 1
 
         # Post-processing checks
         self._check_unused_variables()
@@ -99,134 +211,119 @@ class WarPy40KLinter:
 
         return self.issues
 
-    def _lint_line(self, line_num: int, line: str):
-        """Lint a single line of WarPy40K code."""
-        # Skip empty lines
-        if not line.strip():
-            return
+    def _column(self, index: int) -> int:
+        """Column of token index on the line being linted, or just past its last token."""
+        # Positions are only needed for issues, so the line is scanned again rather than
+        # every token of the file carrying one
+        count = index - self._line_start
+        if not count:
+            return len(self._line) - len(self._line.lstrip()) + 1
+        position = 0
+        for match in TOKEN_PATTERN.finditer(self._line + '\n'):
+            if match.group(1) == '\n':
+                break
+            if not count:
+                return match.start(1) + 1
+            count -= 1
+            position = match.end(1)
+        return position + 1
 
-        # Check for comments (now supported in WarPy40K)
-        if line.strip().startswith('#'):
-            return  # Comments are now valid, no warning needed
+    def _mark(self, index: int) -> Tuple[int, str, int, int]:
+        """Where token index of the line being linted is, for _position once the line is done."""
+        return self._line_num, self._line, self._line_start, index
 
-        # Check for trailing whitespace
-        if line.rstrip() != line:
-            self.issues.append(LintIssue(
-                line=line_num, column=len(line.rstrip()) + 1, severity=LintSeverity.WARNING,
-                message="Trailing whitespace detected",
-                code="TRAILING_WHITESPACE",
-                suggestion="Remove trailing spaces"
-            ))
+    def _position(self, mark: Tuple[int, str, int, int]) -> Tuple[int, int]:
+        """Line and column of a _mark."""
+        line_num, self._line, self._line_start, index = mark
+        return line_num, self._column(index)
 
-        # Check line length
-        if len(line) > 120:
-            self.issues.append(LintIssue(
-                line=line_num, column=121, severity=LintSeverity.WARNING,
-                message="Line too long (over 120 characters)",
-                code="LINE_TOO_LONG",
-                suggestion="Break the line into multiple lines"
-            ))
+    def _span(self, start: int, end: int) -> str:
+        """Source text of tokens start to end on the line being linted."""
+        return self._line[self._column(start) - 1:self._column(end) - 1].rstrip()
 
-        # Track loop depth for block ends (dedent simulation)
-        if line.strip() == '':
-            return
-        if line.strip().startswith('for ') or line.strip().startswith('while '):
-            self.loop_depth += 1
-        if line.strip().startswith('endfor') or line.strip().startswith('endwhile'):
-            self.loop_depth = max(0, self.loop_depth - 1)
-
-        # Parse and validate the line
-        self._parse_line(line_num, line)
-
-    def _parse_line(self, line_num: int, line: str):
-        """Parse and validate a line of WarPy40K code."""
-        # Remove inline comments (everything after #)
-        if '#' in line:
-            line = line[:line.find('#')].rstrip()
-        
-        # Skip empty lines after comment removal
-        if not line.strip():
+    def _parse_line(self, line_num: int, tokens: List[str], start: int, end: int):
+        """Parse and validate the tokens of a line of WarPy40K code."""
+        first = tokens[start]
+
+        # Clauses of if-else statements and parallel blocks, with an optional inline body
+        if first in ('else', 'on_success', 'on_failure') and start + 1 < end and tokens[start + 1] == ':':
+            self._validate_statements(line_num, tokens, start + 2, end)
             return
-            
-        stripped = line.strip()
-        
-        # Check for else clause (valid in if-else statements)
-        if stripped == 'else:':
-            return  # Valid syntax, no validation needed
-        
-        # Check for variable declaration
-        if self._is_variable_declaration(stripped):
-            self._validate_variable_declaration(line_num, stripped)
+
+        # Check for parallel block (before assignments: its options contain '=')
+        if first == 'parallel':
+            self._validate_parallel(line_num, tokens, start, end)
             return
 
-        # Check for assignment
-        if '=' in stripped and not stripped.startswith('if') and not stripped.startswith('while'):
-            self._validate_assignment(line_num, stripped)
+        # A name followed by ':' and a type declares a variable, even a reserved one
+        if start + 2 < end and tokens[start + 1] == ':' and tokens[start + 2] in self.types:
+            self._validate_statements(line_num, tokens, start, end)
             return
 
         # Check for loop
-        if stripped.startswith('for '):
-            self._validate_for_loop(line_num, stripped)
+        if first == 'for':
+            self._validate_for_loop(line_num, tokens, start, end)
             return
 
         # Check for while loop
-        if stripped.startswith('while '):
-            self._validate_while_loop(line_num, stripped)
+        if first == 'while':
+            self._validate_while_loop(line_num, tokens, start, end)
             return
 
         # Check for conditional
-        if stripped.startswith('if '):
-            self._validate_conditional(line_num, stripped)
-            return
-
-        # Check for command
-        if '(' in stripped and stripped.endswith(')'):
-            self._validate_command(line_num, stripped)
-            return
-
-        # Check for standalone command (no arguments)
-        if re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*\(\)$', stripped):
-            self._validate_command(line_num, stripped)
-            return
-
-        # Check for multi-command lines (commands separated by spaces)
-        if ' ' in stripped and '(' in stripped:
-            # Try to parse as multiple commands
-            self._parse_multi_commands(line_num, stripped)
-            return
-
-        # Unknown syntax
-        self.issues.append(LintIssue(
-            line=line_num, column=1, severity=LintSeverity.ERROR,
-            message=f"Unknown syntax: '{stripped}'",
-            code="UNKNOWN_SYNTAX",
-            suggestion="Check the WarPy40K syntax documentation"
-        ))
-
-    def _is_variable_declaration(self, line: str) -> bool:
-        """Check if a line is a variable declaration."""
-        return re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*\s*:\s*[a-zA-Z_][a-zA-Z0-9_]*\s*=', line)
+        if first == 'if' or first == 'elif':
+            self._validate_conditional(line_num, tokens, start, end)
+            return
+
+        # Declarations, assignments and commands, one or more on the line
+        self._validate_statements(line_num, tokens, start, end)
+
+    def _validate_statements(self, line_num: int, tokens: List[str], start: int, end: int):
+        """Validate the simple statements (declarations, assignments, commands) in tokens[start:end]."""
+        i = start
+        while i < end:
+            token = tokens[i]
+            following = tokens[i + 1] if i + 1 < end else None
+            if token[0] in NAME_START and following == '(':
+                i = self._validate_command(line_num, tokens, i, end)
+            elif token[0] in NAME_START and following == '=':
+                i = self._validate_assignment(line_num, tokens, i, end)
+            elif token[0] in NAME_START and following == ':':
+                i = self._validate_variable_declaration(line_num, tokens, i, end)
+            elif token[0] == '"' and (len(token) == 1 or token[-1] != '"'):
+                self.issues.append(LintIssue(
+                    line=line_num, column=self._column(i), severity=LintSeverity.ERROR,
+                    message="Invalid string literal",
+                    code="INVALID_STRING",
+                    suggestion="Use format: \"string_content\""
+                ))
+                return
+            else:
+                # Unknown syntax
+                self.issues.append(LintIssue(
+                    line=line_num, column=self._column(i), severity=LintSeverity.ERROR,
+                    message=f"Unknown syntax: '{self._span(i, end)}'",
+                    code="UNKNOWN_SYNTAX",
+                    suggestion="Check the WarPy40K syntax documentation"
+                ))
+                return
 
-    def _validate_variable_declaration(self, line_num: int, line: str):
-        """Validate a variable declaration."""
-        # Extract variable name and type
-        match = re.match(r'^([a-zA-Z_][a-zA-Z0-9_]*)\s*:\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*=', line)
-        if not match:
+    def _validate_variable_declaration(self, line_num: int, tokens: List[str], start: int, end: int) -> int:
+        """Validate a variable declaration; returns the index of the token after it."""
+        var_name = tokens[start]
+        if start + 3 >= end or tokens[start + 3] != '=' or tokens[start + 2] not in self.types:
             self.issues.append(LintIssue(
-                line=line_num, column=1, severity=LintSeverity.ERROR,
+                line=line_num, column=self._column(start), severity=LintSeverity.ERROR,
                 message="Invalid variable declaration syntax",
                 code="INVALID_VAR_DECL",
                 suggestion="Use format: variable_name: type = value"
             ))
-            return
+            return end
 
-        var_name = match.group(1)
-        var_type = match.group(2)
-        
         # Check if variable is already declared
         if var_name in self.declared_variables:
             self.issues.append(LintIssue(
-                line=line_num, column=1, severity=LintSeverity.WARNING,
+                line=line_num, column=self._column(start), severity=LintSeverity.WARNING,
                 message=f"Variable '{var_name}' is already declared",
                 code="DUPLICATE_VAR_DECL",
                 suggestion="Use a different variable name or remove the duplicate declaration"
@@ -235,106 +332,72 @@ class WarPy40KLinter:
         # Check variable name
         if var_name in self.keywords:
             self.issues.append(LintIssue(
-                line=line_num, column=1, severity=LintSeverity.ERROR,
+                line=line_num, column=self._column(start), severity=LintSeverity.ERROR,
                 message=f"'{var_name}' is a reserved keyword",
                 code="RESERVED_KEYWORD",
                 suggestion="Use a different variable name"
             ))
 
-        self.declared_variables.add(var_name)
+        if var_name not in self.declared_variables:
+            self.declared_variables[var_name] = self._mark(start)
 
         # Validate the value
-        value_part = line.split('=', 1)[1].strip()
-        self._validate_expression(line_num, value_part, f"variable '{var_name}' declaration")
+        return self._validate_expression(line_num, tokens, start + 4, end, f"variable '{var_name}' declaration",
+                                         whole=False)
 
-    def _validate_assignment(self, line_num: int, line: str):
-        """Validate an assignment statement."""
-        if '=' not in line:
-            return
-
-        parts = line.split('=', 1)
-        if len(parts) != 2:
-            self.issues.append(LintIssue(
-                line=line_num, column=1, severity=LintSeverity.ERROR,
-                message="Invalid assignment syntax",
-                code="INVALID_ASSIGNMENT",
-                suggestion="Use format: variable = expression"
-            ))
-            return
-
-        var_name = parts[0].strip()
-        expression = parts[1].strip()
+    def _validate_assignment(self, line_num: int, tokens: List[str], start: int, end: int) -> int:
+        """Validate an assignment statement; returns the index of the token after it."""
+        var_name = tokens[start]
 
         # Check if variable is declared
         if var_name not in self.declared_variables and var_name not in self.loop_variables:
             self.issues.append(LintIssue(
-                line=line_num, column=1, severity=LintSeverity.WARNING,
+                line=line_num, column=self._column(start), severity=LintSeverity.WARNING,
                 message=f"Variable '{var_name}' is used before declaration",
                 code="UNDECLARED_VARIABLE",
                 suggestion="Declare the variable first using 'variable_name: dg = initial_value'"
             ))
 
-        self.used_variables.add(var_name)
-        self._validate_expression(line_num, expression, f"assignment to '{var_name}'")
-
-    def _validate_for_loop(self, line_num: int, line: str):
-        """Validate a for loop."""
-        # Check if line contains multiple commands after the for loop
-        if ' ' in line and line.count(' ') > 3:  # More than just "for var in range:"
-            # Extract the for loop part and the commands part
-            colon_pos = line.find(':')
-            if colon_pos == -1:
-                self.issues.append(LintIssue(
-                    line=line_num, column=len(line), severity=LintSeverity.ERROR,
-                    message="For loop must end with ':'",
-                    code="MISSING_COLON",
-                    suggestion="Add ':' at the end of the for loop declaration"
-                ))
-                return
-            
-            for_part = line[:colon_pos + 1]
-            commands_part = line[colon_pos + 1:].strip()
-            
-            # Validate the for loop part
-            self._validate_for_loop_structure(line_num, for_part)
-            
-            # Validate the commands part
-            if commands_part:
-                self._parse_multi_commands(line_num, commands_part)
-        else:
-            # Simple for loop without inline commands
-            self._validate_for_loop_structure(line_num, line)
+        if var_name not in self.used_variables:
+            self.used_variables[var_name] = self._mark(start)
+        return self._validate_expression(line_num, tokens, start + 2, end, f"assignment to '{var_name}'", whole=False)
 
-    def _validate_for_loop_structure(self, line_num: int, line: str):
-        """Validate the structure of a for loop."""
-        # Check basic syntax
-        if not line.endswith(':'):
+    def _validate_for_loop(self, line_num: int, tokens: List[str], start: int, end: int):
+        """Validate a for loop and the commands after its ':' on the same line."""
+        colon = _find(tokens, ':', start, end)
+        if colon < 0:
             self.issues.append(LintIssue(
-                line=line_num, column=len(line), severity=LintSeverity.ERROR,
+                line=line_num, column=self._column(end), severity=LintSeverity.ERROR,
                 message="For loop must end with ':'",
                 code="MISSING_COLON",
                 suggestion="Add ':' at the end of the for loop declaration"
             ))
             return
 
-        # Extract loop parts
-        match = re.match(r'^for\s+([a-zA-Z_][a-zA-Z0-9_]*)\s+in\s+(.+):$', line)
-        if not match:
+        range_end = self._validate_for_loop_structure(line_num, tokens, start, colon)
+        if range_end < colon:
+            self._invalid_expression(line_num, range_end, "for loop end value")
+
+        # Validate the commands part
+        self._validate_statements(line_num, tokens, colon + 1, end)
+
+    def _validate_for_loop_structure(self, line_num: int, tokens: List[str], start: int, end: int) -> int:
+        """Validate 'for variable in start..end' in tokens[start:end]; returns the index after the range."""
+        if end - start < 4 or tokens[start + 2] != 'in' or tokens[start + 1][0] not in NAME_START:
             self.issues.append(LintIssue(
-                line=line_num, column=1, severity=LintSeverity.ERROR,
+                line=line_num, column=self._column(start), severity=LintSeverity.ERROR,
                 message="Invalid for loop syntax",
                 code="INVALID_FOR_LOOP",
                 suggestion="Use format: for variable in start..end:"
             ))
-            return
+            return end
 
-        var_name = match.group(1)
-        range_expr = match.group(2)
+        var_name = tokens[start + 1]
 
         # Check loop variable
         if var_name in self.keywords:
             self.issues.append(LintIssue(
-                line=line_num, column=5, severity=LintSeverity.ERROR,
+                line=line_num, column=self._column(start + 1), severity=LintSeverity.ERROR,
                 message=f"'{var_name}' is a reserved keyword",
                 code="RESERVED_KEYWORD",
                 suggestion="Use a different variable name"
@@ -344,36 +407,82 @@ class WarPy40KLinter:
         self.loop_depth += 1
 
         # Validate range expression
-        if '..' not in range_expr:
+        dots = _find(tokens, '..', start + 3, end)
+        if dots < 0:
             self.issues.append(LintIssue(
-                line=line_num, column=line.find(range_expr) + 1, severity=LintSeverity.ERROR,
+                line=line_num, column=self._column(start + 3), severity=LintSeverity.ERROR,
                 message="Invalid range expression",
                 code="INVALID_RANGE",
                 suggestion="Use format: start..end (e.g., 1..10)"
             ))
-        else:
-            start, end = range_expr.split('..', 1)
-            self._validate_expression(line_num, start.strip(), "for loop start value")
-            self._validate_expression(line_num, end.strip(), "for loop end value")
+            return end
+        self._validate_expression(line_num, tokens, start + 3, dots, "for loop start value")
+        return self._validate_expression(line_num, tokens, dots + 1, end, "for loop end value", whole=False)
+
+    def _validate_parallel(self, line_num: int, tokens: List[str], start: int, end: int):
+        """Validate a parallel block or parallel for header and its options."""
+        colon = _find(tokens, ':', start, end)
+        if colon < 0:
+            self.issues.append(LintIssue(
+                line=line_num, column=self._column(end), severity=LintSeverity.ERROR,
+                message="Parallel block must end with ':'",
+                code="MISSING_COLON",
+                suggestion="Add ':' at the end of the parallel block declaration"
+            ))
+            return
+
+        # Options follow the range of a parallel for, or the keyword of a parallel block
+        i = start + 1
+        if i < colon and tokens[i] == 'for':
+            i = self._validate_for_loop_structure(line_num, tokens, i, colon)
+        while i < colon:
+            name = tokens[i]
+            if not (name[0] in NAME_START and i + 1 < colon and tokens[i + 1] == '='):
+                self.issues.append(LintIssue(
+                    line=line_num, column=self._column(i), severity=LintSeverity.ERROR,
+                    message="Invalid parallel block syntax",
+                    code="INVALID_PARALLEL",
+                    suggestion="Use format: parallel [timeout=MS] [retry=N]: or parallel for variable in start..end:"
+                ))
+                break
+            # The value runs to the next option or the ':'
+            value = i + 2
+            i = value
+            while i < colon and not (i + 1 < colon and tokens[i + 1] == '=' and tokens[i][0] in NAME_START):
+                i += 1
+            if name not in self.parallel_options:
+                self.issues.append(LintIssue(
+                    line=line_num, column=self._column(value - 2), severity=LintSeverity.ERROR,
+                    message=f"Unknown parallel option '{name}'",
+                    code="UNKNOWN_PARALLEL_OPTION",
+                    suggestion="Use timeout=MILLISECONDS or retry=COUNT"
+                ))
+            elif i != value + 1 or not (tokens[value].isdigit() if name == 'retry' else tokens[value][0] in DIGITS):
+                self.issues.append(LintIssue(
+                    line=line_num, column=self._column(value), severity=LintSeverity.ERROR,
+                    message=f"Invalid value for parallel option '{name}'",
+                    code="INVALID_PARALLEL_OPTION",
+                    suggestion="Use a non-negative number (retry takes a whole number)"
+                ))
+
+        # A parallel for may run its commands on the same line
+        self._validate_statements(line_num, tokens, colon + 1, end)
 
-    def _validate_while_loop(self, line_num: int, line: str):
+    def _validate_while_loop(self, line_num: int, tokens: List[str], start: int, end: int):
         """Validate a while loop."""
-        if not line.endswith(':'):
+        colon = _find(tokens, ':', start, end)
+        if colon < 0:
             self.issues.append(LintIssue(
-                line=line_num, column=len(line), severity=LintSeverity.ERROR,
+                line=line_num, column=self._column(end), severity=LintSeverity.ERROR,
                 message="While loop must end with ':'",
                 code="MISSING_COLON",
                 suggestion="Add ':' at the end of the while loop declaration"
             ))
             return
 
-        # Extract condition
-        condition_start = line.find('while ') + 6
-        condition = line[condition_start:-1].strip()
-
-        if not condition:
+        if colon == start + 1:
             self.issues.append(LintIssue(
-                line=line_num, column=condition_start, severity=LintSeverity.ERROR,
+                line=line_num, column=self._column(colon), severity=LintSeverity.ERROR,
                 message="While loop must have a condition",
                 code="MISSING_CONDITION",
                 suggestion="Add a condition (e.g., while x < 10:)"
@@ -381,295 +490,238 @@ class WarPy40KLinter:
             return
 
         self.loop_depth += 1
-        self._validate_condition(line_num, condition, "while loop")
-
-    def _validate_conditional(self, line_num: int, line: str):
-        """Validate an if statement."""
-        if not line.endswith(':'):
+        self._validate_expression(line_num, tokens, start + 1, colon, "while loop")
+        self._validate_statements(line_num, tokens, colon + 1, end)
+
+    def _validate_conditional(self, line_num: int, tokens: List[str], start: int, end: int):
+        """Validate an if or elif statement."""
+        statement = "If statement" if tokens[start] == 'if' else "Elif statement"
+        colon = _find(tokens, ':', start, end)
+        if colon < 0:
             self.issues.append(LintIssue(
-                line=line_num, column=len(line), severity=LintSeverity.ERROR,
-                message="If statement must end with ':'",
+                line=line_num, column=self._column(end), severity=LintSeverity.ERROR,
+                message=f"{statement} must end with ':'",
                 code="MISSING_COLON",
-                suggestion="Add ':' at the end of the if statement"
+                suggestion=f"Add ':' at the end of the {statement.lower()}"
             ))
             return
 
-        # Extract condition
-        condition_start = line.find('if ') + 3
-        condition = line[condition_start:-1].strip()
-
-        if not condition:
+        if colon == start + 1:
             self.issues.append(LintIssue(
-                line=line_num, column=condition_start, severity=LintSeverity.ERROR,
-                message="If statement must have a condition",
+                line=line_num, column=self._column(colon), severity=LintSeverity.ERROR,
+                message=f"{statement} must have a condition",
                 code="MISSING_CONDITION",
                 suggestion="Add a condition (e.g., if x == 1:)"
             ))
             return
 
         self.in_conditional = True
-        self._validate_condition(line_num, condition, "if statement")
-
-    def _validate_command(self, line_num: int, line: str):
-        """Validate a command call."""
-        # Extract command name
-        match = re.match(r'^([a-zA-Z_][a-zA-Z0-9_]*)\s*\(', line)
-        if not match:
-            self.issues.append(LintIssue(
-                line=line_num, column=1, severity=LintSeverity.ERROR,
-                message="Invalid command syntax",
-                code="INVALID_COMMAND",
-                suggestion="Use format: command_name() or command_name(arguments)"
-            ))
-            return
+        self._validate_expression(line_num, tokens, start + 1, colon, statement.lower())
+        self._validate_statements(line_num, tokens, colon + 1, end)
 
-        command_name = match.group(1)
+    def _validate_command(self, line_num: int, tokens: List[str], start: int, end: int) -> int:
+        """Validate a command call; returns the index of the token after it."""
+        command_name = tokens[start]
 
         # Check if command exists
         if command_name not in self.valid_commands:
             self.issues.append(LintIssue(
-                line=line_num, column=1, severity=LintSeverity.ERROR,
+                line=line_num, column=self._column(start), severity=LintSeverity.ERROR,
                 message=f"Unknown command '{command_name}'",
                 code="UNKNOWN_COMMAND",
                 suggestion=f"Available commands: {', '.join(sorted(self.valid_commands))}"
             ))
 
+        args, i, closed = self._parse_arguments(tokens, start + 2, end)
+        self._validate_arguments(line_num, args, f"command '{command_name}'")
+
         # Check parentheses balance
-        if not line.endswith(')'):
+        if not closed:
             self.issues.append(LintIssue(
-                line=line_num, column=len(line), severity=LintSeverity.ERROR,
+                line=line_num, column=self._column(i), severity=LintSeverity.ERROR,
                 message="Missing closing parenthesis",
                 code="MISSING_PARENTHESIS",
                 suggestion="Add ')' at the end of the command"
             ))
-            return
-
-        # Extract arguments
-        args_start = line.find('(') + 1
-        args_end = line.rfind(')')
-        args_str = line[args_start:args_end].strip()
-
-        if args_str:
-            self._validate_arguments(line_num, args_str)
-
-    def _validate_arguments(self, line_num: int, args_str: str):
-        """Validate command arguments."""
-        # Simple argument validation - can be enhanced
-        if args_str:
-            # Check for string literals
-            if '"' in args_str:
-                # Validate string literal syntax
-                if not re.match(r'^"[^"]*"$', args_str.strip()):
-                    self.issues.append(LintIssue(
-                        line=line_num, column=args_str.find('"') + 1, severity=LintSeverity.ERROR,
-                        message="Invalid string literal",
-                        code="INVALID_STRING",
-                        suggestion="Use format: \"string_content\""
-                    ))
-            else:
-                # Check for variable references
-                var_name = args_str.strip()
-                if var_name and var_name not in self.declared_variables and var_name not in self.loop_variables:
-                    self.issues.append(LintIssue(
-                        line=line_num, column=args_str.find(var_name) + 1, severity=LintSeverity.WARNING,
-                        message=f"Variable '{var_name}' is used but not declared",
-                        code="UNDECLARED_VARIABLE",
-                        suggestion="Declare the variable first or use a string literal"
-                    ))
-
-    def _validate_expression(self, line_num: int, expr: str, context: str):
-        """Recursively validate an arithmetic expression with correct precedence and parentheses."""
-        # Remove inline comments
-        if '#' in expr:
-            expr = expr[:expr.find('#')].rstrip()
-        expr = expr.strip()
-        if not expr:
-            return
-
-        # Parentheses: recursively validate inside
-        if expr.startswith('(') and expr.endswith(')'):
-            # Check for matching parentheses
-            depth = 0
-            for i, c in enumerate(expr):
-                if c == '(': depth += 1
-                elif c == ')': depth -= 1
-                if depth == 0 and i != len(expr) - 1:
-                    break
-            else:
-                # Parentheses wrap the whole expression
-                return self._validate_expression(line_num, expr[1:-1], f"parenthesized expression in {context}")
-
-        # Operator precedence: lowest to highest
-        # 1. +, -
-        # 2. *, /, %
-        def split_outside_parens(s, ops):
-            parts = []
-            depth = 0
-            last = 0
-            for i, c in enumerate(s):
-                if c == '(': depth += 1
-                elif c == ')': depth -= 1
-                elif depth == 0 and any(s.startswith(op, i) for op in ops):
-                    for op in ops:
-                        if s.startswith(op, i):
-                            parts.append((s[last:i].strip(), op))
-                            last = i + len(op)
-                            break
-            parts.append((s[last:].strip(), None))
-            return parts
-
-        # Try +, - first
-        parts = split_outside_parens(expr, ['+', '-'])
-        if len(parts) > 1:
-            for part, op in parts:
-                self._validate_expression(line_num, part, f"arithmetic operation (+/-) in {context}")
-            return
-        # Then *, /, %
-        parts = split_outside_parens(expr, ['*', '/', '%'])
-        if len(parts) > 1:
-            for part, op in parts:
-                self._validate_expression(line_num, part, f"arithmetic operation (*//%) in {context}")
-            return
-
-        # Number
-        if re.match(r'^\d+(\.\d+)?$', expr):
-            return
-        # String literal
-        if re.match(r'^"[^"]*"$', expr):
-            return
-        # Variable
-        if re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', expr):
-            var_name = expr
-            if var_name not in self.declared_variables and var_name not in self.loop_variables:
-                self.issues.append(LintIssue(
-                    line=line_num, column=1, severity=LintSeverity.WARNING,
-                    message=f"Variable '{var_name}' is used but not declared in {context}",
-                    code="UNDECLARED_VARIABLE",
-                    suggestion="Declare the variable first"
-                ))
-            self.used_variables.add(var_name)
-            return
-        # Function call
-        if re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*\(\)$', expr):
-            func_name = expr[:-2]
-            if func_name not in self.valid_commands:
-                self.issues.append(LintIssue(
-                    line=line_num, column=1, severity=LintSeverity.WARNING,
-                    message=f"Unknown function '{func_name}' in {context}",
-                    code="UNKNOWN_FUNCTION",
-                    suggestion=f"Available functions: {', '.join(sorted(self.valid_commands))}"
-                ))
-            return
-        # Function call with arguments (allow nested parentheses and whitespace)
-        if re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*\(.*\)$', expr):
-            func_name = expr[:expr.find('(')]
-            if func_name not in self.valid_commands:
-                self.issues.append(LintIssue(
-                    line=line_num, column=1, severity=LintSeverity.WARNING,
-                    message=f"Unknown function '{func_name}' in {context}",
-                    code="UNKNOWN_FUNCTION",
-                    suggestion=f"Available functions: {', '.join(sorted(self.valid_commands))}"
-                ))
-            # Validate arguments (best effort: split on commas not inside quotes or parens)
-            args_str = expr[expr.find('(')+1:expr.rfind(')')]
-            if args_str.strip():
-                # Simple split for now; could be improved for nested
-                self._validate_arguments(line_num, args_str)
-            return
-        # Comparison or logical
-        if any(op in expr for op in self.comparison_operators) or re.search(r'\b(and|or)\b', expr):
-            return
-        # If we get here, it's an unknown expression pattern
+            return end
+        return i
+
+    def _validate_arguments(self, line_num: int, args: List, context: str):
+        """Report the problems _parse_arguments found in the arguments of a call."""
+        for arg in args:
+            if arg is not None:
+                self._check_expression(line_num, arg, context)
+
+    def _validate_expression(self, line_num: int, tokens: List[str], start: int, end: int, context: str,
+                             whole: bool = True) -> int:
+        """Validate the expression starting at tokens[start]; returns the index of the token after it.
+
+        With whole, the expression must take up all of tokens[start:end];
+        otherwise it ends where the tokens stop forming one.
+        """
+        if start >= end:
+            self.issues.append(LintIssue(
+                line=line_num, column=self._column(start), severity=LintSeverity.ERROR,
+                message=f"Empty expression in {context}",
+                code="EMPTY_EXPRESSION",
+                suggestion="Provide a valid expression"
+            ))
+            return start
+        node, i = self._parse_expression(tokens, start, end)
+        if node is not None:
+            self._check_expression(line_num, node, context)
+        if whole and i < end:
+            self._invalid_expression(line_num, i, context)
+        return i
+
+    def _invalid_expression(self, line_num: int, index: int, context: str):
         self.issues.append(LintIssue(
-            line=line_num, column=1, severity=LintSeverity.ERROR,
+            line=line_num, column=self._column(index), severity=LintSeverity.ERROR,
             message=f"Invalid expression in {context}",
             code="INVALID_EXPRESSION",
             suggestion="Use numbers, strings, variables, function calls, arithmetic operations, or valid comparisons"
         ))
 
-    def _validate_condition(self, line_num: int, condition: str, context: str):
-        """Validate a condition expression, supporting arithmetic, comparisons, and logical 'and'/'or'."""
-        condition = condition.strip()
-        if not condition:
+    # The expression parser records variable use as it goes and returns a
+    # tree of only what needs reporting, None where everything is valid;
+    # _check_expression reports it with the context it was found in.
+
+    def _parse_expression(self, tokens: List[str], i: int, end: int, min_precedence: int = 1) -> Tuple[object, int]:
+        """Parse binary operators binding at least as tightly as min_precedence, from tokens[i]."""
+        node, i = self._parse_operand(tokens, i, end)
+        if i >= end or tokens[i] not in PRECEDENCE:
+            return node, i
+        while i < end:
+            precedence = PRECEDENCE.get(tokens[i], 0)
+            if precedence < min_precedence:
+                break
+            operands = [node]
+            while i < end and PRECEDENCE.get(tokens[i]) == precedence:
+                operand, i = self._parse_expression(tokens, i + 1, end, precedence + 1)
+                operands.append(operand)
+            node = (OPERATION, precedence, operands) if any(operands) else None
+        return node, i
+
+    def _parse_operand(self, tokens: List[str], i: int, end: int) -> Tuple[object, int]:
+        if i >= end:
+            return (MISSING, i), i
+        token = tokens[i]
+        first = token[0]
+        if first in NAME_START and token not in PRECEDENCE:
+            if i + 1 < end and tokens[i + 1] == '(':
+                args, j, closed = self._parse_arguments(tokens, i + 2, end)
+                if token in self.valid_functions and closed and not any(args):
+                    return None, j
+                return (CALL, i, token, args, None if closed else j), j
+            if token not in self.used_variables:
+                self.used_variables[token] = self._mark(i)
+            if token in self.declared_variables or token in self.loop_variables:
+                return None, i + 1
+            return (VARIABLE, i, token), i + 1
+        if first in DIGITS:
+            return None, i + 1
+        if first == '"':
+            return (None if len(token) > 1 and token[-1] == '"' else (UNCLOSED_STRING, i)), i + 1
+        if token == '(':
+            inner, j = self._parse_expression(tokens, i + 1, end)
+            if j < end and tokens[j] == ')':
+                return (None if inner is None else (GROUP, i, inner, None)), j + 1
+            return (GROUP, i, inner, j), j
+        return (INVALID, i), i + 1
+
+    def _parse_arguments(self, tokens: List[str], i: int, end: int) -> Tuple[List, int, bool]:
+        """Parse comma-separated arguments from tokens[i]; returns them, the index after the ')' and
+        whether there was one."""
+        args = []
+        if i < end and tokens[i] == ')':
+            return args, i + 1, True
+        while True:
+            arg, i = self._parse_expression(tokens, i, end)
+            args.append(arg)
+            if i < end and tokens[i] == ',':
+                i += 1
+            else:
+                break
+        if i < end and tokens[i] == ')':
+            return args, i + 1, True
+        return args, i, False
+
+    def _check_expression(self, line_num: int, node: Tuple, context: str):
+        """Report what _parse_expression found wrong in an expression."""
+        kind = node[0]
+        if kind == OPERATION:
+            precedence, operands = node[1], node[2]
+            for position, operand in enumerate(operands):
+                if operand is None:
+                    continue
+                if precedence == COMPARISON:
+                    side = "left side" if position == 0 else "right side"
+                    self._check_expression(line_num, operand, f"{side} of {context}")
+                else:
+                    self._check_expression(line_num, operand, OPERAND_CONTEXT[precedence].format(context))
+        elif kind == VARIABLE:
             self.issues.append(LintIssue(
-                line=line_num, column=1, severity=LintSeverity.ERROR,
-                message=f"Empty condition in {context}",
-                code="EMPTY_CONDITION",
-                suggestion="Provide a valid condition (e.g., if x == 1:)"
+                line=line_num, column=self._column(node[1]), severity=LintSeverity.WARNING,
+                message=f"Variable '{node[2]}' is used but not declared in {context}",
+                code="UNDECLARED_VARIABLE",
+                suggestion="Declare the variable first"
             ))
-            return
-        # Handle parentheses
-        if condition.startswith('(') and condition.endswith(')'):
-            depth = 0
-            for i, c in enumerate(condition):
-                if c == '(': depth += 1
-                elif c == ')': depth -= 1
-                if depth == 0 and i != len(condition) - 1:
-                    break
-            else:
-                return self._validate_condition(line_num, condition[1:-1], context)
-        # Handle logical 'and'/'or'
-        tokens = re.split(r'\b(and|or)\b', condition)
-        if len(tokens) > 1:
-            for i in range(0, len(tokens), 2):
-                cond = tokens[i].strip()
-                if cond:
-                    self._validate_condition(line_num, cond, context)
-            return
-        # Handle comparisons
-        for op in self.comparison_operators:
-            if op in condition:
-                parts = condition.split(op, 1)
-                if len(parts) == 2:
-                    left, right = parts[0].strip(), parts[1].strip()
-                    self._validate_expression(line_num, left, f"left side of {context}")
-                    self._validate_expression(line_num, right, f"right side of {context}")
-                    return
-        # If no comparison operator found, allow arithmetic, variable, or number as condition
-        self._validate_expression(line_num, condition, context)
-
-    def _parse_multi_commands(self, line_num: int, line: str):
-        """Parse a line that contains multiple commands."""
-        # Simple approach: split by spaces and try to identify commands
-        parts = line.split()
-        current_command = ""
-        paren_count = 0
-        
-        for part in parts:
-            current_command += part + " "
-            paren_count += part.count('(') - part.count(')')
-            
-            if paren_count == 0 and current_command.strip():
-                # Complete command found
-                self._validate_command(line_num, current_command.strip())
-                current_command = ""
-        
-        # If there's remaining content, it might be incomplete
-        if current_command.strip():
+        elif kind == CALL:
+            _, index, func_name, args, missing = node
+            if func_name not in self.valid_functions:
+                self.issues.append(LintIssue(
+                    line=line_num, column=self._column(index), severity=LintSeverity.WARNING,
+                    message=f"Unknown function '{func_name}' in {context}",
+                    code="UNKNOWN_FUNCTION",
+                    suggestion=f"Available functions: {', '.join(sorted(self.valid_commands))}"
+                ))
+            self._validate_arguments(line_num, args, f"call to '{func_name}' in {context}")
+            if missing is not None:
+                self._missing_parenthesis(line_num, missing)
+        elif kind == GROUP:
+            _, index, inner, missing = node
+            if inner is not None:
+                self._check_expression(line_num, inner, f"parenthesized expression in {context}")
+            if missing is not None:
+                self._missing_parenthesis(line_num, missing)
+        elif kind == UNCLOSED_STRING:
             self.issues.append(LintIssue(
-                line=line_num, column=1, severity=LintSeverity.WARNING,
-                message=f"Incomplete command: '{current_command.strip()}'",
-                code="INCOMPLETE_COMMAND",
-                suggestion="Check for missing parentheses or syntax errors"
+                line=line_num, column=self._column(node[1]), severity=LintSeverity.ERROR,
+                message="Invalid string literal",
+                code="INVALID_STRING",
+                suggestion="Use format: \"string_content\""
             ))
+        else:
+            # INVALID or MISSING: an operand that is not one, or none where one belongs
+            self._invalid_expression(line_num, node[1], context)
+
+    def _missing_parenthesis(self, line_num: int, index: int):
+        self.issues.append(LintIssue(
+            line=line_num, column=self._column(index), severity=LintSeverity.ERROR,
+            message="Missing closing parenthesis",
+            code="MISSING_PARENTHESIS",
+            suggestion="Add ')' to close the parenthesis"
+        ))
 
     def _check_unused_variables(self):
-        """Check for unused variables."""
-        for var in self.declared_variables:
+        """Check for unused variables, at their declarations."""
+        for var, mark in self.declared_variables.items():
             if var not in self.used_variables:
+                line_num, column = self._position(mark)
                 self.issues.append(LintIssue(
-                    line=1, column=1, severity=LintSeverity.WARNING,
+                    line=line_num, column=column, severity=LintSeverity.WARNING,
                     message=f"Variable '{var}' is declared but never used",
                     code="UNUSED_VARIABLE",
                     suggestion="Remove the variable declaration or use it in your code"
                 ))
 
     def _check_undeclared_variables(self):
-        """Check for undeclared variables."""
-        for var in self.used_variables:
+        """Check for undeclared variables, at their first use."""
+        for var, mark in self.used_variables.items():
             if var not in self.declared_variables and var not in self.loop_variables:
+                line_num, column = self._position(mark)
                 self.issues.append(LintIssue(
-                    line=1, column=1, severity=LintSeverity.ERROR,
+                    line=line_num, column=column, severity=LintSeverity.ERROR,
                     message=f"Variable '{var}' is used but never declared",
                     code="UNDECLARED_VARIABLE",
                     suggestion="Declare the variable first using 'variable_name: dg = initial_value'"
@@ -703,47 +755,219 @@ class WarPy40KLinter:
             if issue_list:
                 print(f"{symbol} {severity.value}S ({len(issue_list)}):")
                 for issue in issue_list:
-                    print(f"  Line {issue.line}, Col {issue.column}: {issue.message}")
+                    where = f"Line {issue.line}, Col {issue.column}" if issue.line else "File"
+                    print(f"  {where}: {issue.message}")
                     print(f"    Code: {issue.code}")
                     if issue.suggestion:
                         print(f"    Suggestion: {issue.suggestion}")
                     print()
                 print()
 
-def main():
-    """Main function to run the linter."""
-    if len(sys.argv) < 2:
-        print("Usage: python warpy_linter.py <file.wp40k>")
-        print("       python warpy_linter.py --help")
-        sys.exit(1)
-
-    if sys.argv[1] == "--help":
-        print("WarPy40K Language Linter")
-        print("Checks syntax, validates commands, variables, and provides helpful error messages.")
-        print()
-        print("Usage: python warpy_linter.py <file.wp40k>")
-        print()
-        print("The linter checks for:")
-        print("  - Syntax errors and invalid commands")
-        print("  - Undeclared and unused variables")
-        print("  - Invalid loop and conditional structures")
-        print("  - String literal syntax")
-        print("  - Code style issues (line length, whitespace)")
-        print()
-        print("Exit codes:")
-        print("  0 - No errors found")
-        print("  1 - Errors found")
-        sys.exit(0)
 
-    file_path = sys.argv[1]
+
+def _fingerprint(stat: os.stat_result) -> Tuple[int, int]:
+    return stat.st_mtime_ns, stat.st_size
+
+
+class LintCache:
+    """Issues found by earlier runs, on disk, so unchanged files are not linted again.
+
+    Issues are kept by source_key(text, LINTER_VERSION), the hash of a
+    file's text and of the linter version. Each file linted also keeps its
+    stat fingerprint (mtime and size) and the hash it had, so an unchanged
+    file is found by its stat alone, without being read; a touched file
+    with the same text is read and hashed, but not linted. A file written
+    in the RACY_SECONDS before it was read keeps no fingerprint (a second
+    write in the same mtime tick would not change it) and is hashed next time.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        directory = cache_dir or os.environ.get(CACHE_DIR_ENV) or CACHE_DIR_NAME
+        self.path = os.path.join(directory, LINT_CACHE_NAME)
+        self.files: Dict[str, Tuple[Optional[Tuple[int, int]], str]] = {}
+        self.results: Dict[str, List[LintIssue]] = {}
+        self.changed = False
+        try:
+            with open(self.path, 'rb') as f:
+                if f.read(len(LINT_CACHE_MAGIC)) != LINT_CACHE_MAGIC:
+                    return
+                version, files, results = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError, TypeError):
+            return
+        if version == LINTER_VERSION:
+            self.files, self.results = files, results
+
+    def lookup(self, file_path: str, stat: os.stat_result) -> Optional[List[LintIssue]]:
+        """The issues of a file whose stat has not changed since it was linted, or None."""
+        entry = self.files.get(os.path.abspath(file_path))
+        if entry is None or entry[0] != _fingerprint(stat):
+            return None
+        return self.results.get(entry[1])
+
+    def lookup_key(self, file_path: str, stat: os.stat_result, key: str) -> Optional[List[LintIssue]]:
+        """The issues of a file with this key, or None; a hit takes the file's new fingerprint."""
+        issues = self.results.get(key)
+        if issues is not None:
+            self.record(file_path, stat, key, issues)
+        return issues
+
+    def record(self, file_path: str, stat: os.stat_result, key: str, issues: List[LintIssue], read_at: float = None):
+        racy = stat.st_mtime >= (read_at if read_at is not None else time.time()) - RACY_SECONDS
+        self.files[os.path.abspath(file_path)] = (None if racy else _fingerprint(stat), key)
+        self.results[key] = issues
+        self.changed = True
+
+    def save(self) -> bool:
+        """Write the cache atomically if it changed; returns False when it cannot be written."""
+        if not self.changed:
+            return True
+        # Results no file has any more can never be looked up again
+        keys = {key for _, key in self.files.values()}
+        results = {key: issues for key, issues in self.results.items() if key in keys}
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(LINT_CACHE_MAGIC)
+                    pickle.dump((LINTER_VERSION, self.files, results), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except (OSError, pickle.PicklingError):
+            return False
+        self.changed = False
+        return True
+
+
+def expand_paths(paths: List[str]) -> List[str]:
+    """The .wp40k files named by paths: files as given, directories searched recursively, glob patterns expanded.
+
+    Files come in the order of the paths, each directory's and pattern's in
+    sorted order, each once. A path that matches nothing is kept, to be
+    reported as not found.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, dirs, names in os.walk(path):
+                # The cache and hidden directories (.git and the like) hold no scripts to lint
+                dirs[:] = [d for d in dirs if d != CACHE_DIR_NAME and not d.startswith('.')]
+                found.extend(os.path.join(root, name) for name in names if name.endswith(LINT_SUFFIX))
+            files.extend(sorted(found))
+        elif glob.has_magic(path):
+            matches = sorted(glob.glob(path, recursive=True))
+            files.extend(expand_paths(matches) if matches else [path])
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def _lint_path(file_path: str) -> Tuple[str, Optional[os.stat_result], Optional[str], float, List[LintIssue]]:
+    """Lint one file: its path, its stat taken before reading it, its cache key (None when it could
+    not be read), when it was read, and its issues."""
     linter = WarPy40KLinter()
-    issues = linter.lint_file(file_path)
+    read_at = time.time()
+    try:
+        stat = os.stat(file_path)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            source = f.read()
+    except Exception:
+        # lint_file reports why the file cannot be read
+        return file_path, None, None, read_at, linter.lint_file(file_path)
+    return file_path, stat, source_key(source, LINTER_VERSION), read_at, linter.lint_source(source)
+
+
+def lint_paths(paths: List[str], jobs: Optional[int] = None,
+               cache: Optional[LintCache] = None) -> List[Tuple[str, List[LintIssue]]]:
+    """Lint every file expand_paths finds; returns (path, issues) in the order of the files.
+
+    Files the cache has the issues of are not linted again; the others are
+    linted on a pool of jobs worker processes (None: one per core), or in
+    this process for jobs=1 or a single file. The cache is updated but not saved.
+    """
+    files = expand_paths(paths)
+    results: Dict[str, List[LintIssue]] = {}
+    pending = []
+    for file_path in files:
+        issues = None
+        if cache is not None:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                stat = None
+            if stat is not None:
+                issues = cache.lookup(file_path, stat)
+                if issues is None and cache.results:
+                    # Touched but maybe not changed: its text's hash may be known
+                    try:
+                        with open(file_path, 'r', encoding='utf-8') as f:
+                            key = source_key(f.read(), LINTER_VERSION)
+                        issues = cache.lookup_key(file_path, stat, key)
+                    except Exception:
+                        pass
+        if issues is None:
+            pending.append(file_path)
+        else:
+            results[file_path] = issues
+
+    workers = jobs or os.cpu_count() or 1
+    if workers > 1 and len(pending) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        workers = min(workers, len(pending))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Chunks amortize the round trips; several per worker keep them all busy to the end
+            linted = list(pool.map(_lint_path, pending, chunksize=max(1, len(pending) // (workers * 4))))
+    else:
+        linted = [_lint_path(file_path) for file_path in pending]
+    for file_path, stat, key, read_at, issues in linted:
+        results[file_path] = issues
+        if cache is not None and key is not None:
+            cache.record(file_path, stat, key, issues, read_at)
+    return [(file_path, results[file_path]) for file_path in files]
+
+
+def main(argv=None):
+    """Main function to run the linter."""
+    import argparse
+    arg_parser = argparse.ArgumentParser(
+        description="WarPy40K Language Linter. Checks syntax, validates commands, variables, and provides "
+                    "helpful error messages.",
+        epilog="The linter checks for syntax errors and invalid commands, undeclared and unused variables, "
+               "invalid loop and conditional structures, string literal syntax and code style issues "
+               "(line length, whitespace). Exit codes: 0 - no errors found, 1 - errors found.")
+    arg_parser.add_argument('paths', nargs='+', metavar='path',
+                            help=f"a {LINT_SUFFIX} file, a directory searched recursively, or a glob pattern "
+                                 "(quote it; ** matches any number of directories)")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=None,
+                            help="worker processes linting files in parallel (default: one per core)")
+    arg_parser.add_argument('--no-cache', action='store_true', help="lint every file, and leave the cache alone")
+    arg_parser.add_argument('--cache-dir', default=None,
+                            help=f"where the results cache is kept (default: ${CACHE_DIR_ENV} or ./{CACHE_DIR_NAME})")
+    args = arg_parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        arg_parser.error("--jobs must be at least 1")
+
+    cache = None if args.no_cache else LintCache(args.cache_dir)
+    results = lint_paths(args.paths, args.jobs, cache)
+    if cache is not None:
+        cache.save()
 
-    linter.print_issues(issues, file_path)
+    linter = WarPy40KLinter()
+    error_count = warning_count = 0
+    for file_path, issues in results:
+        linter.print_issues(issues, file_path)
+        error_count += sum(1 for i in issues if i.severity == LintSeverity.ERROR)
+        warning_count += sum(1 for i in issues if i.severity == LintSeverity.WARNING)
+    if len(results) > 1:
+        print(f"Linted {len(results)} files: {error_count} error(s), {warning_count} warning(s)")
 
     # Exit with error code if there are errors
-    error_count = len([i for i in issues if i.severity == LintSeverity.ERROR])
     sys.exit(1 if error_count > 0 else 0)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,701 @@
+#!/usr/bin/env python3
+"""
+WarPy40K AST Optimizer
+Rewrites the resolved statement list between transformation and execution.
+
+Levels:
+  -O0  no optimization
+  -O1  constant folding and dead-branch elimination (default)
+  -O2  also simplifies x + 0, x - 0, x * 1 and 1 * x, unrolls small constant
+       loops and hoists loop-invariant expressions out of loops that run;
+       these assume numeric operands. With NumPy installed, for loops with
+       independent iterations run as array operations (see warpy_vector)
+
+Expressions are only rewritten where the engines evaluate them (see the
+operand rules in warpy_core), so values that pass through unevaluated
+are left exactly as they are.
+"""
+
+import copy
+
+from warpy_core import (
+    CommandNode, DeclarationNode, LoopNode, ConditionalNode, ComparisonNode, WhileNode,
+    AssignmentNode, StrFunctionNode, SumNode, SubtractionNode, MultiplicationNode, DivisionNode,
+    ModuloNode, LogicalAndNode, LogicalOrNode, ParallelBlockNode, ParallelForNode, VarRef, ARITHMETIC_NODES,
+    OPERAND_NODES, AST_NODES, PARALLEL_NODES, BINARY_FUNCTIONS, OPT_LEVELS, DEFAULT_OPT_LEVEL, TEMP_PREFIX,
+    ResolvedProgram, SlotResolver, compare_function, node_fields, parallel_bodies, resolve_slots,
+)
+from warpy_vector import VectorLoopNode, can_vectorize, vectorize
+
+LITERAL_TYPES = (int, float, str, bool)
+
+# Folding never produces strings longer than this, to keep cached programs small
+MAX_FOLDED_STRING = 4096
+
+CALL_ARGUMENT_NODES = ARITHMETIC_NODES + (ComparisonNode,)
+
+
+def is_literal(val):
+    return isinstance(val, LITERAL_TYPES)
+
+
+def is_plain_number(val):
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
+
+
+def is_number(val, number):
+    return is_plain_number(val) and val == number
+
+
+def is_float_valued(node):
+    """Whether node is known to evaluate to a float: a float literal or a division."""
+    return isinstance(node, (float, DivisionNode))
+
+
+def is_identity(val, number, other):
+    """Whether val is the identity number for an operation with other.
+
+    An int identity always is one. A float identity (0.0, 1.0) also turns an
+    int operand into a float, so it can only go when other is a float already.
+    """
+    if is_int(val):
+        return val == number
+    return is_number(val, number) and is_float_valued(other)
+
+
+def is_int(val):
+    return isinstance(val, int) and not isinstance(val, bool)
+
+
+def reference(target):
+    """A fresh read of the variable target refers to."""
+    ref = VarRef(target.name)
+    ref.slot = target.slot
+    return ref
+
+
+def assignment(name, slot, expr, origin):
+    """An assignment the optimizer adds on behalf of origin, reported at origin's position."""
+    stmt = AssignmentNode(name, expr)
+    stmt.slot = slot
+    stmt.line = origin.line
+    stmt.column = origin.column
+    return stmt
+
+
+class ExpressionPass:
+    """Walks statements and rewrites each evaluated expression bottom-up with rewrite()."""
+
+    name = 'expressions'
+
+    def __init__(self, resolver=None):
+        self.resolver = resolver
+
+    def temp(self, kind):
+        """A new compiler temporary with its own frame slot."""
+        name = f"{TEMP_PREFIX}{kind}{len(self.resolver.names)}"
+        ref = VarRef(name)
+        ref.slot = self.resolver.slot_for(name)
+        return ref
+
+    def run(self, statements):
+        return self.block(statements)
+
+    def block(self, statements):
+        result = []
+        for stmt in statements:
+            result.extend(self.statement(stmt))
+        return result
+
+    def statement(self, stmt):
+        """Return the statements that replace stmt (usually just [stmt])."""
+        if isinstance(stmt, CommandNode):
+            self.call(stmt)
+        elif isinstance(stmt, DeclarationNode):
+            value = stmt.callnode
+            if isinstance(value, CommandNode):
+                self.call(value)
+            else:
+                value = self.operand(value, ARITHMETIC_NODES)
+                # A string or None declared as dg would be converted instead of stored
+                if not (stmt.typename == "dg" and (isinstance(value, str) or value is None)):
+                    stmt.callnode = value
+        elif isinstance(stmt, AssignmentNode):
+            stmt.expr = self.operand(stmt.expr, CALL_ARGUMENT_NODES)
+        elif isinstance(stmt, LoopNode):
+            stmt.commands = self.block(stmt.commands)
+        elif isinstance(stmt, WhileNode):
+            stmt.condition = self.condition(stmt.condition)
+            stmt.commands = self.block(stmt.commands)
+        elif isinstance(stmt, ConditionalNode):
+            stmt.condition = self.condition(stmt.condition)
+            stmt.then_commands = self.block(stmt.then_commands)
+            if stmt.else_commands:
+                stmt.else_commands = self.block(stmt.else_commands)
+        elif isinstance(stmt, ParallelBlockNode):
+            stmt.tasks = [self.block(task) for task in stmt.tasks]
+        elif isinstance(stmt, ParallelForNode):
+            stmt.commands = self.block(stmt.commands)
+        if isinstance(stmt, PARALLEL_NODES):
+            if stmt.on_success:
+                stmt.on_success = self.block(stmt.on_success)
+            if stmt.on_failure:
+                stmt.on_failure = self.block(stmt.on_failure)
+        return [stmt]
+
+    def call(self, node):
+        node.args = [self.operand(arg, CALL_ARGUMENT_NODES) for arg in node.args]
+
+    def condition(self, condition):
+        return self.operand(condition, (ComparisonNode,))
+
+    def operand(self, val, evaluated_nodes):
+        if not isinstance(val, evaluated_nodes):
+            return val
+        if isinstance(val, ComparisonNode):
+            val.left = self.operand(val.left, ARITHMETIC_NODES)
+            val.right = self.operand(val.right, ARITHMETIC_NODES)
+        elif isinstance(val, StrFunctionNode):
+            val.expr = self.operand(val.expr, OPERAND_NODES)
+        else:
+            val.left = self.operand(val.left, OPERAND_NODES)
+            val.right = self.operand(val.right, OPERAND_NODES)
+        return self.rewrite(val, evaluated_nodes)
+
+    def rewrite(self, node, evaluated_nodes):
+        return node
+
+
+class ConstantFolder(ExpressionPass):
+    """Replaces expressions whose operands are all literals by their value."""
+
+    name = 'constant-folding'
+
+    def rewrite(self, node, evaluated_nodes):
+        try:
+            if isinstance(node, ComparisonNode):
+                if is_literal(node.left) and is_literal(node.right):
+                    return compare_function(node.operator)(node.left, node.right)
+            elif isinstance(node, StrFunctionNode):
+                if is_literal(node.expr):
+                    return str(node.expr)
+            elif is_literal(node.left) and is_literal(node.right):
+                value = BINARY_FUNCTIONS[type(node)](node.left, node.right)
+                if not (isinstance(value, str) and len(value) > MAX_FOLDED_STRING):
+                    return value
+        except Exception:
+            # Errors such as division by zero are left to happen at run time
+            pass
+        return node
+
+
+class IdentitySimplifier(ExpressionPass):
+    """Drops additions of 0 and multiplications by 1 (assumes numeric operands).
+
+    0.0 and 1.0 are only dropped next to an operand that is a float already,
+    since x * 1.0 turns an int x into a float.
+    """
+
+    name = 'identities'
+
+    def rewrite(self, node, evaluated_nodes):
+        kept = None
+        if isinstance(node, SumNode):
+            if is_identity(node.right, 0, node.left):
+                kept = node.left
+            elif is_identity(node.left, 0, node.right):
+                kept = node.right
+        elif isinstance(node, SubtractionNode):
+            if is_identity(node.right, 0, node.left):
+                kept = node.left
+        elif isinstance(node, MultiplicationNode):
+            if is_identity(node.right, 1, node.left):
+                kept = node.left
+            elif is_identity(node.left, 1, node.right):
+                kept = node.right
+        # The remaining operand must still be evaluated where the node stood
+        if isinstance(kept, VarRef) or isinstance(kept, evaluated_nodes):
+            return kept
+        return node
+
+
+class DeadBranchEliminator(ExpressionPass):
+    """Inlines the taken side of if/else with a constant condition and drops never-entered whiles."""
+
+    name = 'dead-branches'
+
+    def condition(self, condition):
+        return condition
+
+    def statement(self, stmt):
+        if isinstance(stmt, (ConditionalNode, WhileNode)) and not is_dynamic_condition(stmt.condition):
+            # Engines judge any other condition by its own truthiness
+            taken = bool(stmt.condition)
+            if isinstance(stmt, WhileNode):
+                if not taken:
+                    return []
+            elif taken:
+                return self.block(stmt.then_commands)
+            else:
+                return self.block(stmt.else_commands or [])
+        return super().statement(stmt)
+
+    def operand(self, val, evaluated_nodes):
+        return val
+
+
+def is_dynamic_condition(condition):
+    return isinstance(condition, (ComparisonNode, VarRef))
+
+
+# Loop optimizations
+
+MAX_UNROLL_TRIPS = 8
+MAX_UNROLLED_STATEMENTS = 64
+
+HOISTABLE_NODES = ARITHMETIC_NODES + (ComparisonNode,)
+
+
+def loop_bound(value):
+    while isinstance(value, list) and len(value) == 1:
+        value = value[0]
+    return value
+
+
+def assigned_slots(statements):
+    """Slots written anywhere in these statements, nested bodies included."""
+    slots = set()
+    for stmt in statements:
+        if isinstance(stmt, (DeclarationNode, AssignmentNode, LoopNode, ParallelForNode)):
+            slots.add(stmt.slot)
+        if isinstance(stmt, (LoopNode, WhileNode)):
+            slots |= assigned_slots(stmt.commands)
+        elif isinstance(stmt, ConditionalNode):
+            slots |= assigned_slots(stmt.then_commands)
+            slots |= assigned_slots(stmt.else_commands or [])
+        elif isinstance(stmt, PARALLEL_NODES):
+            # Writes inside tasks stay in the tasks, but counting them too is the safe side
+            for body in parallel_bodies(stmt):
+                slots |= assigned_slots(body)
+    return slots
+
+
+def count_statements(statements):
+    total = 0
+    for stmt in statements:
+        total += 1
+        if isinstance(stmt, (LoopNode, WhileNode)):
+            total += count_statements(stmt.commands)
+        elif isinstance(stmt, ConditionalNode):
+            total += count_statements(stmt.then_commands) + count_statements(stmt.else_commands or [])
+        elif isinstance(stmt, PARALLEL_NODES):
+            total += sum(count_statements(body) for body in parallel_bodies(stmt))
+    return total
+
+
+def contains_parallel(statements):
+    for stmt in statements:
+        if isinstance(stmt, PARALLEL_NODES):
+            return True
+        if isinstance(stmt, (LoopNode, WhileNode)) and contains_parallel(stmt.commands):
+            return True
+        if isinstance(stmt, ConditionalNode) and contains_parallel(stmt.then_commands + (stmt.else_commands or [])):
+            return True
+    return False
+
+
+def substitute(node, slot, value):
+    """Replace, in place, every read of the variable in slot by value; returns node's replacement."""
+    if isinstance(node, VarRef):
+        return value if node.slot == slot else node
+    if isinstance(node, list):
+        node[:] = [substitute(item, slot, value) for item in node]
+    elif isinstance(node, AST_NODES):
+        for attr, child in node_fields(node):
+            setattr(node, attr, substitute(child, slot, value))
+    return node
+
+
+def is_invariant(node, variant_slots):
+    """True when node reads no variant slot and cannot fail on numeric operands."""
+    if isinstance(node, VarRef):
+        return node.slot not in variant_slots
+    if isinstance(node, StrFunctionNode):
+        return False
+    if isinstance(node, (DivisionNode, ModuloNode)) and not (is_plain_number(node.right) and node.right != 0):
+        return False
+    if isinstance(node, list):
+        return all(is_invariant(item, variant_slots) for item in node)
+    if isinstance(node, AST_NODES):
+        return all(is_invariant(child, variant_slots) for _, child in node_fields(node))
+    return True
+
+
+class LoopUnroller(ExpressionPass):
+    """Replaces for loops over a small constant range by one copy of the body per value."""
+
+    name = 'unrolling'
+
+    def statement(self, stmt):
+        # Inner loops are unrolled first, so the size check sees the final body
+        statements = super().statement(stmt)
+        if not isinstance(stmt, LoopNode):
+            return statements
+        start, end = loop_bound(stmt.start), loop_bound(stmt.end)
+        if not (is_plain_number(start) and is_plain_number(end)):
+            return statements
+        if contains_parallel(stmt.commands):
+            # Copies of a parallel block would write the same variables, which
+            # bind_commands refuses; a block is already one batch of work anyway
+            return statements
+        values = range(int(start), int(end) + 1)
+        if len(values) > MAX_UNROLL_TRIPS or len(values) * count_statements(stmt.commands) > MAX_UNROLLED_STATEMENTS:
+            return statements
+        # Reads of the loop variable become constants unless the body assigns it; then
+        # the variable is only stored once, with the value the loop leaves behind
+        constant_reads = stmt.slot not in assigned_slots(stmt.commands)
+        unrolled = []
+        for value in values:
+            body = copy.deepcopy(stmt.commands)
+            if constant_reads:
+                substitute(body, stmt.slot, value)
+            else:
+                unrolled.append(assignment(stmt.varname, stmt.slot, value, stmt))
+            unrolled.extend(body)
+        if constant_reads and values:
+            unrolled.append(assignment(stmt.varname, stmt.slot, values[-1], stmt))
+        return unrolled
+
+
+class StrengthReducer(ExpressionPass):
+    """Replaces k * i in a for loop over i by a running sum updated once per iteration."""
+
+    name = 'strength-reduction'
+
+    def __init__(self, resolver=None):
+        super().__init__(resolver)
+        # Variables of the enclosing for loops that the loops never assign: always ints
+        self.int_slots = set()
+
+    def statement(self, stmt):
+        if not isinstance(stmt, LoopNode):
+            return super().statement(stmt)
+        if can_vectorize(stmt):
+            # A running sum would make every iteration depend on the previous one
+            return [stmt]
+        assigned = assigned_slots(stmt.commands)
+        is_induction = stmt.slot not in assigned
+        if is_induction:
+            self.int_slots.add(stmt.slot)
+        stmt.commands = self.block(stmt.commands)
+        self.int_slots.discard(stmt.slot)
+        start = loop_bound(stmt.start)
+        if not (is_induction and is_int(start)):
+            return [stmt]
+
+        counter = _InductionRewriter(self.resolver, stmt.slot, self.int_slots)
+        counter.block(copy.deepcopy(stmt.commands))
+        # A running sum costs an update per iteration, so it only pays off for products
+        # evaluated more than once per iteration
+        worthwhile = {key for key, uses in counter.uses.items() if uses > 1}
+        if not worthwhile:
+            return [stmt]
+        rewriter = _InductionRewriter(self.resolver, stmt.slot, self.int_slots, worthwhile)
+        stmt.commands = rewriter.block(stmt.commands)
+        setup = []
+        updates = []
+        for total, factor in rewriter.sums.values():
+            # total holds factor * i: factor * (start - 1) before the loop, plus factor on every iteration
+            if is_int(factor) or start == 1:
+                initial = factor * (start - 1) if is_int(factor) else 0
+            else:
+                initial = MultiplicationNode(reference(factor), start - 1)
+            setup.append(assignment(total.name, total.slot, initial, stmt))
+            increment = SumNode(reference(total), factor if is_int(factor) else reference(factor))
+            updates.append(assignment(total.name, total.slot, increment, stmt))
+        stmt.commands = updates + stmt.commands
+        return setup + [stmt]
+
+
+class _InductionRewriter(ExpressionPass):
+    """Counts k * i products per iteration; replaces those whose key is in reduce_keys."""
+
+    def __init__(self, resolver, induction_slot, int_slots, reduce_keys=()):
+        super().__init__(resolver)
+        self.induction_slot = induction_slot
+        self.int_slots = int_slots
+        self.reduce_keys = reduce_keys
+        self.uses = {}
+        self.sums = {}
+        self.weight = 1
+
+    def statement(self, stmt):
+        if not isinstance(stmt, (LoopNode, WhileNode)):
+            return super().statement(stmt)
+        # Inside a nested loop a product runs many times per iteration of this one
+        outer_weight = self.weight
+        self.weight = 2
+        try:
+            return super().statement(stmt)
+        finally:
+            self.weight = outer_weight
+
+    def factor_key(self, factor):
+        if is_int(factor):
+            return ('const', factor)
+        if isinstance(factor, VarRef) and factor.slot in self.int_slots and factor.slot != self.induction_slot:
+            return ('var', factor.slot)
+        return None
+
+    def rewrite(self, node, evaluated_nodes):
+        if isinstance(node, MultiplicationNode):
+            for var, factor in ((node.left, node.right), (node.right, node.left)):
+                if isinstance(var, VarRef) and var.slot == self.induction_slot:
+                    key = self.factor_key(factor)
+                    if key is not None:
+                        self.uses[key] = self.uses.get(key, 0) + self.weight
+                    if key in self.reduce_keys:
+                        if key not in self.sums:
+                            self.sums[key] = (self.temp('sr'), factor)
+                        return reference(self.sums[key][0])
+        return node
+
+
+def calls_command(node):
+    """Whether evaluating node may run a command, which an extra evaluation would repeat."""
+    if isinstance(node, CommandNode):
+        return True
+    if isinstance(node, list):
+        return any(calls_command(item) for item in node)
+    if isinstance(node, AST_NODES):
+        return any(calls_command(child) for _, child in node_fields(node))
+    return False
+
+
+def entry_guard(stmt, int_slots):
+    """When the body of loop stmt runs at least once.
+
+    True or False when that is known here, a condition to test just before the
+    loop when it can be tested exactly and without side effects, or None.
+    int_slots are the variables known to hold ints.
+    """
+    if isinstance(stmt, WhileNode):
+        if is_literal(stmt.condition):
+            return bool(stmt.condition)
+        if calls_command(stmt.condition):
+            return None
+        # The loop tests the same condition right after the guard, so the guard
+        # neither changes the result nor raises an error the loop would not
+        return copy.deepcopy(stmt.condition)
+    start, end = loop_bound(stmt.start), loop_bound(stmt.end)
+    if is_plain_number(start) and is_plain_number(end):
+        return int(start) <= int(end)
+
+    def known_int(bound):
+        return is_int(bound) or (isinstance(bound, VarRef) and bound.slot in int_slots)
+
+    # The loop runs range(int(start), int(end) + 1); only for ints is that start <= end
+    if not (known_int(start) and known_int(end)):
+        return None
+    guard = ComparisonNode(copy.deepcopy(start), '<=', copy.deepcopy(end))
+    guard.line, guard.column = stmt.line, stmt.column
+    return guard
+
+
+class InvariantHoister(ExpressionPass):
+    """Computes loop-invariant expressions once, in front of the loop.
+
+    An expression only moves out of a loop whose body is known to run, or
+    behind a test that the loop will run, so a loop that runs zero times
+    evaluates nothing it would not have evaluated before.
+    """
+
+    name = 'invariant-hoisting'
+
+    def __init__(self, resolver=None):
+        super().__init__(resolver)
+        # Variables of the enclosing for loops that the loops never assign: always ints
+        self.int_slots = set()
+
+    def statement(self, stmt):
+        if not isinstance(stmt, (LoopNode, WhileNode)):
+            return super().statement(stmt)
+        collector = _InvariantCollector(self.resolver, assigned_slots([stmt]), self.int_slots)
+        hoisted = []
+        if isinstance(stmt, WhileNode):
+            # The condition is evaluated before the first iteration, so it needs no guard
+            stmt.condition = collector.condition(stmt.condition)
+            hoisted, collector.hoisted = collector.hoisted, []
+        guard = entry_guard(stmt, self.int_slots)
+        if guard is not None and guard is not False:
+            stmt.commands = collector.block(stmt.commands)
+        induction = isinstance(stmt, LoopNode) and stmt.slot not in assigned_slots(stmt.commands)
+        if induction:
+            self.int_slots.add(stmt.slot)
+        try:
+            # Nested loops then hoist what is constant only within themselves
+            stmt.commands = self.block(stmt.commands)
+        finally:
+            if induction:
+                self.int_slots.discard(stmt.slot)
+        statements = [assignment(temp.name, temp.slot, expr, stmt) for temp, expr in hoisted]
+        body_hoisted = [assignment(temp.name, temp.slot, expr, stmt) for temp, expr in collector.hoisted]
+        if body_hoisted and guard is not True:
+            guarded = ConditionalNode(guard, body_hoisted)
+            guarded.line, guarded.column = stmt.line, stmt.column
+            body_hoisted = [guarded]
+        return statements + body_hoisted + [stmt]
+
+
+class _InvariantCollector(ExpressionPass):
+    def __init__(self, resolver, variant_slots, int_slots):
+        super().__init__(resolver)
+        self.variant_slots = variant_slots
+        self.int_slots = int_slots
+        self.hoisted = []
+
+    def statement(self, stmt):
+        # Only statements that run on every iteration: an expression in a branch, or
+        # in a nested loop that may not run, must not be evaluated up front
+        if isinstance(stmt, (ConditionalNode, WhileNode) + PARALLEL_NODES):
+            return [stmt]
+        if isinstance(stmt, LoopNode) and entry_guard(stmt, self.int_slots) is not True:
+            return [stmt]
+        return super().statement(stmt)
+
+    def operand(self, val, evaluated_nodes):
+        # Largest invariant expressions first; only kinds an assignment evaluates can move out
+        if isinstance(val, HOISTABLE_NODES) and isinstance(val, evaluated_nodes) and is_invariant(val, self.variant_slots):
+            temp = self.temp('inv')
+            self.hoisted.append((temp, val))
+            return reference(temp)
+        return super().operand(val, evaluated_nodes)
+
+
+class Vectorizer(ExpressionPass):
+    """Turns for loops whose iterations are independent into VectorLoopNodes."""
+
+    name = 'vectorization'
+
+    def statement(self, stmt):
+        statements = super().statement(stmt)
+        if isinstance(stmt, LoopNode):
+            vector_loop = vectorize(stmt)
+            if vector_loop is not None:
+                return [vector_loop]
+        return statements
+
+
+PASSES = (
+    (1, ConstantFolder),
+    (2, IdentitySimplifier),
+    (1, DeadBranchEliminator),
+    (2, LoopUnroller),
+    # Unrolling turns loop variables into constants, which the first passes can use again
+    (2, ConstantFolder),
+    (2, IdentitySimplifier),
+    (2, DeadBranchEliminator),
+    # StrengthReducer is not run: a CPython multiplication costs no more than the
+    # addition that replaces it, so its extra update per iteration made loops slower
+    (2, InvariantHoister),
+    (2, Vectorizer),
+)
+
+
+def optimize(statements, level=DEFAULT_OPT_LEVEL, trace=None):
+    """Run the passes enabled at this level; trace(pass_name, statements) sees every stage."""
+    if level not in OPT_LEVELS:
+        raise ValueError(f"Unknown optimization level {level}. Expected one of: {', '.join(map(str, OPT_LEVELS))}.")
+    if not isinstance(statements, ResolvedProgram):
+        statements = resolve_slots(statements)
+    resolver = SlotResolver(statements.names)
+    if trace:
+        trace('parsed', statements)
+    for min_level, pass_class in PASSES:
+        if level >= min_level:
+            optimizer_pass = pass_class(resolver)
+            statements = ResolvedProgram(optimizer_pass.run(list(statements)), resolver.names)
+            if trace:
+                trace(optimizer_pass.name, statements)
+    return statements
+
+
+# Tree dump
+
+OPERATOR_SYMBOLS = {
+    SumNode: '+',
+    SubtractionNode: '-',
+    MultiplicationNode: '*',
+    DivisionNode: '/',
+    ModuloNode: '%',
+    LogicalAndNode: 'and',
+    LogicalOrNode: 'or',
+}
+
+
+def format_expression(val):
+    if isinstance(val, VarRef):
+        return f"{val.name}#{val.slot}"
+    if isinstance(val, ComparisonNode):
+        return f"({format_expression(val.left)} {val.operator} {format_expression(val.right)})"
+    if isinstance(val, StrFunctionNode):
+        return f"str({format_expression(val.expr)})"
+    if isinstance(val, CommandNode):
+        return f"{val.name}({', '.join(format_expression(arg) for arg in val.args)})"
+    if type(val) in OPERATOR_SYMBOLS:
+        return f"({format_expression(val.left)} {OPERATOR_SYMBOLS[type(val)]} {format_expression(val.right)})"
+    if isinstance(val, list):
+        return ', '.join(format_expression(item) for item in val)
+    return repr(val)
+
+
+def _target(stmt):
+    return f"{stmt.varname}#{stmt.slot}"
+
+
+def dump_lines(statements, depth=0):
+    lines = []
+    for stmt in statements:
+        prefix = f"{stmt.line if stmt.line is not None else '':>4} | {'    ' * depth}"
+        if isinstance(stmt, CommandNode):
+            lines.append(prefix + format_expression(stmt))
+        elif isinstance(stmt, DeclarationNode):
+            lines.append(prefix + f"{_target(stmt)}: {stmt.typename} = {format_expression(stmt.callnode)}")
+        elif isinstance(stmt, AssignmentNode):
+            lines.append(prefix + f"{_target(stmt)} = {format_expression(stmt.expr)}")
+        elif isinstance(stmt, LoopNode):
+            keyword = 'vector for' if isinstance(stmt, VectorLoopNode) else 'for'
+            lines.append(prefix + f"{keyword} {_target(stmt)} in {format_expression(stmt.start)}..{format_expression(stmt.end)}:")
+            lines.extend(dump_lines(stmt.commands, depth + 1))
+        elif isinstance(stmt, WhileNode):
+            lines.append(prefix + f"while {format_expression(stmt.condition)}:")
+            lines.extend(dump_lines(stmt.commands, depth + 1))
+        elif isinstance(stmt, ConditionalNode):
+            lines.append(prefix + f"if {format_expression(stmt.condition)}:")
+            lines.extend(dump_lines(stmt.then_commands, depth + 1))
+            if stmt.else_commands:
+                lines.append(f"{'':>4} | {'    ' * depth}else:")
+                lines.extend(dump_lines(stmt.else_commands, depth + 1))
+        elif isinstance(stmt, PARALLEL_NODES):
+            options = ''.join(f" {name}={value!r}" for name, value in stmt.options.items())
+            if isinstance(stmt, ParallelForNode):
+                lines.append(prefix + f"parallel for {_target(stmt)} in {format_expression(stmt.start)}.."
+                                      f"{format_expression(stmt.end)}{options}:")
+                lines.extend(dump_lines(stmt.commands, depth + 1))
+            else:
+                lines.append(prefix + f"parallel{options}:")
+                for number, task in enumerate(stmt.tasks, 1):
+                    lines.append(f"{'':>4} | {'    ' * (depth + 1)}task {number}:")
+                    lines.extend(dump_lines(task, depth + 2))
+            for keyword, body in (('on_success', stmt.on_success), ('on_failure', stmt.on_failure)):
+                if body:
+                    lines.append(f"{'':>4} | {'    ' * depth}{keyword}:")
+                    lines.extend(dump_lines(body, depth + 1))
+        else:
+            lines.append(prefix + repr(stmt))
+    return lines
+
+
+def dump_program(statements):
+    """Readable listing of a statement list: source line, then the statement with name#slot variables."""
+    return "\n".join(dump_lines(statements))
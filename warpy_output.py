@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Output Sinks
+Every output command writes its line through the current sink instead of
+calling print(), so output can be buffered, captured or discarded without
+patching sys.stdout.
+
+The current sink is per thread: a thread starts out writing to the shared
+default sink, and redirecting output in one thread leaves the others alone,
+so programs embedded in a threaded host can each capture their own output.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from io import TextIOBase
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 0.1
+
+
+class OutputSink(ABC):
+    """Receives the lines printed by a running script, one string per line without the newline."""
+
+    @abstractmethod
+    def write_line(self, line: str) -> None:
+        pass
+
+    def write_lines(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.write_line(line)
+
+    def flush(self) -> None:
+        pass
+
+
+class StreamSink(OutputSink):
+    """Collects lines and writes them to a stream in blocks.
+
+    A block is written once buffer_size characters are pending, or on the first
+    write after flush_interval seconds without a flush. The stream defaults to
+    whatever sys.stdout is when the block is written. When buffer_size is None,
+    a terminal gets every line at once, like print(), and anything else the
+    default block size.
+    """
+
+    def __init__(self, stream: TextIOBase | None = None, buffer_size: int | None = None,
+                 flush_interval: float | None = DEFAULT_FLUSH_INTERVAL):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._lines: list[str] = []
+        self._pending = 0
+        self._limit: int | None = None
+        self._last_flush = time.monotonic()
+
+    def _target(self) -> TextIOBase:
+        return self.stream if self.stream is not None else sys.stdout
+
+    def _block_size(self) -> int:
+        if self._limit is None:
+            if self.buffer_size is not None:
+                self._limit = self.buffer_size
+            else:
+                isatty = getattr(self._target(), 'isatty', None)
+                self._limit = 0 if isatty is not None and isatty() else DEFAULT_BUFFER_SIZE
+        return self._limit
+
+    def write_line(self, line: str) -> None:
+        self._lines.append(line)
+        self._pending += len(line) + 1
+        self._maybe_flush()
+
+    def write_lines(self, lines: Iterable[str]) -> None:
+        lines = list(lines)
+        self._lines.extend(lines)
+        self._pending += sum(map(len, lines)) + len(lines)
+        self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if self._pending >= self._block_size():
+            self.flush()
+        elif self.flush_interval is not None and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._lines:
+            stream = self._target()
+            lines, self._lines, self._pending = self._lines, [], 0
+            lines.append('')
+            stream.write('\n'.join(lines))
+            stream.flush()
+        self._last_flush = time.monotonic()
+
+
+class CaptureSink(OutputSink):
+    """Keeps every line in memory, for tests and programs that embed the interpreter."""
+
+    def __init__(self):
+        self.lines: list[str] = []
+
+    def write_line(self, line: str) -> None:
+        self.lines.append(line)
+
+    def write_lines(self, lines: Iterable[str]) -> None:
+        self.lines.extend(lines)
+
+    def getvalue(self) -> str:
+        """The captured output as print() would have written it."""
+        return ''.join(line + '\n' for line in self.lines)
+
+    def clear(self) -> None:
+        self.lines.clear()
+
+
+class NullSink(OutputSink):
+    """Discards all output, to measure the engines without I/O cost."""
+
+    def write_line(self, line: str) -> None:
+        pass
+
+    def write_lines(self, lines: Iterable[str]) -> None:
+        pass
+
+
+class _SinkState(threading.local):
+    # Class attribute: every thread starts out on the shared default sink
+    sink: OutputSink = StreamSink()
+
+
+_state = _SinkState()
+
+
+def current_sink() -> OutputSink:
+    return _state.sink
+
+
+def set_sink(sink: OutputSink) -> OutputSink:
+    """Make sink this thread's destination for output commands; returns the previous sink, already flushed."""
+    previous, _state.sink = _state.sink, sink
+    previous.flush()
+    return previous
+
+
+@contextlib.contextmanager
+def redirect_output(sink: OutputSink) -> Iterator[OutputSink]:
+    """Send output to sink inside the with block, then flush it and restore the previous sink."""
+    previous = set_sink(sink)
+    try:
+        yield sink
+    finally:
+        set_sink(previous)
+
+
+def write_line(line: str) -> None:
+    _state.sink.write_line(line)
+
+
+def write_lines(lines: Iterable[str]) -> None:
+    _state.sink.write_lines(lines)
+
+
+def flush_output() -> None:
+    """Write out pending lines, e.g. before reading input or when a run ends."""
+    _state.sink.flush()
+
+
+atexit.register(flush_output)
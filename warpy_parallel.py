@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Parallel Blocks
+Runs the tasks of a `parallel:` block, or the iterations of a `parallel for`,
+on a pool of worker processes. Processes rather than threads: the GIL would
+keep threads from running script code side by side.
+
+Each task gets its own copy of the variables it reads. bind_commands has
+already refused tasks that write a variable used outside them or read one
+another's results, so a task hands back nothing but the lines it printed.
+Those lines are written in task order once every task has finished, so a
+program prints the same thing however the tasks were scheduled. After a
+parallel for the loop variable holds the last value of the range, as after
+a plain for.
+
+A task body is pickled once per node and sent as bytes; a worker unpickles
+and binds it the first time it sees those bytes and keeps it for later
+calls. With timeout=MS an attempt that runs longer is stopped with SIGALRM
+in its worker; with retry=N a failed attempt is run again, up to N more
+times. Only the output of the attempt that succeeded is kept, and a task
+that never succeeds prints nothing. When a task fails, the on_failure block runs if there is one,
+otherwise the first failure in task order is raised. on_success runs when
+every task succeeded; both run in the program's own frame.
+
+Tasks run one after another in the calling process when the pool is
+configured with 0 workers and inside a worker (parallel blocks nested in a
+task). Their results are the same; outside a worker a timeout is enforced
+there like a warpy_budget deadline, when the task's loops next iterate.
+
+Under a warpy_budget budget a parallel for is charged its iterations up
+front, like a loop, and each task carries on the count from where the
+block started: the steps used so far and the same deadline.
+"""
+
+import functools
+import multiprocessing.util
+import os
+import pickle
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+from warpy_budget import Budget, DeadlineExceeded, current_meter, loop_cost, metered, reset_memory_limit
+from warpy_core import (COMMANDS, UNBOUND, CommandBinder, ParallelBlockNode, VarRef,
+                               count_references, innermost_position, node_position)
+from warpy_output import CaptureSink, current_sink, flush_output, redirect_output
+
+# Task bodies kept pickled in the calling process
+MAX_PAYLOADS = 256
+
+_workers: Optional[int] = None
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_payloads: 'OrderedDict[int, Tuple]' = OrderedDict()
+_in_worker = False
+
+
+class TaskTimeout(TimeoutError):
+    pass
+
+
+def configure(workers: Optional[int]) -> None:
+    """Use this many worker processes (None: one per core, 0: run tasks inline)."""
+    global _workers
+    with _pool_lock:
+        _workers = workers
+        _shutdown()
+
+
+def _alarm(signum, frame):
+    raise TaskTimeout()
+
+
+def _init_worker() -> None:
+    global _in_worker
+    _in_worker = True
+    # A worker forked while a run's memory cap was in force would otherwise keep it for good
+    reset_memory_limit()
+    # Workers leave shutdown to the pool rather than any handler inherited from the parent
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _alarm)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_workers or os.cpu_count() or 1, initializer=_init_worker)
+            # A process that is itself a multiprocessing worker (a test runner or --serve
+            # worker) exits by joining its children, which must be told to stop first,
+            # before the pool's queues close themselves at exit priority 10
+            multiprocessing.util.Finalize(None, _pool.shutdown, exitpriority=20)
+        return _pool
+
+
+def _shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _replace_pool(broken: ProcessPoolExecutor) -> None:
+    # A worker died (e.g. killed for memory); the next block gets a fresh pool
+    with _pool_lock:
+        if _pool is broken:
+            _shutdown()
+
+
+def _payload(body) -> Tuple[bytes, int]:
+    """The pickled body and the frame size it needs, computed once per body."""
+    key = id(body)
+    with _pool_lock:
+        entry = _payloads.get(key)
+        if entry is not None and entry[0] is body:
+            _payloads.move_to_end(key)
+            return entry[1], entry[2]
+    slots = count_references(body, {})
+    entry = (body, pickle.dumps(body, pickle.HIGHEST_PROTOCOL), max(slots, default=-1) + 1)
+    with _pool_lock:
+        _payloads[key] = entry
+        while len(_payloads) > MAX_PAYLOADS:
+            _payloads.popitem(last=False)
+    return entry[1], entry[2]
+
+
+@functools.lru_cache(maxsize=MAX_PAYLOADS)
+def _load_body(payload: bytes):
+    body = pickle.loads(payload)
+    CommandBinder(COMMANDS).visit(body)
+    return body
+
+
+def _failure(exc: Exception) -> Exception:
+    """exc with the position of the node that raised it, made safe to send back to the caller."""
+    if getattr(exc, 'warpy_position', None) is None:
+        position = innermost_position(exc)
+        if position is not None:
+            exc.warpy_position = position
+    exc.__traceback__ = None
+    try:
+        pickle.loads(pickle.dumps(exc))
+    except Exception:
+        replacement = RuntimeError(f"{type(exc).__name__}: {exc}")
+        replacement.warpy_position = getattr(exc, 'warpy_position', None)
+        return replacement
+    return exc
+
+
+def _run_body(body, values: List, timeout: Optional[float], count) -> List[str]:
+    sink = CaptureSink()
+    timed = timeout and _in_worker and hasattr(signal, 'SIGALRM')
+    budget, steps, deadline = count or (None, 0, None)
+    # Without the alarm the timeout becomes a deadline, noticed when a loop iterates
+    cooperative = False
+    if timeout and not timed:
+        own_deadline = time.monotonic() + timeout / 1000
+        cooperative = deadline is None or own_deadline < deadline
+        if cooperative:
+            budget, deadline = budget or Budget(), own_deadline
+    if timed:
+        signal.setitimer(signal.ITIMER_REAL, timeout / 1000)
+    try:
+        with redirect_output(sink), metered(budget, steps, deadline):
+            for stmt in body:
+                stmt.execute(values)
+    except (TaskTimeout, DeadlineExceeded) as exc:
+        if isinstance(exc, DeadlineExceeded) and not cooperative:
+            raise
+        error = TaskTimeout(f"parallel task ran past its {timeout:g} ms timeout")
+        error.warpy_position = getattr(exc, 'warpy_position', None) or node_position(body[0])
+        raise error from None
+    finally:
+        if timed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return sink.lines
+
+
+def run_task(body, inputs: List, slot: Optional[int], index, timeout: Optional[float], attempts: int,
+             count=None):
+    """Run one task up to attempts times; returns (True, lines) or (False, error).
+
+    body is the statement list, or its pickled bytes when sent to a worker.
+    inputs is the caller's frame; slot, when given, receives index first.
+    count is the caller's Meter.handoff(), when it runs under a budget.
+    """
+    if isinstance(body, bytes):
+        body = _load_body(body)
+    for attempt in range(attempts):
+        values = list(inputs)
+        if slot is not None:
+            values[slot] = index
+        try:
+            return True, _run_body(body, values, timeout, count)
+        except Exception as exc:
+            error = exc
+    return False, _failure(error)
+
+
+def _task_inputs(values: List, size: int) -> List:
+    # The VM appends its constant pool to the frame; a task only needs the variable slots it uses
+    inputs = values[:size]
+    return inputs + [UNBOUND] * (size - len(inputs))
+
+
+def _run_tasks(jobs, options) -> List[Tuple[bool, object]]:
+    """Run (body, values, slot, index) jobs and return their results in job order."""
+    timeout = options.get('timeout')
+    attempts = options.get('retry', 0) + 1
+    meter = current_meter()
+    count = meter.handoff() if meter is not None else None
+    if _in_worker or _workers == 0:
+        return [run_task(body, values, slot, index, timeout, attempts, count)
+                for body, values, slot, index in jobs]
+    pool = _get_pool()
+    # Workers are forked as tasks are submitted, with a copy of any output still buffered
+    # here, which they would write out again
+    flush_output()
+    sys.stdout.flush()
+    futures = []
+    try:
+        for body, values, slot, index in jobs:
+            payload, size = _payload(body)
+            if slot is not None:
+                size = max(size, slot + 1)
+            futures.append(pool.submit(run_task, payload, _task_inputs(values, size), slot, index,
+                                       timeout, attempts, count))
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except BrokenProcessPool:
+                _replace_pool(pool)
+                results.append((False, RuntimeError("worker process died while running a parallel task")))
+        return results
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _finish(node, results, values) -> None:
+    sink = current_sink()
+    failures = []
+    for ok, result in results:
+        if ok:
+            sink.write_lines(result)
+        else:
+            failures.append(result)
+    if failures and node.on_failure is None:
+        error = failures[0]
+        if getattr(error, 'warpy_position', None) is None:
+            error.warpy_position = node_position(node)
+        raise error
+    try:
+        for stmt in (node.on_failure if failures else node.on_success) or ():
+            stmt.execute(values)
+    except Exception as exc:
+        # The engine running the program only knows the parallel statement's position
+        if getattr(exc, 'warpy_position', None) is None:
+            exc.warpy_position = innermost_position(exc)
+        raise
+
+
+def _bound(value, values):
+    while isinstance(value, list) and len(value) == 1:
+        value = value[0]
+    if isinstance(value, list):
+        raise ValueError("Unexpected list value in loop range")
+    return value.evaluate(values) if isinstance(value, VarRef) else value
+
+
+def run_parallel_block(node: ParallelBlockNode, values: List) -> None:
+    _finish(node, _run_tasks([(task, values, None, None) for task in node.tasks], node.options), values)
+
+
+def run_parallel_for(node, values: List) -> None:
+    indices = range(int(_bound(node.start, values)), int(_bound(node.end, values)) + 1)
+    meter = current_meter()
+    if meter is not None:
+        meter.charge(len(indices) * loop_cost(node.commands), node_position(node))
+    results = _run_tasks([(node.commands, values, node.slot, i) for i in indices], node.options)
+    if indices:
+        values[node.slot] = indices[-1]
+    _finish(node, results, values)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Node Profiler
+Records call counts and cumulative/self time for every statement and
+expression node the tree-walker runs, and for each command handler, keyed by
+the node so results map back to source lines and columns.
+
+The profiler hooks sys.setprofile only while a run is being profiled; nodes
+carry no instrumentation, so a normal run pays nothing for it. Variable
+reads (VarRef) are not nodes of their own here: their time counts as self
+time of the node that reads them.
+"""
+
+import sys
+import time
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from warpy_core import AST_NODES, CommandNode, LoopNode, WhileNode, ConditionalNode, node_position
+from warpy_vector import VectorLoopNode
+
+# Methods whose frames are node executions
+NODE_METHODS = ('execute', 'evaluate')
+DEFAULT_HOTSPOTS = 20
+
+
+def node_label(node) -> str:
+    """Short name of a node for tables and stacks, e.g. 'for i' or 'burn_the_heretic'."""
+    if isinstance(node, CommandNode):
+        return node.name
+    if isinstance(node, LoopNode):
+        return f"for {node.varname}"
+    if isinstance(node, WhileNode):
+        return "while"
+    if isinstance(node, ConditionalNode):
+        return "if"
+    varname = getattr(node, 'varname', None)
+    if varname is not None:
+        return f"{type(node).__name__} {varname}"
+    return type(node).__name__
+
+
+class NodeStats:
+    __slots__ = ('label', 'line', 'column', 'calls', 'cumulative', 'self_time')
+
+    def __init__(self, label, line, column):
+        self.label = label
+        self.line = line
+        self.column = column
+        self.calls = 0
+        self.cumulative = 0
+        self.self_time = 0
+
+    def position(self):
+        return f"{self.line}" if self.column is None else f"{self.line}:{self.column}"
+
+
+class _Entry:
+    """A node (or handler) running right now: where it started and how much its callees took."""
+    __slots__ = ('key', 'frame', 'start', 'children', 'stack_key', 'handler_code')
+
+    def __init__(self, key, frame, start, stack_key, handler_code):
+        self.key = key
+        self.frame = frame
+        self.start = start
+        self.children = 0
+        self.stack_key = stack_key
+        self.handler_code = handler_code
+
+
+class Profiler:
+    """Collects per-node timings while installed as the profile hook; times are in nanoseconds."""
+
+    def __init__(self):
+        self.stats: Dict[object, NodeStats] = {}
+        # Collapsed stacks: tuple of frame names -> self time
+        self.stacks: Dict[Tuple[str, ...], int] = {}
+        self._stack: List[_Entry] = []
+        self._node_codes = set()
+        for cls in AST_NODES + (VectorLoopNode,):
+            for klass in cls.__mro__:
+                for name in NODE_METHODS:
+                    method = klass.__dict__.get(name)
+                    if method is not None:
+                        self._node_codes.add(method.__code__)
+
+    def __enter__(self):
+        sys.setprofile(self._hook)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(None)
+        # An error can leave entries open; close them at the time the run stopped
+        now = time.perf_counter_ns()
+        while self._stack:
+            self._pop(now)
+        return False
+
+    def _hook(self, frame, event, arg):
+        if event == 'call':
+            code = frame.f_code
+            stack = self._stack
+            if code in self._node_codes:
+                node = frame.f_locals.get('self')
+                if node is not None:
+                    self._push(node, node, frame)
+            elif stack and code is stack[-1].handler_code:
+                parent = stack[-1].key
+                self._push(('handler', parent), parent, frame, f"{parent.name}()")
+        elif event == 'return':
+            stack = self._stack
+            if stack and stack[-1].frame is frame:
+                self._pop(time.perf_counter_ns())
+
+    def _push(self, key, node, frame, label=None):
+        stats = self.stats.get(key)
+        if stats is None:
+            line, column = node_position(node) if key is node else (None, None)
+            if line is None and self._stack:
+                # Handlers and nodes the optimizer built report the position of their caller
+                parent = self.stats[self._stack[-1].key]
+                line, column = parent.line, parent.column
+            stats = self.stats[key] = NodeStats(label or node_label(node), line, column)
+        stats.calls += 1
+        name = stats.label if stats.line is None else f"{stats.label}:{stats.position()}"
+        stack_key = (self._stack[-1].stack_key if self._stack else ()) + (name,)
+        handler = getattr(node, 'handler', None) if key is node else None
+        handler_code = getattr(handler, '__code__', None)
+        self._stack.append(_Entry(key, frame, time.perf_counter_ns(), stack_key, handler_code))
+
+    def _pop(self, now):
+        entry = self._stack.pop()
+        elapsed = now - entry.start
+        own = elapsed - entry.children
+        stats = self.stats[entry.key]
+        if not any(open_entry.key is entry.key for open_entry in self._stack):
+            # A node already open further up has its whole time counted there
+            stats.cumulative += elapsed
+        stats.self_time += own
+        self.stacks[entry.stack_key] = self.stacks.get(entry.stack_key, 0) + own
+        if self._stack:
+            self._stack[-1].children += elapsed
+
+    def hotspots(self, limit: Optional[int] = DEFAULT_HOTSPOTS) -> List[NodeStats]:
+        """Nodes by descending self time."""
+        ranked = sorted(self.stats.values(), key=lambda s: s.self_time, reverse=True)
+        return ranked if limit is None else ranked[:limit]
+
+    def report(self, stream: TextIO, limit: Optional[int] = DEFAULT_HOTSPOTS) -> None:
+        total = sum(s.self_time for s in self.stats.values())
+        stream.write(f"{'self ms':>10} {'self %':>7} {'cum ms':>10} {'calls':>9} {'line:col':>9}  node\n")
+        for s in self.hotspots(limit):
+            share = 100 * s.self_time / total if total else 0.0
+            position = '' if s.line is None else s.position()
+            stream.write(f"{s.self_time / 1e6:10.3f} {share:6.1f}% {s.cumulative / 1e6:10.3f} "
+                         f"{s.calls:9d} {position:>9}  {s.label}\n")
+
+    def write_collapsed(self, stream: TextIO) -> None:
+        """Write 'frame;frame;frame microseconds' lines, the input format of flamegraph.pl and speedscope."""
+        for stack, own in sorted(self.stacks.items()):
+            micros = own // 1000
+            if micros:
+                stream.write(f"{';'.join(stack)} {micros}\n")
+
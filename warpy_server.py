@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Script Server
+A long-running process (`warpy_interpreter.py --serve`) that accepts scripts
+over a Unix socket or a localhost TCP port and answers with their output and
+exit status, so tools pay a round trip instead of a cold start per script.
+
+The protocol is one JSON object per line each way. A request:
+
+    {"id": 1, "source": "burn_the_heretic(1)\\n", "inputs": ["Guilliman"],
+     "engine": "tree", "opt_level": 1, "name": "dash.wp40k", "timeout": 5,
+     "max_steps": 100000, "memory_limit": 64}
+
+Only "source" is required. "timeout" (seconds), "max_steps" and
+"memory_limit" (MB) can only lower the server's own limits; they become
+the run's warpy_budget budget, so a script that loops past its time is
+stopped at its next iteration with the line it was on. SIGALRM stops it
+ALARM_GRACE seconds later if it is stuck elsewhere (e.g. one huge
+multiplication). The response echoes "id" and carries
+"exit_status" (see the EXIT_* constants), "output", "error" (null on
+success) and "compile_ms"/"run_ms". A connection can send any number of
+requests; their responses come back in order.
+
+The event loop only moves bytes: scripts run on a process pool whose workers
+build the parser once and keep warpy.compile()'s program cache, so a script
+seen before skips parsing too. At most max_concurrent scripts run at once;
+up to max_pending more wait for a slot, and requests beyond that are
+answered straight away with EXIT_BUSY. A connection's next request is not
+read until its previous response has been written out.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple, Union
+
+from warpy_budget import Budget, DeadlineExceeded
+from warpy_core import DEFAULT_OPT_LEVEL, ENGINES, OPT_LEVELS, PARSER_KINDS
+
+DEFAULT_ADDRESS = 'localhost:8740'
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MAX_PENDING = 64
+MAX_REQUEST_BYTES = 4 * 1024 * 1024
+# Seconds after the budget's deadline before a script that never reaches a loop iteration is interrupted
+ALARM_GRACE = 1.0
+
+EXIT_OK = 0
+EXIT_ERROR = 1            # the script failed to compile or raised
+EXIT_BAD_REQUEST = 64     # not a JSON object with a "source" string, or a field is invalid
+EXIT_BUSY = 75            # too many requests waiting; retry later
+EXIT_TIMEOUT = 124        # stopped after its timeout
+
+Address = Union[str, Tuple[str, int]]
+
+
+class ScriptTimeout(Exception):
+    pass
+
+
+def parse_address(text: str) -> Address:
+    """'unix:/path' or anything with a slash is a socket path; 'host:port' or 'port' is TCP."""
+    if text.startswith('unix:'):
+        return text[len('unix:'):]
+    if '/' in text:
+        return text
+    host, _, port = text.rpartition(':')
+    return (host or 'localhost', int(port))
+
+
+def _alarm(signum, frame):
+    raise ScriptTimeout()
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def _init_worker(parser_kind: str) -> None:
+    from warpy_core import get_parser
+    get_parser(parser_kind)
+    # Workers leave shutdown to the pool rather than the server's SIGTERM handling
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _alarm)
+
+
+def execute_request(source: str, inputs, engine: str, opt_level: int, parser_kind: str,
+                    name: str, timeout: Optional[float], budget: Optional[Budget] = None) -> Dict[str, Any]:
+    """Compile and run one script in a worker process and build its response."""
+    import warpy
+    from warpy_output import CaptureSink
+
+    sink = CaptureSink()
+    program = None
+    status, error = EXIT_OK, None
+    compile_ms = 0.0
+    budget = (budget or Budget()).tightened(time_limit=timeout or None)
+    if timeout and hasattr(signal, 'SIGALRM'):
+        signal.setitimer(signal.ITIMER_REAL, timeout + ALARM_GRACE)
+    start = time.perf_counter()
+    try:
+        program = warpy.compile(source, engine, opt_level, parser_kind, name)
+        compile_ms = (time.perf_counter() - start) * 1e3
+        program.run(inputs, output=sink, budget=budget)
+    except ScriptTimeout:
+        status, error = EXIT_TIMEOUT, f"script stopped after {timeout:g} s"
+    except DeadlineExceeded as exc:
+        status, error = EXIT_TIMEOUT, ''.join(traceback.format_exception_only(exc)).rstrip()
+    except Exception as exc:
+        status, error = EXIT_ERROR, ''.join(traceback.format_exception_only(exc)).rstrip()
+    finally:
+        if timeout and hasattr(signal, 'SIGALRM'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    elapsed_ms = (time.perf_counter() - start) * 1e3
+    if program is None:
+        compile_ms = elapsed_ms
+    return {'exit_status': status, 'output': sink.getvalue(), 'error': error,
+            'compile_ms': round(compile_ms, 3), 'run_ms': round(elapsed_ms - compile_ms, 3)}
+
+
+def _refusal(status: int, error: str) -> Dict[str, Any]:
+    return {'exit_status': status, 'output': '', 'error': error, 'compile_ms': 0.0, 'run_ms': 0.0}
+
+
+class WarPyServer:
+    def __init__(self, workers: Optional[int] = None, max_concurrent: Optional[int] = None,
+                 max_pending: int = DEFAULT_MAX_PENDING, timeout: float = DEFAULT_TIMEOUT,
+                 parser_kind: str = 'lalr', budget: Optional[Budget] = None):
+        if parser_kind not in PARSER_KINDS:
+            raise ValueError(f"Unknown parser '{parser_kind}'. Expected one of: {', '.join(PARSER_KINDS)}.")
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or self.workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.parser_kind = parser_kind
+        # Step and memory limits every script gets; the time limit is timeout
+        self.budget = budget or Budget()
+        self.pool = self._start_pool()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.parser_kind,))
+
+    def _job(self, request) -> Union[Tuple, Dict[str, Any]]:
+        """The execute_request arguments for a request, or the response refusing it."""
+        if not isinstance(request, dict) or not isinstance(request.get('source'), str):
+            return _refusal(EXIT_BAD_REQUEST, 'request must be a JSON object with a "source" string')
+        # Checked here so that a bad field is refused like a bad request, not run and failed in a worker
+        engine = request.get('engine', 'tree')
+        if engine not in ENGINES:
+            raise ValueError(f"engine must be one of {', '.join(ENGINES)}, not {engine!r}")
+        opt_level = int(request.get('opt_level', DEFAULT_OPT_LEVEL))
+        if opt_level not in OPT_LEVELS:
+            raise ValueError(f"opt_level must be one of {', '.join(map(str, OPT_LEVELS))}, not {opt_level}")
+        timeout = request.get('timeout')
+        timeout = self.timeout if timeout is None else min(float(timeout), self.timeout)
+        limits = {}
+        if request.get('max_steps') is not None:
+            limits['max_steps'] = int(request['max_steps'])
+        if request.get('memory_limit') is not None:
+            limits['memory_limit'] = int(float(request['memory_limit']) * 2 ** 20)
+        if any(limit < 0 for limit in limits.values()):
+            raise ValueError("max_steps and memory_limit must not be negative")
+        budget = self.budget.tightened(**limits)
+        return (request['source'], request.get('inputs'), engine, opt_level, self.parser_kind,
+                str(request.get('name', '<request>')), timeout, budget)
+
+    async def submit(self, request) -> Dict[str, Any]:
+        try:
+            job = self._job(request)
+        except (TypeError, ValueError) as exc:
+            job = _refusal(EXIT_BAD_REQUEST, f"bad request: {exc}")
+        if isinstance(job, dict):
+            return job
+        if self._waiting >= self.max_concurrent + self.max_pending:
+            return _refusal(EXIT_BUSY, 'server busy, retry later')
+        self._waiting += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                try:
+                    return await loop.run_in_executor(self.pool, execute_request, *job)
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed for memory); later requests get a fresh pool
+                    self.pool.shutdown(wait=False)
+                    self.pool = self._start_pool()
+                    return _refusal(EXIT_ERROR, 'worker process died while running the script')
+        finally:
+            self._waiting -= 1
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    response = _refusal(EXIT_BAD_REQUEST, f"request longer than {MAX_REQUEST_BYTES} bytes")
+                    writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as exc:
+                    request, response = None, _refusal(EXIT_BAD_REQUEST, f"invalid JSON: {exc}")
+                else:
+                    response = await self.submit(request)
+                if isinstance(request, dict) and 'id' in request:
+                    response['id'] = request['id']
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: Address, ready=None) -> None:
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        if isinstance(address, str):
+            server = await asyncio.start_unix_server(self.handle_connection, address, limit=MAX_REQUEST_BYTES)
+        else:
+            server = await asyncio.start_server(self.handle_connection, *address, limit=MAX_REQUEST_BYTES)
+        if ready is not None:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.pool.shutdown(cancel_futures=True)
+
+
+def serve(address: str = DEFAULT_ADDRESS, workers: Optional[int] = None, max_concurrent: Optional[int] = None,
+          parser_kind: str = 'lalr', budget: Optional[Budget] = None) -> None:
+    """Run a server until interrupted (Ctrl-C or SIGTERM); budget's time limit, if any, replaces DEFAULT_TIMEOUT."""
+    target = parse_address(address)
+    signal.signal(signal.SIGTERM, _interrupt)
+    budget = budget or Budget()
+    timeout = DEFAULT_TIMEOUT if budget.time_limit is None else budget.time_limit
+    server = WarPyServer(workers, max_concurrent, timeout=timeout, parser_kind=parser_kind,
+                         budget=budget._replace(time_limit=None))
+
+    def ready(listener):
+        where = ', '.join(str(sock.getsockname()) for sock in listener.sockets)
+        print(f"WarPy40K server on {where} ({server.workers} workers, {server.max_concurrent} concurrent)",
+              flush=True)
+
+    try:
+        asyncio.run(server.serve(target, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if isinstance(target, str) and os.path.exists(target):
+            os.unlink(target)
+
+
+def submit(address: str, source: str, inputs=None, **options) -> Dict[str, Any]:
+    """Send one script to a running server and wait for its response (a blocking client for tools)."""
+    target = parse_address(address)
+    if isinstance(target, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(target)
+    else:
+        sock = socket.create_connection(target)
+    with sock, sock.makefile('rwb') as stream:
+        stream.write(json.dumps(dict(options, source=source, inputs=inputs)).encode('utf-8') + b'\n')
+        stream.flush()
+        return json.loads(stream.readline())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Streaming Execution
+Runs a script a top-level statement at a time while it is still being read,
+from a file, a memory-mapped file or stdin, instead of reading, parsing and
+building the whole program before its first statement runs. Each statement
+is parsed, optimized, bound and run as soon as its block closes, then
+dropped, so the time to the first output and the memory the program takes
+depend on the largest statement, not on the length of the script.
+
+A statement starts on a line that begins in column 0 outside any string or
+parentheses, other than a blank or comment line, and runs to the next one.
+elif, else, on_success and on_failure in column 0 carry on the statement
+before them, so a block only runs once the next statement has begun (or
+the script has ended); a simple statement runs as soon as its line is read.
+
+The statements share one slot numbering and one frame, so variables carry
+over from one to the next as in a whole-program run, and they run under one
+budget. What cannot be known before the rest of the script arrives is only
+checked as it arrives: a syntax error, a wrong call or a parallel task
+whose variable a later statement uses is reported when its statement is
+reached, after the output of the statements before it.
+"""
+
+import contextlib
+import mmap
+import os
+import re
+import stat
+import sys
+from typing import Iterable, Iterator, Optional, Tuple
+
+from warpy_budget import metered
+from warpy_core import (AST_NODES, DEFAULT_OPT_LEVEL, Frame, SlotResolver, StreamChecker, bind_commands,
+                               node_fields, optimize_program, parse_program, position_errors, prepare_engine)
+from warpy_output import flush_output
+
+# Keywords that carry on the statement before them from column 0
+CONTINUATION = re.compile(r'(?:elif|else|on_success|on_failure)(?![A-Za-z0-9_])')
+# Keywords of statements with a block; any other statement ends with its line
+BLOCK = re.compile(r'(?:if|for|while|parallel)(?![A-Za-z0-9_])')
+_SPECIAL = re.compile(r'["#()]')
+
+
+def _scan(line: str, in_string: bool, depth: int) -> Tuple[bool, int]:
+    """Whether a string is still open after line, and how deep in parentheses it ends."""
+    pos = 0
+    while True:
+        if in_string:
+            end = line.find('"', pos)
+            if end < 0:
+                return True, depth
+            in_string = False
+            pos = end + 1
+        match = _SPECIAL.search(line, pos)
+        if match is None:
+            return False, depth
+        char = match.group()
+        if char == '#':
+            return False, depth
+        if char == '"':
+            in_string = True
+        elif char == '(':
+            depth += 1
+        elif depth:
+            depth -= 1
+        pos = match.end()
+
+
+def split_statements(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """Yield (first line number, source) for each top-level statement of a script read line by line."""
+    chunk = []
+    first_line = 0
+    block = False
+    in_string = False
+    depth = 0
+    for number, line in enumerate(lines, 1):
+        if not in_string and depth == 0:
+            text = line.lstrip()
+            if not text or text[0] == '#':
+                # Blank and comment lines change nothing; between statements they belong to none
+                if chunk:
+                    chunk.append(line)
+                continue
+            if not chunk or (line[0] not in ' \t' and not CONTINUATION.match(line)):
+                if chunk:
+                    yield first_line, ''.join(chunk)
+                chunk = []
+                first_line = number
+                block = BLOCK.match(line) is not None
+        chunk.append(line)
+        in_string, depth = _scan(line, in_string, depth)
+        if not block and not in_string and depth == 0:
+            # A simple statement: nothing after it can belong to it
+            yield first_line, ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield first_line, ''.join(chunk)
+
+
+def _shift_lines(node, offset: int) -> None:
+    if isinstance(node, (list, tuple)):
+        for item in node:
+            _shift_lines(item, offset)
+    elif isinstance(node, AST_NODES):
+        if node.line is not None:
+            node.line += offset
+        for _, child in node_fields(node):
+            _shift_lines(child, offset)
+
+
+def _parse_statement(source: str, first_line: int, parser_kind: str, resolver: SlotResolver):
+    try:
+        program = parse_program(source, parser_kind, resolver=resolver)
+    except Exception as exc:
+        # Parse errors count lines from the start of the statement; the lexer
+        # can raise one while handling another, which is shown too
+        error = exc
+        while error is not None:
+            if isinstance(getattr(error, 'line', None), int) and error.line > 0:
+                error.line += first_line - 1
+            error = error.__context__
+        raise
+    if first_line > 1:
+        _shift_lines(program, first_line - 1)
+    return program
+
+
+def run_stream(lines: Iterable[str], context=None, engine='tree', script_name='<stdin>', parser_kind='lalr',
+               opt_level=DEFAULT_OPT_LEVEL, budget=None, flush_each=False):
+    """Run a script statement by statement as its lines arrive; returns the final variables as a dict.
+
+    flush_each writes out the output of each statement before the next one
+    is read, for a script fed by a pipe that may keep it waiting.
+    """
+    if context is None:
+        context = {}
+    resolver = SlotResolver()
+    checker = StreamChecker()
+    frame = Frame((), context)
+    try:
+        with metered(budget):
+            for first_line, source in split_statements(lines):
+                program = _parse_statement(source, first_line, parser_kind, resolver)
+                program = optimize_program(program, opt_level)
+                # Temporaries the optimizer added keep the slots it gave them
+                for name in program.names[len(resolver.names):]:
+                    resolver.slot_for(name)
+                errors = checker.add(program)
+                if errors:
+                    raise position_errors(errors, script_name)
+                bind_commands(program, script_name, checker)
+                frame.grow(program.names, context)
+                prepare_engine(program, engine, script_name)(frame)
+                if flush_each:
+                    flush_output()
+    finally:
+        frame.store(context)
+        flush_output()
+    return context
+
+
+@contextlib.contextmanager
+def script_lines(script_path: str, use_mmap=False) -> Iterator[Iterable[str]]:
+    """The lines of a script, read as they are used: stdin for '-', or through mmap when use_mmap."""
+    if script_path == '-':
+        yield sys.stdin
+        return
+    if not use_mmap:
+        with open(script_path, 'r') as f:
+            yield f
+        return
+    with open(script_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield iter(())  # an empty file cannot be mapped
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield (line.decode('utf-8') for line in iter(mapped.readline, b''))
+
+
+def stream_script(script_path: str, engine='tree', parser_kind='lalr', opt_level=DEFAULT_OPT_LEVEL, budget=None,
+                  use_mmap=False, context: Optional[dict] = None):
+    """Run a script file ('-' for stdin) with run_stream."""
+    script_name = '<stdin>' if script_path == '-' else script_path
+    with script_lines(script_path, use_mmap) as lines:
+        # A pipe or terminal may pause between statements; a regular file will not
+        flush_each = script_path == '-' and not stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode)
+        return run_stream(lines, context, engine, script_name, parser_kind, opt_level, budget, flush_each)
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+WarPy40K to Python Transpiler
+Emits equivalent Python source for a parsed program and runs it through
+compile()/exec, so CPython's own bytecode executes the hot loops.
+
+Variables live in Python locals while the program runs and are written back
+to their frame slots when it finishes. Runtime errors are mapped back to the
+WarPy40K expression (or, failing that, the line) that produced them.
+"""
+
+import linecache
+import re
+import sys
+from itertools import islice
+
+from warpy_core import (
+    CommandNode, DeclarationNode, LoopNode, ConditionalNode, ComparisonNode,
+    WhileNode, AssignmentNode, StrFunctionNode, VarRef, UNBOUND, SumNode, SubtractionNode, MultiplicationNode,
+    DivisionNode, ModuloNode, LogicalAndNode, LogicalOrNode, ARITHMETIC_NODES, OPERAND_NODES, PARALLEL_NODES,
+    BINARY_FUNCTIONS, COMPARE_FUNCTIONS, compare_function, coerce_dg, annotate_error, bind_commands, node_position, resolve_slots, TEMP_PREFIX,
+)
+from warpy_budget import current_meter, loop_cost
+from warpy_output import write_line
+from warpy_vector import VectorLoopNode
+
+ENTRY_POINT = '_warpy_main'
+
+# Operators emitted inline; division, modulo and the logical operators keep
+# the interpreter's helpers for their error messages and eager evaluation
+INLINE_OPERATORS = {
+    SumNode: '+',
+    SubtractionNode: '-',
+    MultiplicationNode: '*',
+}
+
+HELPER_NAMES = {
+    DivisionNode: '_divide',
+    ModuloNode: '_modulo',
+    LogicalAndNode: '_logical_and',
+    LogicalOrNode: '_logical_or',
+}
+
+PLAIN_LITERALS = (int, float, str, bool, type(None))
+
+# Bracket the text of an expression that has a source position until emit() strips them.
+# repr() escapes private-use characters, so they never occur in emitted literals
+SPAN_OPEN = '\ue000'
+SPAN_NAME = '\ue001'
+SPAN_CLOSE = '\ue002'
+SPAN_MARK = re.compile(f"{SPAN_OPEN}(\\d+){SPAN_NAME}|{SPAN_CLOSE}")
+
+
+class PythonProgram:
+    """Generated Python source plus what is needed to run it and map errors back."""
+
+    def __init__(self, source, namespace, line_map, filename, span_map=None):
+        self.source = source
+        self.namespace = namespace
+        self.line_map = line_map
+        self.span_map = span_map or {}
+        self.filename = filename
+        self.code = compile(source, filename, 'exec')
+        # Lets Python tracebacks show the generated source
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+
+    def warpy_position(self, python_line):
+        """(line, column) of the WarPy40K statement a generated line belongs to, or None."""
+        return self.line_map.get(python_line)
+
+    def expression_position(self, python_line, start, end):
+        """(line, column) of the innermost WarPy40K expression whose generated text covers start:end, or None."""
+        best = None
+        for span_start, span_end, position in self.span_map.get(python_line, ()):
+            if span_start <= start and end <= span_end:
+                if best is None or span_end - span_start < best[1] - best[0]:
+                    best = span_start, span_end, position
+        return best and best[2]
+
+    def run(self, values):
+        """Run on a frame's values list, which holds the variables by slot."""
+        namespace = dict(self.namespace)
+        exec(self.code, namespace)
+        try:
+            namespace[ENTRY_POINT](values)
+        except Exception as exc:
+            if isinstance(exc, UnboundLocalError) and isinstance(exc.__context__, MemoryError):
+                # CPython's in-place `s = s + t` unbinds s while it resizes; when that runs out of
+                # memory the write-back in the finally block fails, hiding the MemoryError
+                exc = exc.__context__
+                self._annotate(exc)
+                raise exc from None
+            self._annotate(exc)
+            raise
+        return values
+
+    def _annotate(self, exc):
+        position = None
+        tb = exc.__traceback__
+        while tb is not None:
+            if tb.tb_frame.f_code.co_filename == self.filename:
+                position = self._failed_position(tb) or position
+            tb = tb.tb_next
+        if position is not None:
+            annotate_error(exc, self.filename[len('<warpy:'):-1], *position)
+
+    def _failed_position(self, tb):
+        # The failing instruction's columns (Python 3.11+) pick out the expression within the line
+        code = tb.tb_frame.f_code
+        if hasattr(code, 'co_positions') and tb.tb_lasti >= 0:
+            line, _, start, end = next(islice(code.co_positions(), tb.tb_lasti // 2, None), (None,) * 4)
+            if line == tb.tb_lineno and start is not None and end is not None:
+                found = self.expression_position(line, start, end)
+                if found is not None:
+                    return found
+        return self.warpy_position(tb.tb_lineno)
+
+
+class PythonTranspiler:
+    def __init__(self, names, script_name='<string>'):
+        self.names = tuple(names)
+        self.script_name = script_name
+        self.lines = []
+        self.line_map = {}
+        self.span_map = {}
+        self.span_positions = []
+        self.constants = {}
+        self.handlers = {}
+        self.temp_counter = 0
+        self.current_position = None
+
+    # Output helpers
+
+    def emit(self, indent, text):
+        prefix = '    ' * indent
+        text, spans = self.strip_spans(text, len(prefix))
+        self.lines.append(prefix + text)
+        if self.current_position is not None:
+            self.line_map[len(self.lines)] = self.current_position
+        if spans:
+            self.span_map[len(self.lines)] = spans
+
+    def mark_span(self, node, text):
+        """Bracket an expression's text so that emit() records where the node's code lands."""
+        if getattr(node, 'line', None) is None:
+            return text
+        self.span_positions.append(node_position(node))
+        return f"{SPAN_OPEN}{len(self.span_positions) - 1}{SPAN_NAME}{text}{SPAN_CLOSE}"
+
+    def strip_spans(self, text, offset):
+        # Columns are counted in UTF-8 bytes, as in code.co_positions()
+        if SPAN_OPEN not in text:
+            return text, []
+        pieces = []
+        spans = []
+        opened = []
+        column = offset
+        done = 0
+        for mark in SPAN_MARK.finditer(text):
+            chunk = text[done:mark.start()]
+            pieces.append(chunk)
+            column += len(chunk.encode('utf-8'))
+            done = mark.end()
+            if mark.group(1) is not None:
+                opened.append((column, self.span_positions[int(mark.group(1))]))
+            else:
+                start, position = opened.pop()
+                spans.append((start, column, position))
+        pieces.append(text[done:])
+        return ''.join(pieces), spans
+
+    def variable(self, name):
+        if name.startswith(TEMP_PREFIX):
+            return f"t_{name[len(TEMP_PREFIX):]}"
+        return f"v_{name}"
+
+    def temp(self):
+        self.temp_counter += 1
+        return f"_t{self.temp_counter}"
+
+    def literal(self, value):
+        if isinstance(value, PLAIN_LITERALS):
+            return repr(value)
+        # Anything else (e.g. an unevaluated node) is passed through as an object
+        key = f"_k{len(self.constants)}"
+        self.constants[key] = value
+        return key
+
+    def handler(self, node):
+        local_name = f"cmd_{node.name}"
+        self.handlers[local_name] = (node.name, node.handler)
+        return local_name
+
+    # Program
+
+    def transpile(self, statements):
+        body_start = len(self.lines)
+        self.emit_block(statements, 2, frozenset())
+        body = self.lines[body_start:]
+        body_map = {line - body_start: wp for line, wp in self.line_map.items()}
+        body_spans = {line - body_start: spans for line, spans in self.span_map.items()}
+        del self.lines[body_start:]
+        self.line_map = {}
+        self.span_map = {}
+        self.current_position = None
+
+        header = [
+            f"# Generated from {self.script_name} by warpy_transpiler",
+            f"def {ENTRY_POINT}(_frame):",
+        ]
+        for local_name, (name, _) in sorted(self.handlers.items()):
+            header.append(f"    {local_name} = _commands[{name!r}]")
+        for slot, name in enumerate(self.names):
+            header.append(f"    {self.variable(name)} = _frame[{slot}]")
+        header.append("    _meter = _current_meter()")
+        header.append("    try:")
+        footer = ["    finally:"]
+        if self.names:
+            values = ', '.join(self.variable(name) for name in self.names)
+            footer.append(f"        _frame[:] = [{values}]")
+        else:
+            footer.append("        pass")
+        if not body:
+            body = ["        pass"]
+
+        source_lines = header + body + footer
+        offset = len(header)
+        line_map = {line + offset: wp for line, wp in body_map.items()}
+        span_map = {line + offset: spans for line, spans in body_spans.items()}
+        namespace = {
+            '_commands': dict(self.handlers.values()),
+            '_write_line': write_line,
+            '_UNBOUND': UNBOUND,
+            '_coerce_dg': coerce_dg,
+            '_divide': BINARY_FUNCTIONS[DivisionNode],
+            '_modulo': BINARY_FUNCTIONS[ModuloNode],
+            '_logical_and': BINARY_FUNCTIONS[LogicalAndNode],
+            '_logical_or': BINARY_FUNCTIONS[LogicalOrNode],
+            '_never': compare_function(None),
+            '_current_meter': current_meter,
+        }
+        namespace.update(self.constants)
+        return "\n".join(source_lines) + "\n", namespace, line_map, span_map
+
+    # Statements
+
+    def emit_block(self, statements, indent, bound):
+        """Emit statements; bound holds names certainly assigned at this point."""
+        if not statements:
+            self.emit(indent, "pass")
+            return bound
+        for stmt in statements:
+            bound = self.emit_statement(stmt, indent, bound)
+        return bound
+
+    def emit_statement(self, stmt, indent, bound):
+        if getattr(stmt, 'line', None) is not None:
+            self.current_position = node_position(stmt)
+        if isinstance(stmt, CommandNode):
+            self.emit_call(stmt, indent, bound, target=None)
+        elif isinstance(stmt, DeclarationNode):
+            self.emit_declaration(stmt, indent, bound)
+            bound = bound | {stmt.varname}
+        elif isinstance(stmt, AssignmentNode):
+            value = self.value_expression(stmt.expr, ARITHMETIC_NODES + (ComparisonNode,), bound)
+            self.emit(indent, f"{self.variable(stmt.varname)} = {value}")
+            bound = bound | {stmt.varname}
+        elif isinstance(stmt, VectorLoopNode):
+            self.emit_vector_loop(stmt, indent, bound)
+        elif isinstance(stmt, LoopNode):
+            self.emit_loop(stmt, indent, bound)
+        elif isinstance(stmt, WhileNode):
+            condition = self.condition(stmt.condition, bound)
+            self.emit(indent, f"while {condition}:")
+            self.emit_block(stmt.commands, indent + 1, bound)
+            self.emit_back_edge(stmt, indent + 1)
+        elif isinstance(stmt, ConditionalNode):
+            position = self.current_position
+            self.emit(indent, f"if {self.condition(stmt.condition, bound)}:")
+            self.emit_block(stmt.then_commands, indent + 1, bound)
+            if stmt.else_commands:
+                self.current_position = position
+                self.emit(indent, "else:")
+                self.emit_block(stmt.else_commands, indent + 1, bound)
+        elif isinstance(stmt, PARALLEL_NODES):
+            self.emit_parallel(stmt, indent)
+        else:
+            raise TypeError(f"Cannot transpile statement of type {type(stmt).__name__}")
+        return bound
+
+    def emit_call(self, node, indent, bound, target):
+        assign = f"{target} = " if target else ""
+        if node.handler is None:
+            self.emit(indent, f"{assign}_write_line({f'Unknown command: {node.name}'!r})")
+            return
+        handler = self.handler(node)
+        args = [self.value_expression(arg, ARITHMETIC_NODES + (ComparisonNode,), bound) for arg in node.args]
+        self.emit(indent, f"{assign}{handler}({', '.join(args)})")
+
+    def emit_declaration(self, stmt, indent, bound):
+        target = self.variable(stmt.varname)
+        value = stmt.callnode
+        if isinstance(value, CommandNode):
+            if stmt.typename == "dg":
+                result = self.temp()
+                self.emit_call(value, indent, bound, target=result)
+                self.emit(indent, f"{target} = _coerce_dg({result}, {stmt.varname!r})")
+            else:
+                self.emit_call(value, indent, bound, target=target)
+        elif stmt.typename == "dg" and (isinstance(value, str) or value is None):
+            self.emit(indent, f"{target} = _coerce_dg({value!r}, {stmt.varname!r})")
+        elif isinstance(value, ARITHMETIC_NODES + (VarRef,)):
+            self.emit(indent, f"{target} = {self.value_expression(value, ARITHMETIC_NODES, bound)}")
+        else:
+            # Any other value is stored as written
+            self.emit(indent, f"{target} = {self.literal(value)}")
+
+    def emit_loop(self, stmt, indent, bound):
+        bounds = []
+        for value in (stmt.start, stmt.end):
+            while isinstance(value, list) and len(value) == 1:
+                value = value[0]
+            if isinstance(value, list):
+                raise ValueError("Unexpected list value in loop range")
+            bounds.append(self.value_expression(value, (), bound))
+        start, end = bounds
+        self.emit(indent, f"for {self.variable(stmt.varname)} in range(int({start}), int({end}) + 1):")
+        self.emit_block(stmt.commands, indent + 1, bound | {stmt.varname})
+        self.emit_back_edge(stmt, indent + 1)
+
+    def emit_back_edge(self, stmt, indent):
+        # Charge the finished iteration to the run's budget, if it has one (see warpy_budget)
+        position = node_position(stmt)
+        self.current_position = position
+        self.emit(indent, "if _meter is not None:")
+        self.emit(indent + 1, f"_meter.remaining -= {loop_cost(stmt.commands)}")
+        self.emit(indent + 1, "if _meter.remaining <= 0:")
+        self.emit(indent + 2, f"_meter.check({position!r})")
+
+    def emit_vector_loop(self, stmt, indent, bound):
+        # The array path works on the frame, so the locals are stored first and reloaded after
+        values = ', '.join(self.variable(name) for name in self.names)
+        done = self.temp()
+        self.emit(indent, f"_frame[:] = [{values}]")
+        self.emit(indent, "try:")
+        self.emit(indent + 1, f"{done} = {self.literal(stmt)}.run_vector(_frame)")
+        self.emit(indent, "finally:")
+        self.emit(indent + 1, f"[{values}] = _frame")
+        self.emit(indent, f"if not {done}:")
+        self.emit_loop(stmt, indent + 1, bound)
+
+    def emit_parallel(self, stmt, indent):
+        # Tasks run as AST on the worker pool against the frame, like the array path above
+        values = ', '.join(self.variable(name) for name in self.names)
+        self.emit(indent, f"_frame[:] = [{values}]")
+        self.emit(indent, "try:")
+        self.emit(indent + 1, f"{self.literal(stmt)}.execute(_frame)")
+        self.emit(indent, "finally:")
+        self.emit(indent + 1, f"[{values}] = _frame")
+
+    # Expressions
+
+    def condition(self, condition, bound):
+        # Comparisons and variables are evaluated; any other condition is judged by its own truthiness
+        if isinstance(condition, (ComparisonNode, VarRef)):
+            return self.value_expression(condition, (ComparisonNode,), bound)
+        return repr(bool(condition))
+
+    def value_expression(self, value, evaluated_nodes, bound):
+        if isinstance(value, evaluated_nodes):
+            return self.expression(value, bound)
+        if isinstance(value, VarRef):
+            return self.reference(value.name, bound)
+        return self.literal(value)
+
+    def reference(self, name, bound):
+        # A variable that was never assigned reads as its own name
+        local_name = self.variable(name)
+        if name in bound:
+            return local_name
+        return f"({local_name} if {local_name} is not _UNBOUND else {name!r})"
+
+    def expression(self, node, bound):
+        return self.mark_span(node, self.expression_text(node, bound))
+
+    def expression_text(self, node, bound):
+        if isinstance(node, ComparisonNode):
+            left = self.value_expression(node.left, ARITHMETIC_NODES, bound)
+            right = self.value_expression(node.right, ARITHMETIC_NODES, bound)
+            if node.operator not in COMPARE_FUNCTIONS:
+                return f"_never({left}, {right})"
+            return f"({left} {node.operator} {right})"
+        if isinstance(node, StrFunctionNode):
+            return f"str({self.value_expression(node.expr, OPERAND_NODES, bound)})"
+        left = self.value_expression(node.left, OPERAND_NODES, bound)
+        right = self.value_expression(node.right, OPERAND_NODES, bound)
+        symbol = INLINE_OPERATORS.get(type(node))
+        if symbol:
+            return f"({left} {symbol} {right})"
+        return f"{HELPER_NAMES[type(node)]}({left}, {right})"
+
+
+def transpile(statements, script_name='<string>'):
+    """Return the Python source generated for a program."""
+    if not hasattr(statements, 'names'):
+        statements = resolve_slots(statements)
+    bind_commands(statements, script_name)
+    source, _, _, _ = PythonTranspiler(statements.names, script_name).transpile(statements)
+    return source
+
+
+def compile_program(statements, script_name='<string>'):
+    if not hasattr(statements, 'names'):
+        statements = resolve_slots(statements)
+    source, namespace, line_map, span_map = PythonTranspiler(statements.names, script_name).transpile(statements)
+    try:
+        return PythonProgram(source, namespace, line_map, f"<warpy:{script_name}>", span_map)
+    except SyntaxError as exc:
+        # e.g. CPython's limit of 20 statically nested blocks
+        raise ValueError(f"Program cannot be transpiled to Python: {exc.msg}") from exc
+
+
+def run_program(statements, frame, script_name='<string>'):
+    """Run resolved statements against a Frame and return it."""
+    compile_program(statements, script_name).run(frame.values)
+    return frame
+
+
+if __name__ == '__main__':
+    from warpy_core import parse_program
+
+    with open(sys.argv[1], 'r') as f:
+        print(transpile(parse_program(f.read()), sys.argv[1]), end='')
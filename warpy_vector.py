@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Loop Vectorizer
+Runs for loops whose iterations are independent as NumPy array operations.
+
+A loop qualifies when its body only assigns arithmetic on the loop variable,
+loop-invariant variables and literals, and only calls output commands (inside
+ifs whose conditions are such comparisons), with no loop-carried dependency:
+no variable the body assigns is read before the body assigns it. Every
+variable then becomes an array over the iteration range, computed a chunk of
+iterations at a time, and the chunk's output lines are written in one go.
+
+NumPy is optional. When it is missing, or when a chunk cannot reproduce the
+scalar results exactly (non-numeric operands, possible int64 overflow, float
+precision, division by zero), the loop runs on the scalar path instead, so
+output and final variable values always match the other engines.
+"""
+
+import importlib.util
+import operator
+
+from warpy_core import (
+    COMMANDS, OUTPUT_FORMATS, CommandNode, DeclarationNode, LoopNode, ConditionalNode, ComparisonNode,
+    AssignmentNode, VarRef, SumNode, SubtractionNode, MultiplicationNode, DivisionNode, ModuloNode,
+    ARITHMETIC_NODES, COMPARE_FUNCTIONS, command_accepts, node_position,
+)
+from warpy_budget import current_meter, loop_cost
+from warpy_output import write_lines
+
+# Shorter loops are not worth the array setup
+MIN_VECTOR_TRIPS = 64
+
+# Iterations computed per batch of array operations; bounds memory use and output latency
+CHUNK_SIZE = 1 << 16
+
+# Largest magnitude an int64 result may reach, and the range where int64 converts to float64 exactly
+INT64_LIMIT = 2 ** 63 - 1
+EXACT_FLOAT_INT = 2 ** 53
+
+# The scalar helpers test for a zero divisor themselves; chunks check it up front
+ARRAY_OPERATORS = {
+    SumNode: operator.add,
+    SubtractionNode: operator.sub,
+    MultiplicationNode: operator.mul,
+    DivisionNode: operator.truediv,
+    ModuloNode: operator.mod,
+}
+
+# Int operators whose result can outgrow both operands
+GROWING_OPERATORS = (SumNode, SubtractionNode, MultiplicationNode)
+
+
+# NumPy is optional and slow to import, so it is only loaded by the first vector loop that runs
+numpy = None
+_numpy_loaded = False
+
+
+def numpy_installed():
+    return importlib.util.find_spec('numpy') is not None
+
+
+def _load_numpy():
+    global numpy, _numpy_loaded
+    if not _numpy_loaded:
+        _numpy_loaded = True
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy is not None
+
+
+class _Decline(Exception):
+    """The current chunk cannot be computed exactly with arrays."""
+
+
+def _is_number(val):
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
+
+
+class LoopPlan:
+    """Vector steps for a loop body: ('assign', slot, expr) and ('emit', command, args, conditions)."""
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.assigned = tuple(sorted({step[1] for step in steps if step[0] == 'assign'}))
+
+
+class _Planner:
+    def __init__(self, loop):
+        self.loop = loop
+        self.steps = []
+        self.written = set()
+        self.body_slots = {stmt.slot for stmt in loop.commands if isinstance(stmt, (DeclarationNode, AssignmentNode))}
+
+    def plan(self):
+        if self.loop.slot in self.body_slots or not self.block(self.loop.commands, ()):
+            return None
+        return LoopPlan(self.steps)
+
+    def block(self, statements, conditions):
+        return all(self.statement(stmt, conditions) for stmt in statements)
+
+    def statement(self, stmt, conditions):
+        if isinstance(stmt, CommandNode):
+            return self.emit(stmt, conditions)
+        if isinstance(stmt, ConditionalNode):
+            # Branches may only produce output, so every assignment happens unconditionally
+            condition = stmt.condition
+            if isinstance(condition, (ComparisonNode, VarRef)):
+                if not self.value(condition, (ComparisonNode,)):
+                    return False
+            else:
+                condition = bool(condition)
+            return (self.block(stmt.then_commands, conditions + ((condition, True),))
+                    and self.block(stmt.else_commands or [], conditions + ((condition, False),)))
+        if conditions:
+            return False
+        if isinstance(stmt, DeclarationNode):
+            value = stmt.callnode
+            if isinstance(value, CommandNode) or not self.value(value, ARITHMETIC_NODES):
+                return False
+            return self.assign(stmt.slot, value)
+        if isinstance(stmt, AssignmentNode):
+            if not self.value(stmt.expr, ARITHMETIC_NODES + (ComparisonNode,)):
+                return False
+            return self.assign(stmt.slot, stmt.expr)
+        return False
+
+    def assign(self, slot, expr):
+        self.steps.append(('assign', slot, expr))
+        self.written.add(slot)
+        return True
+
+    def emit(self, node, conditions):
+        format_line = OUTPUT_FORMATS.get(node.name)
+        if format_line is None:
+            return False
+        # String literals are printed as written; everything else must be numeric
+        args = list(node.args)
+        if not all(isinstance(arg, str) or self.value(arg, ARITHMETIC_NODES + (ComparisonNode,)) for arg in args):
+            return False
+        if not command_accepts(format_line, len(args)):
+            # bind_commands rejects the call before the program runs
+            return False
+        self.steps.append(('emit', node.name, tuple(args), conditions))
+        return True
+
+    def value(self, val, evaluated_nodes):
+        """True when val, in a position that evaluates evaluated_nodes, is numeric arithmetic."""
+        if isinstance(val, VarRef):
+            # A variable the body assigns must already hold this iteration's value
+            return val.slot not in self.body_slots or val.slot in self.written
+        if isinstance(val, ComparisonNode) and isinstance(val, evaluated_nodes):
+            return self.value(val.left, ARITHMETIC_NODES) and self.value(val.right, ARITHMETIC_NODES)
+        if isinstance(val, ARITHMETIC_NODES) and isinstance(val, evaluated_nodes):
+            return self.value(val.left, ARITHMETIC_NODES) and self.value(val.right, ARITHMETIC_NODES)
+        return _is_number(val)
+
+
+def plan_loop(loop):
+    """The vector plan for a resolved LoopNode, or None when its iterations depend on each other."""
+    return _Planner(loop).plan()
+
+
+# Chunk evaluation
+
+def _int_bounds(val):
+    if isinstance(val, numpy.ndarray):
+        return int(val.min()), int(val.max())
+    return val, val
+
+
+def _is_int(val):
+    if isinstance(val, numpy.ndarray):
+        return val.dtype.kind in 'iu'
+    return isinstance(val, int)
+
+
+def _check_exact_float(val):
+    # Mixing ints with floats is exact only while the ints fit a float64 mantissa
+    if _is_int(val):
+        low, high = _int_bounds(val)
+        if low < -EXACT_FLOAT_INT or high > EXACT_FLOAT_INT:
+            raise _Decline()
+
+
+def _check_operands(node, left, right):
+    for val in (left, right):
+        if isinstance(val, numpy.ndarray):
+            if val.dtype.kind not in 'iuf':
+                raise _Decline()
+        elif not _is_number(val) or abs(val) > INT64_LIMIT:
+            raise _Decline()
+    if isinstance(node, (DivisionNode, ModuloNode)) and numpy.any(right == 0):
+        # Division by zero: the scalar path reports it at the right iteration
+        raise _Decline()
+    left_int, right_int = _is_int(left), _is_int(right)
+    if left_int != right_int or isinstance(node, DivisionNode):
+        _check_exact_float(left)
+        _check_exact_float(right)
+    elif left_int and isinstance(node, GROWING_OPERATORS):
+        # Python ints never overflow; int64 arrays would wrap around
+        combine = ARRAY_OPERATORS[type(node)]
+        (a, b), (c, d) = _int_bounds(left), _int_bounds(right)
+        results = (combine(a, c), combine(a, d), combine(b, c), combine(b, d))
+        if min(results) < -INT64_LIMIT or max(results) > INT64_LIMIT:
+            raise _Decline()
+
+
+class _ChunkEvaluator:
+    def __init__(self, frame, slot, values):
+        self.frame = frame
+        self.env = {slot: values}
+
+    def value(self, val):
+        if isinstance(val, VarRef):
+            if val.slot in self.env:
+                return self.env[val.slot]
+            value = self.frame[val.slot]
+            if not _is_number(value):
+                raise _Decline()
+            return value
+        if isinstance(val, ComparisonNode):
+            left, right = self.value(val.left), self.value(val.right)
+            if val.operator not in COMPARE_FUNCTIONS:
+                return False
+            _check_operands(val, left, right)
+            return COMPARE_FUNCTIONS[val.operator](left, right)
+        if isinstance(val, ARITHMETIC_NODES):
+            left, right = self.value(val.left), self.value(val.right)
+            _check_operands(val, left, right)
+            return ARRAY_OPERATORS[type(val)](left, right)
+        return val
+
+    def truth(self, condition):
+        if isinstance(condition, bool):
+            return condition
+        value = self.value(condition)
+        if isinstance(value, numpy.ndarray):
+            return value if value.dtype.kind == 'b' else value != 0
+        return bool(value)
+
+
+def _select(mask, truth, expected):
+    if not expected:
+        truth = ~truth if isinstance(truth, numpy.ndarray) else not truth
+    return truth if mask is True else mask & truth
+
+
+def _column(value, positions, count):
+    """Python values of value at the selected iterations (all of them when positions is None)."""
+    if isinstance(value, numpy.ndarray):
+        return (value if positions is None else value[positions]).tolist()
+    if isinstance(value, numpy.generic):
+        value = value.item()
+    return [value] * (count if positions is None else len(positions))
+
+
+def _scalar(value):
+    if isinstance(value, numpy.ndarray):
+        return value[-1].item()
+    return value.item() if isinstance(value, numpy.generic) else value
+
+
+class VectorLoopNode(LoopNode):
+    """A for loop the Vectorizer found independent across iterations; runs as arrays when it can."""
+    __slots__ = ('plan',)
+
+    def __init__(self, loop, plan):
+        super().__init__(loop.varname, loop.start, loop.end, loop.commands)
+        self.line = loop.line
+        self.column = loop.column
+        self.slot = loop.slot
+        self.plan = plan
+
+    def execute(self, frame):
+        if not self.run_vector(frame):
+            super().execute(frame)
+
+    def run_vector(self, frame):
+        """Run the loop with arrays; False means nothing ran and the caller must use the scalar path."""
+        if not _load_numpy():
+            return False
+        try:
+            first, last = (int(_scalar_bound(bound, frame)) for bound in (self.start, self.end))
+        except (TypeError, ValueError, OverflowError):
+            return False
+        if last - first + 1 < MIN_VECTOR_TRIPS or max(abs(first), abs(last)) > EXACT_FLOAT_INT:
+            return False
+        for name in {step[1] for step in self.plan.steps if step[0] == 'emit'}:
+            # The bulk path formats lines itself, so the command must still be the built-in printer
+            if getattr(COMMANDS.get(name), '__wrapped__', None) is not OUTPUT_FORMATS[name]:
+                return False
+        meter = current_meter()
+        cost = loop_cost(self.commands)
+        chunk_start = first
+        while chunk_start <= last:
+            chunk_end = min(chunk_start + CHUNK_SIZE - 1, last)
+            if meter is not None and not meter.affords((chunk_end - chunk_start + 1) * cost):
+                # The step limit falls inside this chunk: stop at the same iteration the scalar loop would
+                if chunk_start == first:
+                    return False
+                self.run_scalar(frame, chunk_start, last)
+                return True
+            try:
+                with numpy.errstate(all='ignore'):
+                    lines, finals = self.run_chunk(frame, chunk_start, chunk_end)
+            except _Decline:
+                if chunk_start == first:
+                    return False
+                self.run_scalar(frame, chunk_start, last)
+                return True
+            if lines:
+                write_lines(lines)
+            frame[self.slot] = chunk_end
+            for slot, value in finals.items():
+                frame[slot] = value
+            if meter is not None:
+                meter.charge((chunk_end - chunk_start + 1) * cost, node_position(self))
+            chunk_start = chunk_end + 1
+        return True
+
+    def run_chunk(self, frame, first, last):
+        count = last - first + 1
+        evaluator = _ChunkEvaluator(frame, self.slot, numpy.arange(first, last + 1, dtype=numpy.int64))
+        rows = []
+        for step in self.plan.steps:
+            if step[0] == 'assign':
+                _, slot, expr = step
+                evaluator.env[slot] = evaluator.value(expr)
+                continue
+            _, name, args, conditions = step
+            mask = True
+            for condition, expected in conditions:
+                mask = _select(mask, evaluator.truth(condition), expected)
+            if isinstance(mask, numpy.ndarray):
+                positions = numpy.flatnonzero(mask)
+                selected = len(positions)
+            else:
+                positions = None
+                selected = count if mask else 0
+            if not selected:
+                continue
+            format_line = OUTPUT_FORMATS[name]
+            columns = [[arg] * selected if isinstance(arg, str) else _column(evaluator.value(arg), positions, count)
+                       for arg in args]
+            lines = list(map(format_line, *columns)) if columns else [format_line()] * selected
+            rows.append((positions, lines))
+        if len(rows) <= 1:
+            lines = rows[0][1] if rows else []
+        else:
+            # Several outputs per iteration: restore the order the scalar loop prints them in
+            by_iteration = [[] for _ in range(count)]
+            for positions, row in rows:
+                for position, line in zip(range(count) if positions is None else positions.tolist(), row):
+                    by_iteration[position].append(line)
+            lines = [line for group in by_iteration for line in group]
+        finals = {slot: _scalar(evaluator.env[slot]) for slot in self.plan.assigned}
+        return lines, finals
+
+    def run_scalar(self, frame, first, last):
+        # Finish the remaining iterations one at a time, like LoopNode.execute
+        meter = current_meter()
+        for i in range(first, last + 1):
+            frame[self.slot] = i
+            for cmd in self.commands:
+                cmd.execute(frame)
+            if meter is not None:
+                meter.charge(loop_cost(self.commands), node_position(self))
+
+
+def _scalar_bound(val, frame):
+    while isinstance(val, list):
+        if len(val) != 1:
+            raise ValueError("Unexpected list value in loop range")
+        val = val[0]
+    if isinstance(val, VarRef):
+        return val.evaluate(frame)
+    return val
+
+
+def can_vectorize(loop):
+    return type(loop) is LoopNode and numpy_installed() and plan_loop(loop) is not None
+
+
+def vectorize(loop):
+    """A VectorLoopNode for loop, or None when NumPy is unavailable or the loop does not qualify."""
+    if type(loop) is not LoopNode or not numpy_installed():
+        return None
+    plan = plan_loop(loop)
+    if plan is None:
+        return None
+    return VectorLoopNode(loop, plan)
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+WarPy40K Bytecode Compiler and Virtual Machine
+Compiles the AST into a linear instruction stream (an opcode array plus an
+operand array) and runs it on a stack-based dispatch loop.
+
+The compiler mirrors the operand rules of each node's execute/evaluate method,
+so a program produces the same output on the VM as on the tree-walker.
+Variables live in the slots of a flat register file, followed by a constant
+pool, so every operand fetch is a list index. Expressions whose operands are
+variables or literals ("leaves") are fused into single superinstructions,
+which keeps the dispatch count per loop iteration low.
+"""
+
+from array import array
+
+from warpy_core import (
+    CommandNode, DeclarationNode, LoopNode, ConditionalNode, ComparisonNode,
+    WhileNode, AssignmentNode, StrFunctionNode, VarRef, UNBOUND, ARITHMETIC_NODES, OPERAND_NODES, PARALLEL_NODES,
+    BINARY_FUNCTIONS, annotate_error, compare_function, coerce_dg, node_position,
+)
+from warpy_budget import current_meter, loop_cost
+from warpy_output import write_line
+from warpy_vector import VectorLoopNode
+
+# Opcodes, ordered by how often they run in loop bodies (the dispatch loop tests them in this order).
+# left/right/operands are register indices: a variable slot or an entry of the constant pool.
+STORE_BINARY_LEAVES = 0   # (func, left, right, slot)  regs[slot] = func(left, right)
+LOAD = 1                  # register                   push the register
+STORE_FAST = 2            # slot                       regs[slot] = pop()
+FOR_NEXT = 3              # (slot, body_pc)            advance the loop iterator on the stack
+BINARY_LEAVES = 4         # (func, left, right)        push func(left, right)
+BINARY_LEFT_LEAF = 5      # (func, left)               top = func(left, top)
+BINARY_RIGHT_LEAF = 6     # (func, right)              top = func(top, right)
+COMPARE_LEAVES_JUMP = 7   # (func, left, right, pc)    jump unless func(left, right)
+COMPARE_JUMP = 8          # (func, right, pc)          jump unless func(pop(), right)
+POP_JUMP_IF_FALSE = 9     # pc
+JUMP = 10                 # pc
+BINARY = 11               # func                       right = pop(); top = func(top, right)
+CALL_LEAVES = 12          # (handler, operands, keep)  call with resolved leaf arguments
+CALL = 13                 # (handler, argc)            call with the argc values on top of the stack
+POP_TOP = 14
+LOAD_CONST = 15           # value                      push the value itself
+FOR_START = 16            # (slot, exit_pc)            turn the range on the stack into an iterator
+STR = 17
+COERCE_DG = 18            # name
+CALL_UNKNOWN = 19         # name
+HALT = 20
+VECTOR_LOOP = 21          # (node, exit_pc)            skip the scalar loop that follows if node ran it with arrays
+RUN_NODE = 22             # node                       run a statement node on the registers (parallel blocks)
+
+OPNAMES = {
+    value: name for name, value in list(globals().items())
+    if name.isupper() and isinstance(value, int)
+}
+
+
+class CodeObject:
+    """Compiled program: one opcode byte per instruction, a parallel operand array and the constant pool.
+
+    positions holds, per instruction, the (line, column) of the node it came from, so errors can be
+    reported against the script without keeping the AST around. loop_costs maps the pc of each
+    loop's back-edge (FOR_NEXT, or the JUMP closing a while) to the steps an iteration costs.
+    """
+    __slots__ = ('ops', 'args', 'names', 'consts', 'positions', 'loop_costs')
+
+    def __init__(self, ops, args, names, consts, positions, loop_costs):
+        self.ops = array('B', ops)
+        self.args = tuple(args)
+        self.names = tuple(names)
+        self.consts = tuple(consts)
+        self.positions = tuple(positions)
+        self.loop_costs = dict(loop_costs)
+
+    def disassemble(self):
+        lines = []
+        for pc, (op, arg) in enumerate(zip(self.ops, self.args)):
+            if isinstance(arg, tuple):
+                arg = tuple(getattr(part, '__name__', part) for part in arg)
+            elif callable(arg):
+                arg = arg.__name__
+            lines.append(f"{pc:5d} {OPNAMES[op]:<20} {'' if arg is None else repr(arg)}")
+        return "\n".join(lines)
+
+
+class BytecodeCompiler:
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.ops = []
+        self.args = []
+        self.consts = []
+        self.positions = []
+        self.loop_costs = {}
+        self.position = (None, None)  # of the node being compiled
+
+    def register(self, val):
+        """Register index of a leaf operand: its frame slot, or a new constant pool entry."""
+        if isinstance(val, VarRef):
+            return val.slot
+        self.consts.append(val)
+        return len(self.names) + len(self.consts) - 1
+
+    def emit(self, op, arg=None):
+        self.ops.append(op)
+        self.args.append(arg)
+        self.positions.append(self.position)
+        return len(self.ops) - 1
+
+    def patch(self, index, arg):
+        self.args[index] = arg
+
+    def compile_program(self, statements):
+        self.compile_block(statements)
+        self.emit(HALT)
+        return CodeObject(self.ops, self.args, self.names, self.consts, self.positions, self.loop_costs)
+
+    def compile_block(self, statements):
+        for stmt in statements:
+            outer, self.position = self.position, node_position(stmt)
+            self.compile_statement(stmt)
+            self.position = outer
+
+    def compile_statement(self, stmt):
+        if isinstance(stmt, CommandNode):
+            self.compile_call(stmt, keep_result=False)
+        elif isinstance(stmt, DeclarationNode):
+            self.compile_declaration(stmt)
+        elif isinstance(stmt, AssignmentNode):
+            expr = stmt.expr
+            if isinstance(expr, ARITHMETIC_NODES) and self.is_leaf_binary(expr):
+                func = BINARY_FUNCTIONS[type(expr)]
+                if expr.line is not None:
+                    # The fused instruction fails where the operator is
+                    self.position = node_position(expr)
+                self.emit(STORE_BINARY_LEAVES, (func, self.register(expr.left), self.register(expr.right), stmt.slot))
+                return
+            if isinstance(expr, (ARITHMETIC_NODES, ComparisonNode)):
+                self.compile_expression(expr)
+            else:
+                self.emit(LOAD, self.register(expr))
+            self.emit(STORE_FAST, stmt.slot)
+        elif isinstance(stmt, LoopNode):
+            self.compile_loop(stmt)
+        elif isinstance(stmt, WhileNode):
+            self.compile_while(stmt)
+        elif isinstance(stmt, ConditionalNode):
+            self.compile_conditional(stmt)
+        elif isinstance(stmt, PARALLEL_NODES):
+            # Tasks run as AST on the worker pool; only the node itself is an instruction
+            self.emit(RUN_NODE, stmt)
+        else:
+            raise TypeError(f"Cannot compile statement of type {type(stmt).__name__}")
+
+    def compile_declaration(self, stmt):
+        value = stmt.callnode
+        if isinstance(value, CommandNode):
+            self.compile_call(value, keep_result=True)
+            if stmt.typename == "dg":
+                self.emit(COERCE_DG, stmt.varname)
+        elif stmt.typename == "dg" and (isinstance(value, str) or value is None):
+            self.emit(LOAD_CONST, value)
+            self.emit(COERCE_DG, stmt.varname)
+        elif isinstance(value, ARITHMETIC_NODES):
+            self.compile_expression(value)
+        elif isinstance(value, VarRef):
+            self.emit(LOAD, value.slot)
+        else:
+            # Any other value is stored as written
+            self.emit(LOAD_CONST, value)
+        self.emit(STORE_FAST, stmt.slot)
+
+    def compile_call(self, node, keep_result):
+        handler = node.handler
+        if handler is None:
+            self.emit(CALL_UNKNOWN, node.name)
+            if not keep_result:
+                self.emit(POP_TOP)
+            return
+        if not any(isinstance(arg, (ARITHMETIC_NODES, ComparisonNode)) for arg in node.args):
+            self.emit(CALL_LEAVES, (handler, tuple(self.register(arg) for arg in node.args), keep_result))
+            return
+        for arg in node.args:
+            if isinstance(arg, (ARITHMETIC_NODES, ComparisonNode)):
+                self.compile_expression(arg)
+            else:
+                self.emit(LOAD, self.register(arg))
+        self.emit(CALL, (handler, len(node.args)))
+        if not keep_result:
+            self.emit(POP_TOP)
+
+    def compile_loop(self, stmt):
+        vector_jump = self.emit(VECTOR_LOOP) if isinstance(stmt, VectorLoopNode) else None
+        for bound in (stmt.start, stmt.end):
+            while isinstance(bound, list) and len(bound) == 1:
+                bound = bound[0]
+            if isinstance(bound, list):
+                raise ValueError("Unexpected list value in loop range")
+            self.emit(LOAD, self.register(bound))
+        start = self.emit(FOR_START)
+        body = len(self.ops)
+        self.compile_block(stmt.commands)
+        self.loop_costs[self.emit(FOR_NEXT, (stmt.slot, body))] = loop_cost(stmt.commands)
+        self.patch(start, (stmt.slot, len(self.ops)))
+        if vector_jump is not None:
+            self.patch(vector_jump, (stmt, len(self.ops)))
+
+    def compile_while(self, stmt):
+        loop_top = len(self.ops)
+        exit_jump = self.compile_condition_jump(stmt.condition)
+        self.compile_block(stmt.commands)
+        self.loop_costs[self.emit(JUMP, loop_top)] = loop_cost(stmt.commands)
+        self.patch_jump(exit_jump, len(self.ops))
+
+    def compile_conditional(self, stmt):
+        else_jump = self.compile_condition_jump(stmt.condition)
+        self.compile_block(stmt.then_commands)
+        if stmt.else_commands:
+            end_jump = self.emit(JUMP)
+            self.patch_jump(else_jump, len(self.ops))
+            self.compile_block(stmt.else_commands)
+            self.patch(end_jump, len(self.ops))
+        else:
+            self.patch_jump(else_jump, len(self.ops))
+
+    def compile_condition_jump(self, condition):
+        """Emit a conditional jump taken when the condition is false; returns it for patching."""
+        # Comparisons and variables are evaluated; any other condition is judged by its own truthiness
+        if isinstance(condition, VarRef):
+            self.emit(LOAD, condition.slot)
+            return self.emit(POP_JUMP_IF_FALSE)
+        if not isinstance(condition, ComparisonNode):
+            self.emit(LOAD_CONST, bool(condition))
+            return self.emit(POP_JUMP_IF_FALSE)
+        compare = compare_function(condition.operator)
+        left, right = condition.left, condition.right
+        if isinstance(right, ARITHMETIC_NODES):
+            self.compile_expression(condition)
+            return self.emit(POP_JUMP_IF_FALSE)
+        if isinstance(left, ARITHMETIC_NODES):
+            self.compile_expression(left)
+            return self.emit(COMPARE_JUMP, (compare, self.register(right)))
+        return self.emit(COMPARE_LEAVES_JUMP, (compare, self.register(left), self.register(right)))
+
+    def patch_jump(self, index, target):
+        arg = self.args[index]
+        self.patch(index, target if arg is None else arg + (target,))
+
+    def compile_expression(self, node):
+        outer = self.position
+        if node.line is not None:
+            self.position = node_position(node)
+        self.compile_expression_ops(node)
+        self.position = outer
+
+    def compile_expression_ops(self, node):
+        if isinstance(node, ComparisonNode):
+            for operand in (node.left, node.right):
+                if isinstance(operand, ARITHMETIC_NODES):
+                    self.compile_expression(operand)
+                else:
+                    self.emit(LOAD, self.register(operand))
+            self.emit(BINARY, compare_function(node.operator))
+        elif isinstance(node, StrFunctionNode):
+            self.compile_operand(node.expr)
+            self.emit(STR)
+        else:
+            func = BINARY_FUNCTIONS[type(node)]
+            left_is_leaf = not isinstance(node.left, OPERAND_NODES)
+            right_is_leaf = not isinstance(node.right, OPERAND_NODES)
+            if left_is_leaf and right_is_leaf:
+                self.emit(BINARY_LEAVES, (func, self.register(node.left), self.register(node.right)))
+            elif left_is_leaf:
+                self.compile_expression(node.right)
+                self.emit(BINARY_LEFT_LEAF, (func, self.register(node.left)))
+            elif right_is_leaf:
+                self.compile_expression(node.left)
+                self.emit(BINARY_RIGHT_LEAF, (func, self.register(node.right)))
+            else:
+                self.compile_expression(node.left)
+                self.compile_expression(node.right)
+                self.emit(BINARY, func)
+
+    def compile_operand(self, val):
+        if isinstance(val, OPERAND_NODES):
+            self.compile_expression(val)
+        else:
+            self.emit(LOAD, self.register(val))
+
+    def is_leaf_binary(self, node):
+        return not isinstance(node.left, OPERAND_NODES) and not isinstance(node.right, OPERAND_NODES)
+
+
+def compile_program(statements):
+    return BytecodeCompiler(statements.names).compile_program(statements)
+
+
+_LOOP_DONE = object()
+
+
+def run_code(code, frame, script_name='<string>'):
+    # The frame's values list doubles as the register file: the constant pool is
+    # appended after the variable slots for the duration of the run. A variable
+    # slot still holding UNBOUND reads as the variable's name, like VarRef.evaluate.
+    # Dispatch runs over (opcode, operand) pairs: one index and one unpack per instruction.
+    names = code.names
+    positions = code.positions
+    loop_costs = code.loop_costs
+    meter = current_meter()
+    regs = frame.values
+    regs.extend(code.consts)
+    code = list(zip(code.ops, code.args))
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    pc = 0
+    try:
+        while True:
+            op, arg = code[pc]
+            pc += 1
+            if op == STORE_BINARY_LEAVES:
+                func, left, right, slot = arg
+                lval = regs[left]
+                rval = regs[right]
+                if lval is UNBOUND:
+                    lval = names[left]
+                if rval is UNBOUND:
+                    rval = names[right]
+                regs[slot] = func(lval, rval)
+            elif op == LOAD:
+                value = regs[arg]
+                push(names[arg] if value is UNBOUND else value)
+            elif op == STORE_FAST:
+                regs[arg] = pop()
+            elif op == FOR_NEXT:
+                if meter is not None:
+                    meter.remaining -= loop_costs[pc - 1]
+                    if meter.remaining <= 0:
+                        meter.check(positions[pc - 1])
+                value = next(stack[-1], _LOOP_DONE)
+                if value is _LOOP_DONE:
+                    pop()
+                else:
+                    regs[arg[0]] = value
+                    pc = arg[1]
+            elif op == BINARY_LEAVES:
+                func, left, right = arg
+                lval = regs[left]
+                rval = regs[right]
+                if lval is UNBOUND:
+                    lval = names[left]
+                if rval is UNBOUND:
+                    rval = names[right]
+                push(func(lval, rval))
+            elif op == BINARY_LEFT_LEAF:
+                func, left = arg
+                lval = regs[left]
+                if lval is UNBOUND:
+                    lval = names[left]
+                stack[-1] = func(lval, stack[-1])
+            elif op == BINARY_RIGHT_LEAF:
+                func, right = arg
+                rval = regs[right]
+                if rval is UNBOUND:
+                    rval = names[right]
+                stack[-1] = func(stack[-1], rval)
+            elif op == COMPARE_LEAVES_JUMP:
+                func, left, right, target = arg
+                lval = regs[left]
+                rval = regs[right]
+                if lval is UNBOUND:
+                    lval = names[left]
+                if rval is UNBOUND:
+                    rval = names[right]
+                if not func(lval, rval):
+                    pc = target
+            elif op == COMPARE_JUMP:
+                func, right, target = arg
+                rval = regs[right]
+                if rval is UNBOUND:
+                    rval = names[right]
+                if not func(pop(), rval):
+                    pc = target
+            elif op == POP_JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                if meter is not None and arg < pc:
+                    meter.remaining -= loop_costs[pc - 1]
+                    if meter.remaining <= 0:
+                        meter.check(positions[pc - 1])
+                pc = arg
+            elif op == BINARY:
+                right = pop()
+                stack[-1] = arg(stack[-1], right)
+            elif op == CALL_LEAVES:
+                handler, operands, keep_result = arg
+                if operands:
+                    result = handler(*[names[i] if regs[i] is UNBOUND else regs[i] for i in operands])
+                else:
+                    result = handler()
+                if keep_result:
+                    push(result)
+            elif op == CALL:
+                handler, argc = arg
+                call_args = stack[-argc:]
+                del stack[-argc:]
+                push(handler(*call_args))
+            elif op == POP_TOP:
+                pop()
+            elif op == LOAD_CONST:
+                push(arg)
+            elif op == FOR_START:
+                stop = pop()
+                start = pop()
+                iterator = iter(range(int(start), int(stop) + 1))
+                value = next(iterator, _LOOP_DONE)
+                if value is _LOOP_DONE:
+                    pc = arg[1]
+                else:
+                    push(iterator)
+                    regs[arg[0]] = value
+            elif op == STR:
+                stack[-1] = str(stack[-1])
+            elif op == COERCE_DG:
+                stack[-1] = coerce_dg(stack[-1], arg)
+            elif op == CALL_UNKNOWN:
+                write_line(f"Unknown command: {arg}")
+                push(None)
+            elif op == VECTOR_LOOP:
+                if arg[0].run_vector(regs):
+                    pc = arg[1]
+            elif op == RUN_NODE:
+                arg.execute(regs)
+            elif op == HALT:
+                return frame
+            else:
+                raise RuntimeError(f"Unknown opcode {op}")
+    except Exception as exc:
+        annotate_error(exc, script_name, *positions[pc - 1])
+        raise
+    finally:
+        del regs[len(names):]
+
+
+def run_program(statements, frame, script_name='<string>'):
+    """Run resolved statements against a Frame and return it."""
+    return run_code(compile_program(statements), frame, script_name)